@@ -1,6 +1,10 @@
 from __future__ import annotations
+import os
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from app.routes.admin import ADMIN_TOKEN_ENV, router as admin_router
+from app.routes.bulk_scoring import router as bulk_scoring_router
 from app.routes.predictions import router as predictions_router
 from app.services.fusion_inference_service import FusionInferenceService
 
@@ -8,11 +12,45 @@ from app.services.fusion_inference_service import FusionInferenceService
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Load artifacts once at startup
-    fusion_service = FusionInferenceService(artifacts_root="../models_artifacts/fusion_pph_proxy")
+    fusion_service = FusionInferenceService(
+        artifacts_root="../models_artifacts/fusion_pph_proxy",
+        executor_kind=os.getenv("FUSION_EXECUTOR", "thread"),
+        max_workers=int(os.getenv("FUSION_WORKERS", "0")) or None,
+        max_queue=int(os.getenv("FUSION_MAX_QUEUE", "32")),
+        nthread=int(os.getenv("FUSION_NTHREAD", "1")),
+        micro_batch_window_ms=float(os.getenv("FUSION_MICROBATCH_WINDOW_MS", "0")),
+        micro_batch_max_size=int(os.getenv("FUSION_MICROBATCH_MAX_SIZE", "32")),
+        model_backend=os.getenv("FUSION_MODEL_BACKEND", "auto"),
+        shadow_log_path=os.getenv("FUSION_SHADOW_LOG", "../reports/fusion_shadow_scores.jsonl"),
+        cache_max_entries=int(os.getenv("FUSION_CACHE_MAX_ENTRIES", "4096")),
+        cache_ttl_s=float(os.getenv("FUSION_CACHE_TTL_S", "600")),
+        shap_top_k=int(os.getenv("FUSION_SHAP_TOP_K", "5")),
+        shap_budget_ms=float(os.getenv("FUSION_SHAP_BUDGET_MS", "50")),
+    )
     fusion_service.load()
+
+    # Optional canary / shadow versions (folder names under the artifacts root)
+    canary_version = os.getenv("FUSION_CANARY_VERSION")
+    if canary_version:
+        fusion_service.load_canary(
+            os.path.join(fusion_service.artifacts_root, canary_version),
+            percent=float(os.getenv("FUSION_CANARY_PERCENT", "5")),
+        )
+    shadow_version = os.getenv("FUSION_SHADOW_VERSION")
+    if shadow_version:
+        fusion_service.load_shadow(os.path.join(fusion_service.artifacts_root, shadow_version))
     app.state.fusion_service = fusion_service
+
+    # Optional: pick up newly promoted versions without restarting
+    watch_interval_s = float(os.getenv("FUSION_WATCH_INTERVAL_S", "0"))
+    watcher = asyncio.create_task(fusion_service.watch_for_new_versions(watch_interval_s)) if watch_interval_s > 0 else None
+
     yield
 
+    if watcher is not None:
+        watcher.cancel()
+    fusion_service.shutdown()
+
 
 app = FastAPI(
     title="PPH Fusion Proxy API",
@@ -21,6 +59,10 @@ app = FastAPI(
 )
 
 app.include_router(predictions_router)
+app.include_router(bulk_scoring_router)
+# Reload / canary / shadow endpoints exist only with an admin token configured
+if os.getenv(ADMIN_TOKEN_ENV):
+    app.include_router(admin_router)
 
 
 @app.get("/health")
@@ -40,4 +82,9 @@ def model_info():
         "threshold": art.threshold,
         "label_type": art.label_type,
         "n_features_expected": len(art.feature_names),
+        "model_backend": art.backend,
+        "prediction_cache": svc.cache_stats(),
+        "shap_explainer": svc.explainer.stats(),
+        "executor": svc.executor.stats(),
+        "micro_batcher": svc.micro_batcher.stats() if svc.micro_batcher is not None else None,
     }
\ No newline at end of file
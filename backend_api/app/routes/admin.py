@@ -0,0 +1,116 @@
+from __future__ import annotations
+import asyncio
+import hmac
+import os
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+
+# Shared secret for the admin endpoints; main.py mounts the router only when set
+ADMIN_TOKEN_ENV = "FUSION_ADMIN_TOKEN"
+
+
+def require_admin_token(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    expected = os.getenv(ADMIN_TOKEN_ENV)
+    if not expected:
+        raise HTTPException(status_code=403, detail=f"Admin API disabled ({ADMIN_TOKEN_ENV} is not set)")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), expected.encode()):
+        raise HTTPException(status_code=401, detail="Missing or invalid X-Admin-Token header")
+
+
+router = APIRouter(prefix="/api/v1/admin", tags=["admin"], dependencies=[Depends(require_admin_token)])
+
+
+def _version_dir(svc, version: Optional[str]) -> Optional[str]:
+    if version is None:
+        return None
+    # Only folder names listed directly under the artifacts root are accepted;
+    # ".", ".." and anything with a path separator never name a version
+    if version in (".", "..") or "/" in version or "\\" in version:
+        raise HTTPException(status_code=422, detail=f"Invalid fusion model version: {version}")
+    try:
+        known = os.listdir(svc.artifacts_root)
+    except OSError:
+        known = []
+    version_dir = os.path.join(svc.artifacts_root, version)
+    if version not in known or not os.path.isdir(version_dir):
+        raise HTTPException(status_code=404, detail=f"Unknown fusion model version: {version}")
+    return version_dir
+
+
+def _version_name(version_dir: Optional[str]) -> Optional[str]:
+    return os.path.basename(version_dir.rstrip("\\/")) if version_dir else None
+
+
+@router.post("/reload")
+async def reload_fusion_model(request: Request, version: Optional[str] = None):
+    """
+    Loads a fusion artifact version (default: newest) in the background,
+    warms it and swaps it in without dropping in-flight requests.
+    `version` is a folder name under the artifacts root, e.g. 20260222_201433.
+    """
+    svc = request.app.state.fusion_service
+    version_dir = _version_dir(svc, version)
+
+    previous = svc.artifacts.version_dir if svc.artifacts is not None else None
+    try:
+        art = await asyncio.to_thread(svc.reload, version_dir)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"Fusion artifacts not found: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Fusion reload error: {str(e)}")
+
+    return {
+        "status": "ok",
+        "previous_version": _version_name(previous),
+        "fusion_model_version": _version_name(art.version_dir),
+        "model_backend": art.backend,
+    }
+
+
+@router.get("/registry")
+def registry_status(request: Request):
+    svc = request.app.state.fusion_service
+    champion = svc.artifacts.version_dir if svc.artifacts is not None else None
+    return {"champion_version": _version_name(champion), **svc.registry.stats()}
+
+
+@router.post("/canary")
+async def set_canary(
+    request: Request,
+    version: str,
+    weight: float = Query(..., ge=0.0, le=1.0, allow_inf_nan=False),
+):
+    """Serves a `weight` share (0-1) of prediction calls from `version`."""
+    svc = request.app.state.fusion_service
+    version_dir = _version_dir(svc, version)
+    try:
+        await asyncio.to_thread(svc.load_canary, version_dir, weight * 100.0)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Canary load error: {str(e)}")
+    return {"status": "ok", **svc.registry.stats()}
+
+
+@router.delete("/canary")
+def clear_canary(request: Request):
+    svc = request.app.state.fusion_service
+    svc.load_canary(None)
+    return {"status": "ok", **svc.registry.stats()}
+
+
+@router.post("/shadow")
+async def set_shadow(request: Request, version: str):
+    """Scores every call with `version` in the background and logs the result."""
+    svc = request.app.state.fusion_service
+    version_dir = _version_dir(svc, version)
+    try:
+        await asyncio.to_thread(svc.load_shadow, version_dir)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Shadow load error: {str(e)}")
+    return {"status": "ok", **svc.registry.stats()}
+
+
+@router.delete("/shadow")
+def clear_shadow(request: Request):
+    svc = request.app.state.fusion_service
+    svc.load_shadow(None)
+    return {"status": "ok", **svc.registry.stats()}
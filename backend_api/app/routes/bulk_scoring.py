@@ -0,0 +1,253 @@
+from __future__ import annotations
+import asyncio
+import csv
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from app.schemas.fusion_prediction import MAX_BATCH_ITEMS, FusionPredictionRequest
+from app.services.inference_executor import InferenceQueueFullError
+
+router = APIRouter(prefix="/api/v1/predictions", tags=["predictions"])
+
+# Bulk jobs back off instead of failing when interactive traffic fills the
+# executor, up to a deadline per chunk
+_BUSY_BACKOFF_START_S = 0.05
+_BUSY_BACKOFF_MAX_S = 1.0
+_BUSY_DEADLINE_S = 30.0
+
+# One record per line; a full raw waveform as JSON floats is well under this
+MAX_LINE_BYTES = 4 * 1024 * 1024
+
+# (line number, parsed request or None, error message or None)
+Record = Tuple[int, Optional[FusionPredictionRequest], Optional[str]]
+
+
+class LineTooLongError(ValueError):
+    """Raised when an upload line exceeds MAX_LINE_BYTES (the rest of the body is not read)."""
+
+    def __init__(self, line_no: int):
+        super().__init__(f"Line {line_no} is longer than {MAX_LINE_BYTES} bytes")
+        self.line_no = line_no
+
+
+async def _iter_lines(request: Request) -> AsyncIterator[bytes]:
+    buf = b""
+    line_no = 0
+    async for chunk in request.stream():
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if len(line) > MAX_LINE_BYTES:
+                raise LineTooLongError(line_no)
+            yield line
+        if len(buf) > MAX_LINE_BYTES:
+            raise LineTooLongError(line_no + 1)
+    if buf:
+        yield buf
+
+
+async def _ndjson_records(request: Request) -> AsyncIterator[Record]:
+    line_no = 0
+    async for line in _iter_lines(request):
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            yield line_no, FusionPredictionRequest.model_validate_json(line), None
+        except ValidationError as e:
+            yield line_no, None, f"Invalid record: {e.errors(include_url=False)}"
+
+
+def _ends_in_quotes(text: str, in_quotes: bool) -> bool:
+    # Quote state after one physical line, as csv.reader sees it: a quote only
+    # opens a field at its start, and "" inside a quoted field is an escape
+    i = 0
+    while True:
+        j = text.find('"', i)
+        if j < 0:
+            return in_quotes
+        if in_quotes:
+            if text.startswith('"', j + 1):
+                i = j + 2
+                continue
+            in_quotes = False
+        elif j == 0 or text[j - 1] == ",":
+            in_quotes = True
+        i = j + 1
+
+
+async def _csv_rows(request: Request) -> AsyncIterator[Tuple[int, Optional[List[str]], Optional[str]]]:
+    """
+    (first line number, row or None, error or None) per CSV record. A quoted
+    field may span physical lines: lines are joined until the quote closes,
+    then parsed as one record.
+    """
+    pending: List[str] = []
+    start = 0
+    size = 0
+    line_no = 0
+    async for line in _iter_lines(request):
+        line_no += 1
+        text = line.decode("utf-8", errors="replace").rstrip("\r")
+        if not pending:
+            if not text.strip():
+                continue
+            start = line_no
+        pending.append(text)
+        size += len(line) + 1
+        if _ends_in_quotes(text, len(pending) > 1):
+            if size > MAX_LINE_BYTES:
+                raise LineTooLongError(start)
+            continue
+        record = "\n".join(pending)
+        pending, size = [], 0
+        try:
+            row = next(csv.reader([record]))
+        except csv.Error as e:
+            yield start, None, f"Invalid CSV record: {e}"
+            continue
+        yield start, row, None
+    if pending:
+        yield start, None, "Invalid CSV record: unterminated quoted field at end of upload"
+
+
+async def _csv_records(request: Request) -> AsyncIterator[Record]:
+    header: Optional[List[str]] = None
+    async for line_no, row, error in _csv_rows(request):
+        if error is not None or row is None:
+            if header is None:
+                # Nothing can be scored without the column names
+                raise HTTPException(status_code=422, detail=f"CSV header: {error}")
+            yield line_no, None, error
+            continue
+        if header is None:
+            header = row
+            continue
+
+        features: Dict[str, Any] = {}
+        ids: Dict[str, Optional[str]] = {"patient_local_id": None, "visit_id": None}
+        for name, value in zip(header, row):
+            if name in ids:
+                ids[name] = value or None
+            elif value != "":
+                features[name] = value
+        # Cells stay strings: FeatureLayout parses them and reports the
+        # non-numeric ones in the result warnings, as for JSON requests
+        yield line_no, FusionPredictionRequest.model_construct(features=features, **ids), None
+
+
+async def _predict_with_backoff(
+    svc,
+    feature_maps: List[Dict[str, Any]],
+    waveforms: List[Any],
+    as_codes: bool = False,
+) -> List[Dict[str, Any]]:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + _BUSY_DEADLINE_S
+    delay = _BUSY_BACKOFF_START_S
+    while True:
+        try:
+            return await svc.predict(feature_maps, waveforms=waveforms, as_codes=as_codes)
+        except InferenceQueueFullError:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise InferenceQueueFullError(f"Inference queue stayed full for {_BUSY_DEADLINE_S:.0f}s")
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, _BUSY_BACKOFF_MAX_S)
+
+
+async def _score_chunk(svc, chunk: List[Record], compact: bool) -> AsyncIterator[bytes]:
+    ok: List[Tuple[int, FusionPredictionRequest, Any]] = []
+    for line_no, item, error in chunk:
+        if item is None:
+            yield (json.dumps({"line": line_no, "status": "error", "detail": error}) + "\n").encode("utf-8")
+            continue
+        waveform = None
+        if item.waveform is not None:
+            try:
+                waveform = svc.decode_waveform(item.waveform.data, dtype=item.waveform.dtype, scale=item.waveform.scale)
+            except ValueError as e:
+                yield (json.dumps({"line": line_no, "status": "error", "detail": f"Invalid waveform payload: {str(e)}"}) + "\n").encode("utf-8")
+                continue
+        ok.append((line_no, item, waveform))
+
+    if not ok:
+        return
+
+    try:
+        results = await _predict_with_backoff(svc, [o[1].features for o in ok], [o[2] for o in ok], as_codes=compact)
+    except Exception as e:
+        for line_no, _, _ in ok:
+            yield (json.dumps({"line": line_no, "status": "error", "detail": f"Fusion inference error: {str(e)}"}) + "\n").encode("utf-8")
+        return
+
+    for (line_no, item, _), result in zip(ok, results):
+        out = {"line": line_no, "patient_local_id": item.patient_local_id, "visit_id": item.visit_id, **result}
+        yield (json.dumps(out) + "\n").encode("utf-8")
+
+
+async def _score_stream(
+    svc,
+    first: Optional[Record],
+    records: AsyncIterator[Record],
+    chunk_size: int,
+    compact: bool,
+) -> AsyncIterator[bytes]:
+    # Pull-based: the next chunk of the upload is only read once the client has
+    # consumed the previous results, so memory stays at one chunk.
+    chunk: List[Record] = [] if first is None else [first]
+    too_long: Optional[LineTooLongError] = None
+    try:
+        async for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                async for out in _score_chunk(svc, chunk, compact):
+                    yield out
+                chunk = []
+    except LineTooLongError as e:
+        too_long = e
+    if chunk:
+        async for out in _score_chunk(svc, chunk, compact):
+            yield out
+    if too_long is not None:
+        # The 200 status is already sent: report the 413 in-stream and stop
+        yield (json.dumps({"line": too_long.line_no, "status": "error", "status_code": 413, "detail": str(too_long)}) + "\n").encode("utf-8")
+
+
+@router.post("/pph-proxy:stream")
+async def stream_pph_proxy(
+    request: Request,
+    chunk_size: int = Query(default=256, ge=1, le=MAX_BATCH_ITEMS),
+    response_format: str = Query(default="full", alias="format", pattern="^(full|compact)$"),
+):
+    """
+    Bulk re-scoring. Body is NDJSON (one FusionPredictionRequest per line) or,
+    with Content-Type text/csv, a CSV whose header holds feature names (plus
+    optional patient_local_id / visit_id); quoted CSV fields may span lines.
+    Records are scored in fixed-size chunks and streamed back as NDJSON with
+    the input line number they start on.
+    """
+    svc = request.app.state.fusion_service
+
+    if not svc.is_loaded():
+        raise HTTPException(status_code=503, detail="Fusion model is not loaded")
+
+    content_type = request.headers.get("content-type", "")
+    records = _csv_records(request) if content_type.startswith("text/csv") else _ndjson_records(request)
+
+    # Read up to the first record before responding, so an over-long first
+    # line still gets a real 413
+    try:
+        first = await anext(records)
+    except StopAsyncIteration:
+        first = None
+    except LineTooLongError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    return StreamingResponse(
+        _score_stream(svc, first, records, chunk_size, compact=response_format == "compact"),
+        media_type="application/x-ndjson",
+    )
@@ -1,25 +1,122 @@
 from __future__ import annotations
-from fastapi import APIRouter, HTTPException, Request
+from typing import Optional
+import numpy as np
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
 from app.schemas.fusion_prediction import (
+    FusionBatchPredictionRequest,
+    FusionBatchPredictionResponse,
     FusionPredictionRequest,
     FusionPredictionResponse,
 )
+from app.services.explanation_engine import TEMPLATE_VERSION, TEMPLATES
+from app.services.inference_executor import InferenceQueueFullError
 
 router = APIRouter(prefix="/api/v1/predictions", tags=["predictions"])
 
+# ?format=compact returns template codes + template_version instead of sentences
+FORMAT_QUERY = Query(default="full", alias="format", pattern="^(full|compact)$")
+# ?explain=shap adds TreeSHAP top-k / per-group contributions (best effort under load)
+EXPLAIN_QUERY = Query(default="rules", pattern="^(rules|shap)$")
+
+
+def _decode_waveform(svc, item: FusionPredictionRequest) -> Optional[np.ndarray]:
+    if item.waveform is None:
+        return None
+    try:
+        return svc.decode_waveform(item.waveform.data, dtype=item.waveform.dtype, scale=item.waveform.scale)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid waveform payload: {str(e)}")
+
+
+def _busy(e: InferenceQueueFullError) -> HTTPException:
+    return HTTPException(status_code=503, detail=f"Fusion inference is busy: {str(e)}", headers={"Retry-After": "1"})
+
+
+@router.get("/templates")
+def explanation_templates():
+    """Template dictionary used to expand codes from ?format=compact responses."""
+    return {"template_version": TEMPLATE_VERSION, "templates": TEMPLATES}
+
 
 @router.post("/pph-proxy", response_model=FusionPredictionResponse)
-def predict_pph_proxy(payload: FusionPredictionRequest, request: Request):
+async def predict_pph_proxy(
+    payload: FusionPredictionRequest,
+    request: Request,
+    response_format: str = FORMAT_QUERY,
+    explain: str = EXPLAIN_QUERY,
+):
     """
     Expects a flat feature map matching the fusion training features.json.
+    The raw PPG samples may instead be sent packed in `waveform`.
+    With ?format=compact, explanations / actions / templated warnings are
+    returned as explanation_codes / action_codes / warning_codes plus
+    template_version (see GET /templates). With ?explain=shap the result also
+    carries `contributions` unless the latency guard fell back to rules
+    (model_info.explain_mode says which).
+    """
+    svc = request.app.state.fusion_service
+
+    if not svc.is_loaded():
+        raise HTTPException(status_code=503, detail="Fusion model is not loaded")
+
+    waveform = _decode_waveform(svc, payload)
+
+    try:
+        result = await svc.predict_one(
+            payload.features, waveform=waveform, explain=explain, as_codes=response_format == "compact"
+        )
+    except InferenceQueueFullError as e:
+        raise _busy(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Fusion inference error: {str(e)}")
+
+    if response_format == "compact":
+        # Skip response-model validation: the compact shape is its own contract
+        return JSONResponse(result)
+    return result
+
+
+@router.post("/pph-proxy:batch", response_model=FusionBatchPredictionResponse)
+async def predict_pph_proxy_batch(
+    payload: FusionBatchPredictionRequest,
+    request: Request,
+    response_format: str = FORMAT_QUERY,
+    explain: str = EXPLAIN_QUERY,
+):
+    """
+    Scores many visits (e.g. a synced ward shift) in one model call.
+    Each item gets its own explanations and warnings.
     """
     svc = request.app.state.fusion_service
 
     if not svc.is_loaded():
         raise HTTPException(status_code=503, detail="Fusion model is not loaded")
 
+    waveforms = [_decode_waveform(svc, item) for item in payload.items]
+
     try:
-        result = svc.predict_from_feature_map(payload.features)
-        return result
+        results = await svc.predict(
+            [item.features for item in payload.items],
+            waveforms=waveforms,
+            explain=explain,
+            as_codes=response_format == "compact",
+        )
+    except InferenceQueueFullError as e:
+        raise _busy(e)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Fusion inference error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Fusion inference error: {str(e)}")
+
+    for item, result in zip(payload.items, results):
+        result["patient_local_id"] = item.patient_local_id
+        result["visit_id"] = item.visit_id
+
+    if response_format == "compact":
+        # Skip response-model validation: the compact shape is its own contract
+        return JSONResponse({
+            "status": "ok",
+            "count": len(results),
+            "template_version": TEMPLATE_VERSION,
+            "results": results,
+        })
+    return {"status": "ok", "count": len(results), "results": results}
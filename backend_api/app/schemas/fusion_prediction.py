@@ -1,7 +1,23 @@
 from __future__ import annotations
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Literal, Optional
 from pydantic import BaseModel, Field
 
+# Upper bound for a single batch call (one ward shift fits comfortably)
+MAX_BATCH_ITEMS = 1000
+
+
+class WaveformPayload(BaseModel):
+    # Raw PPG samples "0".."N-1" packed as one little-endian buffer
+    data: str = Field(
+        ...,
+        description="Base64-encoded little-endian sample buffer."
+    )
+    dtype: Literal["float32", "int16"] = Field(
+        default="float32",
+        description="Sample encoding. int16 samples are multiplied by scale."
+    )
+    scale: float = Field(default=1.0, description="Multiplier applied to decoded samples.")
+
 
 class FusionPredictionRequest(BaseModel):
     patient_local_id: Optional[str] = Field(default=None, examples=["ZW-HRE-001"])
@@ -9,10 +25,16 @@ class FusionPredictionRequest(BaseModel):
 
     # Flat feature map matching fusion training features.json
     features: Dict[str, float] = Field(
-        ...,
+        default_factory=dict,
         description="Flat numeric feature dictionary keyed by fusion feature names."
     )
 
+    # Compact alternative to sending the raw PPG samples as "0".."1999" keys
+    waveform: Optional[WaveformPayload] = Field(
+        default=None,
+        description="Optional packed raw PPG waveform; overrides sample keys in features."
+    )
+
     meta: Optional[Dict[str, Any]] = Field(
         default=None,
         description="Optional metadata for tracing; ignored by the model."
@@ -45,4 +67,27 @@ class FusionPredictionResponse(BaseModel):
     explanations: list[str] = []
     recommended_actions: list[str] = []
     warnings: list[str] = []
+    # Only with ?explain=shap (and when the latency guard allowed it)
+    contributions: Optional[Dict[str, Any]] = None
     model_info: Dict[str, Any]
+
+
+class FusionBatchPredictionRequest(BaseModel):
+    # One entry per visit; scored together in a single model call
+    items: List[FusionPredictionRequest] = Field(
+        ...,
+        min_length=1,
+        max_length=MAX_BATCH_ITEMS,
+        description="Visits to score. Results are returned in the same order."
+    )
+
+
+class FusionBatchPredictionItem(FusionPredictionResponse):
+    patient_local_id: Optional[str] = None
+    visit_id: Optional[str] = None
+
+
+class FusionBatchPredictionResponse(BaseModel):
+    status: str
+    count: int
+    results: list[FusionBatchPredictionItem] = []
@@ -0,0 +1,244 @@
+from __future__ import annotations
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from app.services.explanation_engine import RISK_BANDS, compute_risk_band_batch
+from app.services.fusion_inference_service import FusionInferenceService
+from app.services.waveform_store import WaveformStore
+
+# Columns carried through to the output when present in the input
+ID_COLUMNS = ["row_id", "patient_local_id", "visit_id"]
+
+# Loaded once per worker process by _init_worker
+_WORKER_SERVICE: Optional[FusionInferenceService] = None
+_WORKER_WAVEFORMS: Optional[WaveformStore] = None
+
+
+def _init_worker(version_dir: str, model_backend: str, nthread: int, waveform_store: Optional[str] = None) -> None:
+    global _WORKER_SERVICE, _WORKER_WAVEFORMS
+    svc = FusionInferenceService(
+        artifacts_root=os.path.dirname(version_dir),
+        nthread=nthread,
+        model_backend=model_backend,
+        cache_max_entries=0,
+    )
+    svc.load(version_dir)
+    _WORKER_SERVICE = svc
+    # Every worker maps the same file; pages are shared through the OS cache
+    _WORKER_WAVEFORMS = WaveformStore(waveform_store) if waveform_store else None
+
+
+def _score_chunk(
+    x: np.ndarray,
+    row_ids: Optional[np.ndarray] = None,
+    raw: Optional[np.ndarray] = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    art = _WORKER_SERVICE.artifacts
+    layout = art.layout
+    if _WORKER_WAVEFORMS is not None and row_ids is not None and layout.waveform_input_len:
+        if _WORKER_WAVEFORMS.n_samples != layout.waveform_input_len:
+            raise ValueError(
+                f"Waveform store has {_WORKER_WAVEFORMS.n_samples} samples per row, model expects {layout.waveform_input_len}"
+            )
+        if layout.waveform_len:
+            _WORKER_WAVEFORMS.take(row_ids, out=x[:, layout.waveform_start:layout.waveform_start + layout.waveform_len])
+        else:
+            raw = _WORKER_WAVEFORMS.take(row_ids)
+    # Raw samples for a model trained on waveform principal components
+    if raw is not None:
+        layout.fill_waveform_block(x, raw)
+    return _WORKER_SERVICE._score_matrix(art, x)
+
+
+def align_chunk(chunk: pd.DataFrame, feature_names: List[str]) -> np.ndarray:
+    """
+    Aligns a raw chunk to features.json order in one reindex.
+    Missing / non-numeric / non-finite values become 0.0, as in the API.
+    """
+    X_df = chunk.reindex(columns=feature_names)
+    obj_cols = [c for c in X_df.columns if not pd.api.types.is_numeric_dtype(X_df[c])]
+    if obj_cols:
+        X_df[obj_cols] = X_df[obj_cols].apply(pd.to_numeric, errors="coerce")
+    X = X_df.to_numpy(dtype=np.float32, na_value=np.nan)
+    return np.nan_to_num(X, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def iter_input_chunks(path: str, chunk_size: int, columns: List[str]):
+    """
+    CSV or Parquet input in chunks. Parquet reads only the feature / ID
+    columns the model needs.
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        pf = pq.ParquetFile(path)
+        present = set(pf.schema_arrow.names)
+        for batch in pf.iter_batches(batch_size=chunk_size, columns=[c for c in columns if c in present]):
+            yield batch.to_pandas()
+        return
+    yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def _part_path(parts_dir: str, idx: int, fmt: str) -> str:
+    return os.path.join(parts_dir, f"part-{idx:05d}.{fmt}")
+
+
+def _write_part(df: pd.DataFrame, path: str, fmt: str) -> None:
+    tmp = path + ".tmp"
+    if fmt == "parquet":
+        df.to_parquet(tmp, index=False)
+    else:
+        df.to_csv(tmp, index=False)
+    # Atomic rename: a part file either exists complete or not at all (resume-safe)
+    os.replace(tmp, path)
+
+
+def _merge_parts(parts: List[str], output: str, fmt: str) -> None:
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        writer = None
+        try:
+            for p in parts:
+                table = pq.read_table(p)
+                if writer is None:
+                    writer = pq.ParquetWriter(output, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+        return
+
+    with open(output, "w", encoding="utf-8", newline="") as out:
+        for i, p in enumerate(parts):
+            with open(p, "r", encoding="utf-8") as f:
+                header = f.readline()
+                if i == 0:
+                    out.write(header)
+                for line in f:
+                    out.write(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline bulk scoring of a fusion master table with a fusion_pph_proxy version.")
+    parser.add_argument("--input", default="../data/processed/fusion_master_with_embeddings.csv", help="Input .csv or .parquet")
+    parser.add_argument("--output", default="../data/processed/fusion_master_scored.csv", help="Output .csv or .parquet")
+    parser.add_argument("--artifacts-root", default="../models_artifacts/fusion_pph_proxy")
+    parser.add_argument("--version", default=None, help="Version folder under artifacts root (default: newest).")
+    parser.add_argument("--model-backend", choices=["auto", "native", "numpy", "sklearn"], default="auto")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=max((os.cpu_count() or 1) // 2, 1))
+    parser.add_argument("--nthread", type=int, default=1, help="Model threads per worker process.")
+    parser.add_argument("--resume", action="store_true", help="Skip chunks whose part file already exists.")
+    parser.add_argument("--waveform-store", default=None, help="Waveform store directory; raw PPG samples are read from it by row_id.")
+    args = parser.parse_args()
+
+    if args.version:
+        version_dir = os.path.join(args.artifacts_root, args.version)
+    else:
+        versions = sorted(d for d in glob.glob(os.path.join(args.artifacts_root, "*")) if os.path.isdir(d))
+        version_dir = versions[-1] if versions else None
+    if version_dir is None or not os.path.isdir(version_dir):
+        raise FileNotFoundError(f"No artifact version found in: {args.artifacts_root}")
+    version = os.path.basename(version_dir.rstrip("\\/"))
+
+    # Feature list + threshold only; the model itself is loaded in the workers
+    with open(os.path.join(version_dir, "features.json"), "r", encoding="utf-8") as f:
+        features_obj = json.load(f)
+    feature_names = features_obj.get("features", []) if isinstance(features_obj, dict) else features_obj
+    waveform_pca = features_obj.get("waveform_pca") if isinstance(features_obj, dict) else None
+    # PCA models: raw "0".."N-1" columns are read and projected in the workers
+    raw_cols = [str(i) for i in range(waveform_pca["n_samples"])] if waveform_pca and not args.waveform_store else []
+    with open(os.path.join(version_dir, "threshold.json"), "r", encoding="utf-8") as f:
+        threshold = float(json.load(f).get("threshold", 0.5))
+
+    fmt = "parquet" if args.output.endswith(".parquet") else "csv"
+    parts_dir = args.output + ".parts"
+    os.makedirs(parts_dir, exist_ok=True)
+
+    manifest_path = os.path.join(parts_dir, "manifest.json")
+    manifest = {"input": os.path.abspath(args.input), "version": version, "chunk_size": args.chunk_size}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        if args.resume and previous != manifest:
+            raise ValueError(f"Cannot resume: {parts_dir} was produced with {previous}, not {manifest}")
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"Scoring {args.input} with {version} ({len(feature_names)} features), "
+          f"{args.workers} workers x {args.nthread} threads, chunks of {args.chunk_size}")
+
+    t0 = time.perf_counter()
+    n_rows = 0
+    n_skipped = 0
+    parts: List[str] = []
+    pending: Dict[int, tuple] = {}
+    max_pending = args.workers * 2
+
+    def _finish(idx: int) -> None:
+        nonlocal n_rows
+        fut, ids = pending.pop(idx)
+        base_probs, cal_probs = fut.result()
+        out = ids.copy()
+        out["pph_proxy_probability"] = cal_probs
+        out["pph_proxy_label"] = (cal_probs >= threshold).astype(int)
+        out["risk_band"] = np.asarray(RISK_BANDS, dtype=object)[compute_risk_band_batch(cal_probs, threshold)]
+        out["base_model_probability"] = base_probs
+        out["fusion_model_version"] = version
+        _write_part(out, _part_path(parts_dir, idx, fmt), fmt)
+        n_rows += len(out)
+
+    # Spawned workers start from this environment, so numpy / xgboost size
+    # their native pools to nthread on import (this module imports numpy, so
+    # setting the variables in _init_worker would come too late). The parent
+    # has already started its own pools and is unaffected.
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(args.nthread)
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(version_dir, args.model_backend, args.nthread, args.waveform_store),
+    ) as pool:
+        chunks = iter_input_chunks(args.input, args.chunk_size, ID_COLUMNS + list(feature_names) + raw_cols)
+        for idx, chunk in enumerate(chunks):
+            path = _part_path(parts_dir, idx, fmt)
+            parts.append(path)
+            if args.resume and os.path.exists(path):
+                n_skipped += 1
+                continue
+
+            ids = chunk[[c for c in ID_COLUMNS if c in chunk.columns]].reset_index(drop=True)
+            row_ids = None
+            if args.waveform_store:
+                if "row_id" not in chunk.columns:
+                    raise ValueError("--waveform-store needs a row_id column in the input")
+                row_ids = chunk["row_id"].to_numpy()
+            raw = align_chunk(chunk, raw_cols) if raw_cols and raw_cols[0] in chunk.columns else None
+            pending[idx] = (pool.submit(_score_chunk, align_chunk(chunk, feature_names), row_ids, raw), ids)
+
+            # Bounded in-flight chunks keep memory flat; results are written in order
+            while len(pending) >= max_pending:
+                _finish(min(pending))
+
+        while pending:
+            _finish(min(pending))
+
+    _merge_parts(parts, args.output, fmt)
+
+    elapsed = time.perf_counter() - t0
+    print(f"Scored {n_rows} rows in {elapsed:.2f}s ({n_rows / max(elapsed, 1e-9):.1f} rows/s); "
+          f"{n_skipped} chunks resumed from existing parts")
+    print("Saved:", args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+# Features that appear in no group (older features.json without feature_groups)
+_UNGROUPED = "other"
+
+
+class ContributionExplainer:
+    """
+    Per-row feature contributions from the booster's own pred_contribs
+    (TreeSHAP), reduced to the top-k features plus per-group totals.
+
+    Latency guard: the cost per row of each method is tracked as an EMA.
+    Exact TreeSHAP is used when its estimate fits budget_ms, otherwise the
+    approximate (Saabas) contributions, otherwise nothing, in which case the
+    caller keeps the rule-only explanations. Rows seen recently (same bytes,
+    same version) are served from a small LRU.
+    """
+
+    def __init__(self, top_k: int = 5, budget_ms: float = 50.0, cache_max_entries: int = 1024):
+        self.top_k = max(int(top_k), 1)
+        self.budget_ms = float(budget_ms)
+        self.cache_max_entries = max(int(cache_max_entries), 0)
+        self._cache: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+        self._group_index: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        self._ms_per_row: Dict[str, Optional[float]] = {"tree_shap": None, "approx": None}
+        self._lock = threading.Lock()
+        self._stats = {"exact": 0, "approx": 0, "skipped_budget": 0, "skipped_load": 0, "unsupported": 0, "cache_hits": 0}
+
+    @staticmethod
+    def supports(art: Any) -> bool:
+        return art.backend in {"native", "sklearn"}
+
+    def explain(
+        self,
+        art: Any,
+        x: np.ndarray,
+        keys: Optional[List[bytes]] = None,
+        busy: bool = False,
+    ) -> Tuple[str, Optional[List[Dict[str, Any]]]]:
+        """
+        Returns (mode, per-row contributions) where mode is "tree_shap",
+        "approx", or "rules" (no contributions: unsupported, busy or over budget).
+        """
+        if not self.supports(art):
+            self._count("unsupported")
+            return "rules", None
+        if busy:
+            self._count("skipped_load")
+            return "rules", None
+
+        n = x.shape[0]
+        out: List[Optional[Dict[str, Any]]] = [None] * n
+        if keys is not None and self.cache_max_entries:
+            with self._lock:
+                for i, k in enumerate(keys):
+                    hit = self._cache.get(k)
+                    if hit is not None:
+                        self._cache.move_to_end(k)
+                        out[i] = hit
+            self._count("cache_hits", sum(r is not None for r in out))
+
+        todo = [i for i, r in enumerate(out) if r is None]
+        mode = "tree_shap"
+        if todo:
+            mode = self._pick_method(len(todo))
+            if mode == "rules":
+                self._count("skipped_budget")
+                return "rules", None
+
+            t0 = time.perf_counter()
+            contribs = self._contributions(art, x[todo], approx=mode == "approx")
+            self._observe(mode, (time.perf_counter() - t0) * 1000.0 / len(todo))
+            self._count("exact" if mode == "tree_shap" else "approx", len(todo))
+
+            rows = self._summarize(art, contribs, mode)
+            for i, row in zip(todo, rows):
+                out[i] = row
+            if keys is not None and self.cache_max_entries:
+                self._put([keys[i] for i in todo], rows)
+
+        return mode, out
+
+    def _pick_method(self, n_rows: int) -> str:
+        with self._lock:
+            exact, approx = self._ms_per_row["tree_shap"], self._ms_per_row["approx"]
+            if exact is None or exact * n_rows <= self.budget_ms:
+                return "tree_shap"
+            if approx is None or approx * n_rows <= self.budget_ms:
+                return "approx"
+            # Decay so a transient slow spell doesn't disable SHAP for good
+            self._ms_per_row["tree_shap"] = exact * 0.9
+            self._ms_per_row["approx"] = approx * 0.9
+            return "rules"
+
+    def _observe(self, mode: str, ms_per_row: float) -> None:
+        with self._lock:
+            prev = self._ms_per_row[mode]
+            self._ms_per_row[mode] = ms_per_row if prev is None else 0.8 * prev + 0.2 * ms_per_row
+
+    @staticmethod
+    def _contributions(art: Any, x: np.ndarray, approx: bool) -> np.ndarray:
+        import xgboost as xgb
+
+        booster = art.model.booster if art.backend == "native" else art.model.get_booster()
+        # (n_rows, n_features + 1) in log-odds; the last column is the bias
+        return booster.predict(xgb.DMatrix(x), pred_contribs=True, approx_contribs=approx)
+
+    def _groups_for(self, art: Any) -> Tuple[List[str], np.ndarray]:
+        cached = self._group_index.get(art.version_dir)
+        if cached is not None:
+            return cached
+
+        index = art.layout.index
+        names: List[str] = []
+        group_of = np.full(len(art.feature_names), -1, dtype=np.intp)
+        for g, cols in (art.feature_groups or {}).items():
+            names.append(g)
+            for c in cols:
+                j = index.get(c)
+                if j is not None:
+                    group_of[j] = len(names) - 1
+        if (group_of < 0).any():
+            names.append(_UNGROUPED)
+            group_of[group_of < 0] = len(names) - 1
+
+        onehot = np.zeros((len(art.feature_names), len(names)), dtype=np.float32)
+        onehot[np.arange(len(art.feature_names)), group_of] = 1.0
+        self._group_index[art.version_dir] = (names, onehot)
+        return names, onehot
+
+    def _summarize(self, art: Any, contribs: np.ndarray, mode: str) -> List[Dict[str, Any]]:
+        phi = np.asarray(contribs[:, :-1], dtype=np.float32)
+        bias = contribs[:, -1]
+        group_names, onehot = self._groups_for(art)
+        group_sums = phi @ onehot
+
+        k = min(self.top_k, phi.shape[1])
+        top = np.argpartition(-np.abs(phi), k - 1, axis=1)[:, :k]
+        top_vals = np.take_along_axis(phi, top, axis=1)
+        order = np.argsort(-np.abs(top_vals), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        group_of = onehot.argmax(axis=1)
+
+        rows = []
+        for i in range(phi.shape[0]):
+            rows.append({
+                "method": mode,
+                "units": "log_odds",
+                "bias": float(bias[i]),
+                "top_features": [
+                    {
+                        "feature": art.feature_names[j],
+                        "group": group_names[group_of[j]],
+                        "contribution": float(phi[i, j]),
+                    }
+                    for j in top[i].tolist()
+                ],
+                "groups": {g: float(v) for g, v in zip(group_names, group_sums[i].tolist())},
+            })
+        return rows
+
+    def _put(self, keys: List[bytes], rows: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            for k, row in zip(keys, rows):
+                self._cache[k] = row
+                self._cache.move_to_end(k)
+            while len(self._cache) > self.cache_max_entries:
+                self._cache.popitem(last=False)
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += n
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._group_index.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "top_k": self.top_k,
+                "budget_ms": self.budget_ms,
+                "cache_entries": len(self._cache),
+                "ms_per_row": dict(self._ms_per_row),
+                **self._stats,
+            }
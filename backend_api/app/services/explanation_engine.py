@@ -1,5 +1,60 @@
 from __future__ import annotations
-from typing import Any, Dict, List
+import hashlib
+import json
+import os
+import sys
+from typing import Any, Dict, List, Sequence
+import numpy as np
+
+_TEMPLATES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "explanation_templates.json")
+
+
+def _load_templates(path: str) -> tuple[Dict[str, str], str]:
+    with open(path, "r", encoding="utf-8") as f:
+        obj = json.load(f)
+    templates = {sys.intern(k): sys.intern(v) for k, v in obj["templates"].items()}
+    canonical = json.dumps(templates, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return templates, hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:12]
+
+
+# Loaded once; every response references these shared strings.
+# TEMPLATE_VERSION changes whenever any code or text changes.
+TEMPLATES, TEMPLATE_VERSION = _load_templates(_TEMPLATES_PATH)
+
+RISK_BANDS = ("low", "moderate", "high", "critical")
+
+# Bit i of explanation_bits -> EXPLANATION_CODES[i], rendered in this order
+EXPLANATION_CODES = (
+    "EXP_ANEMIA_HIGH",
+    "EXP_ANEMIA_MODERATE",
+    "EXP_BP_INSTABILITY",
+    "EXP_BP_OUT_OF_RANGE",
+    "EXP_HR_ELEVATED",
+    "EXP_HR_MILD",
+    "EXP_PREV_COMPLICATIONS",
+    "EXP_MULTIMODAL_ABOVE_THRESHOLD",
+)
+
+# Bit i of warning_bits -> WARNING_CODES[i]
+WARNING_CODES = (
+    "WARN_PROXY_OUTPUT",
+    "WARN_LOW_SIGNAL_QUALITY",
+)
+
+# Action list is fully determined by (risk band, label); index = action_set code
+ACTION_SETS = (
+    # low, label 0
+    ("ACT_ROUTINE_MONITORING", "ACT_ASSESS_BLEEDING"),
+    # low, label 1 (positive but near-threshold)
+    ("ACT_REPEAT_VITALS_10MIN", "ACT_ROUTINE_MONITORING", "ACT_ASSESS_BLEEDING"),
+    # moderate
+    ("ACT_REPEAT_VITALS_5MIN", "ACT_ASSESS_BLEEDING", "ACT_INCREASE_OBSERVATION"),
+    # high
+    ("ACT_REPEAT_VITALS_NOW", "ACT_ASSESS_BLEEDING", "ACT_ESCALATE_CLINICIAN"),
+    # critical
+    ("ACT_URGENT_REASSESSMENT", "ACT_ASSESS_BLEEDING", "ACT_ESCALATE_CLINICIAN", "ACT_EMERGENCY_WORKFLOW"),
+)
+
 
 def _to_float(x, default=0.0) -> float:
     try:
@@ -34,14 +89,20 @@ def compute_risk_band(prob: float, threshold: float) -> str:
     return "critical"
 
 
-def generate_explanations_and_actions(
+def _action_set(risk_band: str, label: int) -> int:
+    if risk_band == "low":
+        return 1 if label == 1 else 0
+    return RISK_BANDS.index(risk_band) + 1
+
+
+def generate_explanation_codes(
     feature_map: Dict[str, Any],
     prob: float,
     threshold: float,
     label: int,
 ) -> Dict[str, List[str] | str]:
+    """Rule ladder for one visit; returns template codes instead of sentences."""
     explanations: List[str] = []
-    actions: List[str] = []
     warnings: List[str] = []
 
     # Pull common inputs used in your current pipeline
@@ -58,71 +119,229 @@ def generate_explanations_and_actions(
     # Explanation rules
     # Anemia contribution
     if p_anemia >= 0.70:
-        explanations.append("Anemia probability is elevated.")
+        explanations.append("EXP_ANEMIA_HIGH")
     elif p_anemia >= 0.40:
-        explanations.append("Anemia probability is moderately elevated.")
+        explanations.append("EXP_ANEMIA_MODERATE")
 
     # Blood pressure patterns
     if sbp > 0 and dbp > 0:
         if sbp < 90 or dbp < 60:
-            explanations.append("Blood pressure pattern suggests possible hemodynamic instability.")
+            explanations.append("EXP_BP_INSTABILITY")
         elif sbp >= 140 or dbp >= 90:
-            explanations.append("Blood pressure pattern is outside expected range.")
+            explanations.append("EXP_BP_OUT_OF_RANGE")
         elif (sbp - dbp) < 25 or (sbp - dbp) > 70:
-            explanations.append("Blood pressure pattern is outside expected range.")
+            explanations.append("EXP_BP_OUT_OF_RANGE")
 
     # HR/PPG if available
     if hr > 0:
         if hr >= 110:
-            explanations.append("Heart rate is elevated.")
+            explanations.append("EXP_HR_ELEVATED")
         elif hr >= 95:
-            explanations.append("Heart rate is mildly elevated.")
+            explanations.append("EXP_HR_MILD")
 
     # Clinical history
     if prev_comp == 1:
-        explanations.append("History of previous complications increases maternal risk.")
+        explanations.append("EXP_PREV_COMPLICATIONS")
 
     # If model positive but few rule explanations triggered, add generic model-driven explanation
     if label == 1 and len(explanations) == 0:
-        explanations.append("Combined multimodal risk pattern is above the current alert threshold.")
+        explanations.append("EXP_MULTIMODAL_ABOVE_THRESHOLD")
 
     # Warnings
-    warnings.append("Proxy model output (not confirmed PPH diagnosis).")
+    warnings.append("WARN_PROXY_OUTPUT")
 
     if signal_quality >= 0 and signal_quality < 0.60:
-        warnings.append("PPG signal quality is low; repeat measurement may improve reliability.")
+        warnings.append("WARN_LOW_SIGNAL_QUALITY")
 
-    # Recommended actions (vary by risk band)
-    # Base action always
-    actions.append("Assess bleeding signs and uterine tone per protocol.")
+    # Recommended actions (vary by risk band; precomputed per band/label)
+    actions = list(ACTION_SETS[_action_set(risk_band, label)])
+
+    return {
+        "risk_band": risk_band,
+        "explanations": explanations,
+        "recommended_actions": actions,
+        "warnings": warnings,
+    }
+
+
+def render_codes(exp: Dict[str, List[str] | str]) -> Dict[str, List[str] | str]:
+    """Template codes -> shared template sentences."""
+    return {
+        "risk_band": exp["risk_band"],
+        "explanations": [TEMPLATES[c] for c in exp["explanations"]],
+        "recommended_actions": [TEMPLATES[c] for c in exp["recommended_actions"]],
+        "warnings": [TEMPLATES[c] for c in exp["warnings"]],
+    }
+
+
+def generate_explanations_and_actions(
+    feature_map: Dict[str, Any],
+    prob: float,
+    threshold: float,
+    label: int,
+) -> Dict[str, List[str] | str]:
+    return render_codes(generate_explanation_codes(feature_map, prob, threshold, label))
 
-    if risk_band == "low":
-        actions.insert(0, "Continue routine monitoring and repeat vitals at the next scheduled interval.")
-        if label == 1:
-            # positive but near-threshold
-            actions.insert(0, "Repeat vital signs measurement within 10 minutes to confirm trend.")
 
-    elif risk_band == "moderate":
-        actions.insert(0, "Repeat vital signs measurement within 5 minutes.")
-        actions.append("Increase observation frequency and reassess symptoms.")
+def expand_codes(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compact result (explanation_codes / action_codes / warning_codes plus
+    template_version; free-text warnings as text) -> the full shape with
+    template sentences, rule warnings first.
+    """
+    out = {
+        k: v
+        for k, v in result.items()
+        if k not in ("explanation_codes", "action_codes", "warning_codes", "warnings", "template_version")
+    }
+    out["explanations"] = [TEMPLATES[c] for c in result["explanation_codes"]]
+    out["recommended_actions"] = [TEMPLATES[c] for c in result["action_codes"]]
+    out["warnings"] = [TEMPLATES[c] for c in result["warning_codes"]] + result["warnings"]
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Columnar variant for batch / bulk scoring.
+# Rules are evaluated as NumPy masks and packed into per-row bitmasks; strings
+# are only produced by render_explanations_batch at serialization time.
+# Must stay row-for-row identical to generate_explanations_and_actions
+# (see benchmarks/check_explanation_parity.py).
+# ---------------------------------------------------------------------------
+
+# Rule inputs and their defaults (same as the scalar engine)
+RULE_INPUTS = {
+    "p_anemia": 0.0,
+    "systolic_bp": 0.0,
+    "diastolic_bp": 0.0,
+    "prev_complications": 0.0,
+    "hr_bpm_est": 0.0,
+    "signal_quality": -1.0,
+}
+
+
+def extract_rule_inputs(feature_maps: Sequence[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Pulls the rule input columns out of feature maps, with scalar-engine coercion."""
+    return {
+        name: np.fromiter((_to_float(fm.get(name), default) for fm in feature_maps), dtype=np.float64, count=len(feature_maps))
+        for name, default in RULE_INPUTS.items()
+    }
+
+
+def compute_risk_band_batch(probs: np.ndarray, threshold: float | np.ndarray) -> np.ndarray:
+    """Vectorized compute_risk_band; returns int8 codes into RISK_BANDS."""
+    probs = np.asarray(probs, dtype=np.float64)
+    threshold = np.asarray(threshold, dtype=np.float64)
+    margin1 = np.maximum(0.08, threshold * 0.5)
+    margin2 = np.maximum(0.20, threshold * 1.2)
+    # NaN falls through every comparison to "critical", like the scalar version
+    return np.select(
+        [probs < threshold, probs < threshold + margin1, probs < threshold + margin2],
+        [0, 1, 2],
+        default=3,
+    ).astype(np.int8)
+
+
+def evaluate_rules_batch(
+    inputs: Dict[str, np.ndarray],
+    probs: np.ndarray,
+    threshold: float | np.ndarray,
+    labels: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """
+    Evaluates every rule as a mask over the batch.
+    Returns per-row explanation_bits, warning_bits, risk_band and action_set codes.
+    Missing columns in `inputs` take the scalar engine defaults; NaN never fires a rule.
+    """
+    n = len(probs)
+
+    def col(name: str) -> np.ndarray:
+        v = inputs.get(name)
+        if v is None:
+            return np.full(n, RULE_INPUTS[name], dtype=np.float64)
+        return np.asarray(v, dtype=np.float64)
+
+    p_anemia = col("p_anemia")
+    sbp = col("systolic_bp")
+    dbp = col("diastolic_bp")
+    prev_comp = np.trunc(col("prev_complications"))
+    hr = col("hr_bpm_est")
+    signal_quality = col("signal_quality")
+    labels = np.asarray(labels).astype(np.int64)
 
-    elif risk_band == "high":
-        actions.insert(0, "Repeat vital signs measurement immediately and confirm sensor placement.")
-        actions.append("Escalate to supervising clinician now.")
+    with np.errstate(invalid="ignore"):
+        bp_known = (sbp > 0) & (dbp > 0)
+        bp_instability = bp_known & ((sbp < 90) | (dbp < 60))
+        pulse_pressure = sbp - dbp
+        bp_out_of_range = bp_known & ~bp_instability & (
+            (sbp >= 140) | (dbp >= 90) | (pulse_pressure < 25) | (pulse_pressure > 70)
+        )
 
-    elif risk_band == "critical":
-        actions.insert(0, "Initiate urgent reassessment now and repeat vitals immediately.")
-        actions.append("Escalate to supervising clinician now.")
-        actions.append("Prepare emergency response workflow per facility protocol.")
+        masks = [
+            p_anemia >= 0.70,
+            (p_anemia >= 0.40) & ~(p_anemia >= 0.70),
+            bp_instability,
+            bp_out_of_range,
+            (hr > 0) & (hr >= 110),
+            (hr > 0) & (hr >= 95) & ~(hr >= 110),
+            prev_comp == 1,
+        ]
+        low_signal = (signal_quality >= 0) & (signal_quality < 0.60)
 
-    # Avoid duplicates while preserving order
-    actions = list(dict.fromkeys(actions))
-    explanations = list(dict.fromkeys(explanations))
-    warnings = list(dict.fromkeys(warnings))
+    explanation_bits = np.zeros(n, dtype=np.uint16)
+    for bit, m in enumerate(masks):
+        explanation_bits |= m.astype(np.uint16) << bit
+    generic = (labels == 1) & (explanation_bits == 0)
+    explanation_bits |= generic.astype(np.uint16) << len(masks)
+
+    warning_bits = np.ones(n, dtype=np.uint8) | (low_signal.astype(np.uint8) << 1)
+
+    risk_band = compute_risk_band_batch(probs, threshold)
+    # 0: low, 1: low + positive label, 2..4: moderate/high/critical
+    action_set = np.where(risk_band == 0, (labels == 1).astype(np.int8), risk_band + 1).astype(np.int8)
 
     return {
+        "explanation_bits": explanation_bits,
+        "warning_bits": warning_bits,
         "risk_band": risk_band,
-        "explanations": explanations,
-        "recommended_actions": actions,
-        "warnings": warnings,
-    }
\ No newline at end of file
+        "action_set": action_set,
+    }
+
+
+def _bits_to_texts(bits: int, codes: Sequence[str], as_codes: bool) -> List[str]:
+    return [c if as_codes else TEMPLATES[c] for i, c in enumerate(codes) if bits >> i & 1]
+
+
+def render_explanations_batch(rule_hits: Dict[str, np.ndarray], as_codes: bool = False) -> List[Dict[str, List[str] | str]]:
+    """
+    Turns evaluate_rules_batch output into the scalar engine's per-row dicts:
+    template codes with as_codes, otherwise their sentences.
+    """
+    return [
+        {
+            "risk_band": RISK_BANDS[band],
+            "explanations": _bits_to_texts(eb, EXPLANATION_CODES, as_codes),
+            "recommended_actions": [c if as_codes else TEMPLATES[c] for c in ACTION_SETS[action_set]],
+            "warnings": _bits_to_texts(wb, WARNING_CODES, as_codes),
+        }
+        for eb, wb, band, action_set in zip(
+            rule_hits["explanation_bits"].tolist(),
+            rule_hits["warning_bits"].tolist(),
+            rule_hits["risk_band"].tolist(),
+            rule_hits["action_set"].tolist(),
+        )
+    ]
+
+
+def generate_explanations_and_actions_batch(
+    feature_maps: Sequence[Dict[str, Any]],
+    probs: np.ndarray,
+    threshold: float,
+    labels: np.ndarray,
+    as_codes: bool = False,
+) -> List[Dict[str, List[str] | str]]:
+    """
+    Columnar equivalent of calling generate_explanations_and_actions (or, with
+    as_codes, generate_explanation_codes) per row.
+    """
+    rule_hits = evaluate_rules_batch(extract_rule_inputs(feature_maps), probs, threshold, labels)
+    return render_explanations_batch(rule_hits, as_codes=as_codes)
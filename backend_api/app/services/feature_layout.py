@@ -0,0 +1,238 @@
+from __future__ import annotations
+import base64
+import threading
+from itertools import chain, repeat
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from app.services.waveform_pca import WaveformProjection
+
+# Raw PPG samples are stored as columns "0", "1", ... in features.json
+WAVEFORM_DTYPES = {"float32": "<f4", "int16": "<i2"}
+
+_EMPTY_IDX = np.zeros(0, dtype=np.intp)
+
+# Distinct key sequences whose column indices are kept (clients resend the same keys)
+_KEY_CACHE_SIZE = 64
+
+
+def decode_waveform_b64(data: str, dtype: str = "float32", scale: float = 1.0) -> np.ndarray:
+    """
+    Decodes a base64 little-endian sample buffer into a float32 vector.
+    int16 buffers are multiplied by `scale`.
+    """
+    if dtype not in WAVEFORM_DTYPES:
+        raise ValueError(f"Unsupported waveform dtype '{dtype}'. Use one of {sorted(WAVEFORM_DTYPES)}.")
+    try:
+        raw = base64.b64decode(data, validate=True)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid base64 waveform: {e}")
+
+    itemsize = np.dtype(WAVEFORM_DTYPES[dtype]).itemsize
+    if len(raw) % itemsize != 0:
+        raise ValueError(f"Waveform buffer length {len(raw)} is not a multiple of {itemsize} bytes.")
+
+    samples = np.frombuffer(raw, dtype=WAVEFORM_DTYPES[dtype])
+    if dtype == "float32":
+        return samples if scale == 1.0 else samples * np.float32(scale)
+    return samples.astype(np.float32) * np.float32(scale)
+
+
+class FeatureLayout:
+    """
+    Precompiled column layout for the fusion feature matrix.
+
+    Built once per artifact version from features.json. A batch is filled by
+    resolving each feature map's keys to columns (cached per key sequence),
+    converting all values with one np.fromiter and scattering them into a
+    float32 buffer with a single assignment, instead of looping over every
+    expected feature of every row.
+    """
+
+    def __init__(self, feature_names: Sequence[str], waveform_projection: Optional[WaveformProjection] = None):
+        self.feature_names: List[str] = list(feature_names)
+        self.n_features = len(self.feature_names)
+        self.index: Dict[str, int] = {name: i for i, name in enumerate(self.feature_names)}
+        self._names_arr = np.array(self.feature_names, dtype=object)
+        self._local = threading.local()
+        self._key_cache: Dict[tuple, np.ndarray] = {}
+        self.waveform_start, self.waveform_len = self._find_waveform_block(self.index)
+
+        # Models trained on waveform principal components instead of raw samples:
+        # raw input is projected into the (contiguous) component block
+        self.projection = waveform_projection
+        self.pc_start, self.pc_len = -1, 0
+        if waveform_projection is not None:
+            cols = [self.index.get(name) for name in waveform_projection.feature_names]
+            if None in cols or cols != list(range(cols[0], cols[0] + len(cols))):
+                raise ValueError("Waveform PCA features must be a contiguous block of features.json.")
+            self.pc_start, self.pc_len = cols[0], len(cols)
+
+    @property
+    def waveform_input_len(self) -> int:
+        """Raw samples per row this layout accepts (0 = no waveform input)."""
+        if self.waveform_len:
+            return self.waveform_len
+        return self.projection.n_samples if self.projection is not None else 0
+
+    @staticmethod
+    def _find_waveform_block(index: Dict[str, int]) -> tuple[int, int]:
+        # Contiguous "0".."N-1" columns; (-1, 0) when the model has no raw waveform
+        start = index.get("0")
+        if start is None:
+            return -1, 0
+        n = 0
+        while index.get(str(n)) == start + n:
+            n += 1
+        return start, n
+
+    def buffer(self, n_rows: int) -> np.ndarray:
+        """
+        Per-thread scratch matrix of shape (n_rows, n_features), reused across calls.
+        Only valid until the next call on the same thread.
+        """
+        buf = getattr(self._local, "buf", None)
+        if buf is None or buf.shape[0] < n_rows:
+            buf = np.empty((max(n_rows, 1), self.n_features), dtype=np.float32)
+            self._local.buf = buf
+        return buf[:n_rows]
+
+    def fill_rows(
+        self,
+        feature_maps: Sequence[Dict[str, Any]],
+        out: np.ndarray | None = None,
+        waveforms: Optional[Sequence[Optional[np.ndarray]]] = None,
+    ) -> tuple[np.ndarray, List[List[str]], List[List[str]]]:
+        """
+        Fills one row per feature map.
+        Optional decoded waveforms are copied into the raw sample block and take
+        precedence over "0".."N-1" keys in the map.
+        Returns (matrix, missing_features per row, non_numeric_features per row).
+        Missing / None / non-numeric / non-finite values become 0.0.
+        """
+        n = len(feature_maps)
+        if out is None:
+            out = np.empty((n, self.n_features), dtype=np.float32)
+        out[:] = 0.0
+        present = np.zeros((n, self.n_features), dtype=bool)
+
+        # (row, column, value) triples of every map; -1 marks keys not in features.json
+        col_parts = [self._columns(tuple(fm)) for fm in feature_maps]
+        lengths = np.fromiter(map(len, col_parts), dtype=np.intp, count=n)
+        cols = np.concatenate(col_parts) if n else _EMPTY_IDX
+        rows = np.repeat(np.arange(n, dtype=np.intp), lengths)
+        known = cols >= 0
+
+        bad = None
+        try:
+            # Fast path: every value converts (None -> nan -> 0.0)
+            vals = np.fromiter(self._values(feature_maps), dtype=np.float32, count=len(cols))[known]
+        except (TypeError, ValueError):
+            # Some value does not convert; it may sit under a key the model ignores
+            objs = np.fromiter(self._values(feature_maps), dtype=object, count=len(cols))[known]
+            try:
+                vals = objs.astype(np.float32)
+            except (TypeError, ValueError):
+                vals, bad = self._coerce(objs)
+        rows, cols = rows[known], cols[known]
+        # out starts at 0.0, so only the scattered values need sanitizing
+        vals[~np.isfinite(vals)] = 0.0
+        # One flat scatter per matrix (cheaper than 2-D fancy indexing)
+        flat = rows * self.n_features + cols
+        if out.flags.c_contiguous:
+            out.reshape(-1)[flat] = vals
+        else:
+            out[rows, cols] = vals
+        present.reshape(-1)[flat] = True
+
+        if waveforms is not None or self.projection is not None:
+            for i, fm in enumerate(feature_maps):
+                if waveforms is not None and waveforms[i] is not None:
+                    self._fill_waveform(waveforms[i], out[i], present[i])
+                elif self.projection is not None and "0" in fm:
+                    # Raw "0".."N-1" keys in the map feed the projection
+                    self._fill_waveform(self._raw_from_map(fm), out[i], present[i])
+
+        # Both reports in features.json order, matching the original per-feature loop
+        non_numeric = self._names_by_row(self._sorted(rows[bad], cols[bad]), n) if bad is not None and bad.any() else [[] for _ in range(n)]
+        return out, self._missing(present), non_numeric
+
+    def _columns(self, keys: tuple) -> np.ndarray:
+        cols = self._key_cache.get(keys)
+        if cols is None:
+            cols = np.fromiter(map(self.index.get, keys, repeat(-1)), dtype=np.intp, count=len(keys))
+            if len(self._key_cache) >= _KEY_CACHE_SIZE:
+                self._key_cache.clear()
+            self._key_cache[keys] = cols
+        return cols
+
+    @staticmethod
+    def _values(feature_maps: Sequence[Dict[str, Any]]):
+        return chain.from_iterable(fm.values() for fm in feature_maps)
+
+    def _missing(self, present: np.ndarray) -> List[List[str]]:
+        n = present.shape[0]
+        # Only rows that lack some feature are scanned
+        incomplete = np.flatnonzero(np.count_nonzero(present, axis=1) < self.n_features)
+        if incomplete.size == 0:
+            return [[] for _ in range(n)]
+        sub_rows, cols = np.nonzero(~present[incomplete])
+        return self._names_by_row((incomplete[sub_rows], cols), n)
+
+    @staticmethod
+    def _coerce(vals: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """float(v) per value (None -> 0.0); values float() rejects become 0.0 and are flagged."""
+        out = np.zeros(len(vals), dtype=np.float32)
+        bad = np.zeros(len(vals), dtype=bool)
+        for k, v in enumerate(vals.tolist()):
+            try:
+                out[k] = 0.0 if v is None else float(v)
+            except (TypeError, ValueError):
+                bad[k] = True
+        return out, bad
+
+    @staticmethod
+    def _sorted(rows: np.ndarray, cols: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        order = np.lexsort((cols, rows))
+        return rows[order], cols[order]
+
+    def _names_by_row(self, idx: tuple[np.ndarray, np.ndarray], n_rows: int) -> List[List[str]]:
+        # idx: (rows, cols) sorted by row, then column
+        rows, cols = idx
+        if rows.size == 0:
+            return [[] for _ in range(n_rows)]
+        names = self._names_arr[cols].tolist()
+        bounds = np.searchsorted(rows, np.arange(n_rows + 1)).tolist()
+        return [names[bounds[i]:bounds[i + 1]] for i in range(n_rows)]
+
+    def fill_waveform_block(self, x: np.ndarray, samples: np.ndarray) -> None:
+        """Writes (n_rows, n_samples) raw samples into x: raw block or projected components."""
+        if self.waveform_len:
+            x[:, self.waveform_start:self.waveform_start + self.waveform_len] = samples
+        elif self.projection is not None:
+            self.projection.transform(samples, out=x[:, self.pc_start:self.pc_start + self.pc_len])
+        else:
+            raise ValueError("This model version does not use raw waveform features.")
+
+    def _raw_from_map(self, feature_map: Dict[str, Any]) -> np.ndarray:
+        raw = np.zeros(self.projection.n_samples, dtype=np.float32)
+        for j in range(self.projection.n_samples):
+            v = feature_map.get(str(j))
+            try:
+                raw[j] = 0.0 if v is None else float(v)
+            except (TypeError, ValueError):
+                raw[j] = 0.0
+        return raw
+
+    def _fill_waveform(self, samples: np.ndarray, row: np.ndarray, present: np.ndarray) -> None:
+        n = self.waveform_input_len
+        if n == 0:
+            raise ValueError("This model version does not use raw waveform features.")
+        if samples.shape[0] != n:
+            raise ValueError(f"Expected {n} waveform samples, got {samples.shape[0]}.")
+        if self.waveform_len:
+            block = slice(self.waveform_start, self.waveform_start + self.waveform_len)
+            row[block] = np.nan_to_num(samples, nan=0.0, posinf=0.0, neginf=0.0)
+        else:
+            block = slice(self.pc_start, self.pc_start + self.pc_len)
+            self.projection.transform(samples, out=row[block])
+        present[block] = True
@@ -1,13 +1,37 @@
 from __future__ import annotations
+import asyncio
 import glob
 import json
 import os
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
-import joblib
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
 import numpy as np
-import pandas as pd
-from app.services.explanation_engine import generate_explanations_and_actions
+from app.services.contribution_explainer import ContributionExplainer
+from app.services.explanation_engine import (
+    TEMPLATE_VERSION,
+    expand_codes,
+    generate_explanation_codes,
+    generate_explanations_and_actions_batch,
+    render_codes,
+)
+from app.services.feature_layout import FeatureLayout, decode_waveform_b64
+from app.services.inference_executor import InferenceExecutor
+from app.services.micro_batcher import MicroBatcher
+from app.services.model_registry import ModelRegistry
+from app.services.prediction_cache import PredictionCache, row_key
+from app.services.proxy_rule import ProxyRule
+from app.services.native_predictor import NativeBoosterModel, PlattCalibrator
+from app.services.tree_ensemble import TreeEnsembleModel
+from app.services.waveform_pca import WaveformProjection
+
+MODEL_BACKENDS = {"auto", "native", "numpy", "sklearn"}
+EXPLAIN_MODES = {"rules", "shap"}
+
+# Below this batch size the scalar explanation engine is cheaper than NumPy setup
+_BATCH_EXPLAIN_MIN_ROWS = 8
 
 
 @dataclass
@@ -18,34 +42,129 @@ class FusionArtifacts:
     feature_names: List[str]
     version_dir: str
     label_type: str = "proxy_rule_v1"
+    layout: Optional[FeatureLayout] = None
+    backend: str = "sklearn"
+    feature_groups: Optional[Dict[str, List[str]]] = None
+    proxy_rule: Optional[ProxyRule] = None
 
 
 class FusionInferenceService:
-    def __init__(self, artifacts_root: str = "models_artifacts/fusion_pph_proxy"):
+    def __init__(
+        self,
+        artifacts_root: str = "models_artifacts/fusion_pph_proxy",
+        executor_kind: str = "thread",
+        max_workers: Optional[int] = None,
+        max_queue: int = 32,
+        nthread: int = 1,
+        micro_batch_window_ms: float = 0.0,
+        micro_batch_max_size: int = 32,
+        model_backend: str = "auto",
+        shadow_log_path: Optional[str] = None,
+        cache_max_entries: int = 4096,
+        cache_ttl_s: float = 600.0,
+        shap_top_k: int = 5,
+        shap_budget_ms: float = 50.0,
+    ):
+        if model_backend not in MODEL_BACKENDS:
+            raise ValueError(f"Unknown model_backend='{model_backend}'. Use one of {sorted(MODEL_BACKENDS)}.")
         self.artifacts_root = artifacts_root
+        self.model_backend = model_backend
         self.artifacts: Optional[FusionArtifacts] = None
+        self._reload_lock = threading.Lock()
+        # Versions with identical features.json share one FeatureLayout
+        self._layouts: Dict[tuple, FeatureLayout] = {}
+        self.registry = ModelRegistry(score_fn=self._score_matrix, shadow_log_path=shadow_log_path)
+        # Scores per assembled row; cleared whenever served artifacts change.
+        # With executor_kind="process" each worker keeps its own cache and this
+        # one only aggregates their hit / miss / eviction counts.
+        self.cache = PredictionCache(max_entries=cache_max_entries, ttl_s=cache_ttl_s)
+        # explain="shap": TreeSHAP top-k / group contributions under a latency budget
+        self.explainer = ContributionExplainer(
+            top_k=shap_top_k,
+            budget_ms=shap_budget_ms,
+            cache_max_entries=min(cache_max_entries, 1024),
+        )
+        self.nthread = max(int(nthread), 1)
+        self.executor = InferenceExecutor(
+            kind=executor_kind,
+            max_workers=max_workers,
+            max_queue=max_queue,
+            nthread=self.nthread,
+        )
+
+        # Optional: coalesce concurrent single-item requests into one model call.
+        # Batches are scored as codes; full-format callers expand their own row.
+        self.micro_batcher: Optional[MicroBatcher] = None
+        if micro_batch_window_ms > 0:
+            self.micro_batcher = MicroBatcher(
+                run_batch=partial(self.predict, as_codes=True),
+                window_ms=micro_batch_window_ms,
+                max_batch_size=micro_batch_max_size,
+            )
 
-    def load(self) -> None:
-        version_dir = self._latest_version_dir(self.artifacts_root)
+    def load(self, version_dir: Optional[str] = None) -> None:
+        if version_dir is None:
+            version_dir = self._latest_version_dir(self.artifacts_root)
         if version_dir is None:
             raise FileNotFoundError(f"No artifact versions found in: {self.artifacts_root}")
+        self.artifacts = self._load_artifacts(version_dir)
+
+    def reload(self, version_dir: Optional[str] = None) -> FusionArtifacts:
+        """
+        Loads and warms a version off the request path, then swaps it in with a
+        single attribute assignment. Requests already running keep the
+        FusionArtifacts they started with. Defaults to the newest version.
+        """
+        with self._reload_lock:
+            if version_dir is None:
+                version_dir = self._latest_version_dir(self.artifacts_root)
+            if version_dir is None:
+                raise FileNotFoundError(f"No artifact versions found in: {self.artifacts_root}")
+
+            new_art = self._load_artifacts(version_dir)
+            self._warm_up(new_art)
+            self.artifacts = new_art
+            self.cache.clear()
+            self.explainer.clear()
+            return new_art
+
+    async def watch_for_new_versions(self, interval_s: float) -> None:
+        """
+        Background task: polls artifacts_root and hot-swaps when a newer version appears.
+        A version that fails to load is skipped until a newer one shows up.
+        """
+        failed_dir: Optional[str] = None
+        while True:
+            await asyncio.sleep(interval_s)
+            latest = self._latest_version_dir(self.artifacts_root)
+            current = self.artifacts.version_dir if self.artifacts is not None else None
+            if latest is None or latest in (current, failed_dir):
+                continue
+            try:
+                await asyncio.to_thread(self.reload, latest)
+                print("[INFO] Hot-swapped fusion artifacts:", latest)
+            except Exception as e:
+                failed_dir = latest
+                print("[WARN] Could not hot-swap fusion artifacts:", latest, e)
+
+    @staticmethod
+    def _warm_up(art: FusionArtifacts, n_rows: int = 8) -> None:
+        # Synthetic batch so first real requests don't pay lazy init costs
+        x = np.zeros((n_rows, art.layout.n_features), dtype=np.float32)
+        FusionInferenceService._score_matrix(art, x)
+
+    def _load_artifacts(self, version_dir: str) -> FusionArtifacts:
 
-        model_path = os.path.join(version_dir, "model.pkl")
-        calibrator_path = os.path.join(version_dir, "calibrator.pkl")
         threshold_path = os.path.join(version_dir, "threshold.json")
         features_path = os.path.join(version_dir, "features.json")
 
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(model_path)
-        if not os.path.exists(calibrator_path):
-            raise FileNotFoundError(calibrator_path)
         if not os.path.exists(threshold_path):
             raise FileNotFoundError(threshold_path)
         if not os.path.exists(features_path):
             raise FileNotFoundError(features_path)
 
-        model = joblib.load(model_path)
-        calibrator = joblib.load(calibrator_path)
+        backend = self._resolve_backend(version_dir)
+        model, calibrator = self._load_model(version_dir, backend)
 
         with open(threshold_path, "r", encoding="utf-8") as f:
             threshold_obj = json.load(f)
@@ -56,8 +175,12 @@ class FusionInferenceService:
             features_obj = json.load(f)
 
         # supports {"features": [...]} or plain list
+        feature_groups = None
+        waveform_pca = None
         if isinstance(features_obj, dict):
             feature_names = features_obj.get("features", [])
+            feature_groups = features_obj.get("feature_groups")
+            waveform_pca = features_obj.get("waveform_pca")
         elif isinstance(features_obj, list):
             feature_names = features_obj
         else:
@@ -66,46 +189,369 @@ class FusionInferenceService:
         if not feature_names:
             raise ValueError("No features found in features.json")
 
-        self.artifacts = FusionArtifacts(
+        # Optional: frozen pph_proxy_rule_v1 state, to report the rule score per request
+        proxy_rule_path = os.path.join(version_dir, "proxy_rule.json")
+        proxy_rule = ProxyRule.from_json(proxy_rule_path) if os.path.exists(proxy_rule_path) else None
+
+        return FusionArtifacts(
             model=model,
             calibrator=calibrator,
             threshold=threshold,
             feature_names=feature_names,
             version_dir=version_dir,
             label_type=label_type,
+            layout=self._layout_for(feature_names, version_dir, waveform_pca),
+            backend=backend,
+            feature_groups=feature_groups,
+            proxy_rule=proxy_rule,
+        )
+
+    def _layout_for(
+        self,
+        feature_names: List[str],
+        version_dir: Optional[str] = None,
+        waveform_pca: Optional[Dict[str, Any]] = None,
+    ) -> FeatureLayout:
+        # A fitted waveform projection belongs to its version: not shared
+        pca_path = os.path.join(version_dir, waveform_pca["file"]) if waveform_pca else None
+        key = (tuple(feature_names), pca_path)
+        layout = self._layouts.get(key)
+        if layout is None:
+            projection = WaveformProjection.load(pca_path, waveform_pca["features"]) if pca_path else None
+            layout = FeatureLayout(feature_names, waveform_projection=projection)
+            self._layouts[key] = layout
+        return layout
+
+    def load_canary(self, version_dir: Optional[str], percent: float = 0.0) -> Optional[FusionArtifacts]:
+        """Loads (or clears, when version_dir is None) the canary version and its traffic share."""
+        art = None
+        if version_dir is not None:
+            art = self._load_artifacts(version_dir)
+            self._warm_up(art)
+        self.registry.set_canary(art, percent)
+        self.cache.clear()
+        return art
+
+    def load_shadow(self, version_dir: Optional[str]) -> Optional[FusionArtifacts]:
+        """Loads (or clears, when version_dir is None) the shadow version."""
+        art = None
+        if version_dir is not None:
+            art = self._load_artifacts(version_dir)
+            self._warm_up(art)
+        self.registry.set_shadow(art)
+        return art
+
+    def _resolve_backend(self, version_dir: str) -> str:
+        if self.model_backend != "auto":
+            return self.model_backend
+        # Prefer the native export (model.ubj + calibrator.json) when the version has one
+        has_native = all(
+            os.path.exists(os.path.join(version_dir, name)) for name in ("model.ubj", "calibrator.json")
         )
+        return "native" if has_native else "sklearn"
+
+    def _load_model(self, version_dir: str, backend: str) -> tuple[Any, Any]:
+        if backend == "native":
+            model_path = os.path.join(version_dir, "model.ubj")
+            calibrator_path = os.path.join(version_dir, "calibrator.json")
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(model_path)
+            if not os.path.exists(calibrator_path):
+                raise FileNotFoundError(calibrator_path)
+            return NativeBoosterModel.load(model_path, nthread=self.nthread), PlattCalibrator.from_json(calibrator_path)
+
+        if backend == "numpy":
+            # xgboost-free path for edge gateways
+            model_path = os.path.join(version_dir, "model.json")
+            calibrator_path = os.path.join(version_dir, "calibrator.json")
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(model_path)
+            if not os.path.exists(calibrator_path):
+                raise FileNotFoundError(calibrator_path)
+            return TreeEnsembleModel.load(model_path), PlattCalibrator.from_json(calibrator_path)
+
+        model_path = os.path.join(version_dir, "model.pkl")
+        calibrator_path = os.path.join(version_dir, "calibrator.pkl")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(model_path)
+        if not os.path.exists(calibrator_path):
+            raise FileNotFoundError(calibrator_path)
+
+        # Only the pickle path needs joblib/sklearn at serve time
+        import joblib
+
+        model = joblib.load(model_path)
+        calibrator = joblib.load(calibrator_path)
+
+        # Training uses n_jobs=-1; pin inference so concurrent workers don't oversubscribe cores
+        if hasattr(model, "set_params"):
+            model.set_params(n_jobs=self.nthread)
+        return model, calibrator
 
     def is_loaded(self) -> bool:
         return self.artifacts is not None
 
-    def predict_from_feature_map(self, feature_map: Dict[str, Any]) -> Dict[str, Any]:
+    def shutdown(self) -> None:
+        self.executor.shutdown()
+        self.registry.shutdown()
+
+    async def predict(
+        self,
+        feature_maps: List[Dict[str, Any]],
+        waveforms: Optional[List[Optional[np.ndarray]]] = None,
+        explain: str = "rules",
+        as_codes: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Async entry point for the API: runs predict_from_feature_maps on the
+        bounded inference executor. Raises InferenceQueueFullError when saturated.
+        """
         if self.artifacts is None:
             raise RuntimeError("Fusion artifacts not loaded")
+        if explain not in EXPLAIN_MODES:
+            raise ValueError(f"Unknown explain='{explain}'. Use one of {sorted(EXPLAIN_MODES)}.")
+
+        if self.executor.kind == "process":
+            # Route in the parent; workers only know how to score one version
+            route, art = self.registry.route(self.artifacts)
+            results, cache_counts = await self.executor.run(
+                _process_predict,
+                art.version_dir,
+                self.registry.live_versions(self.artifacts),
+                self.nthread,
+                self.model_backend,
+                (self.cache.max_entries, self.cache.ttl_s),
+                feature_maps,
+                waveforms,
+                explain,
+                self._busy(),
+                as_codes,
+            )
+            self.cache.record(*cache_counts)
+            for r in results:
+                r["model_info"]["route"] = route
+            self.registry.submit_shadow(
+                art,
+                None,
+                np.array([r["prediction"]["pph_proxy_probability"] for r in results]),
+                feature_maps,
+                waveforms,
+            )
+            return results
+        return await self.executor.run(
+            self.predict_from_feature_maps, feature_maps, waveforms, explain, None, as_codes
+        )
+
+    async def predict_one(
+        self,
+        feature_map: Dict[str, Any],
+        waveform: Optional[np.ndarray] = None,
+        explain: str = "rules",
+        as_codes: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Single-item async prediction; goes through the micro-batcher when enabled
+        (SHAP requests are scored directly).
+        """
+        if self.micro_batcher is not None and explain == "rules":
+            if self.artifacts is None:
+                raise RuntimeError("Fusion artifacts not loaded")
+            result = await self.micro_batcher.submit(feature_map, waveform)
+            return result if as_codes else expand_codes(result)
+        results = await self.predict([feature_map], waveforms=[waveform], explain=explain, as_codes=as_codes)
+        return results[0]
+
+    def cache_stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats()
+        if self.executor.kind == "process":
+            # Entries live in each worker's cache; only the counts are aggregated
+            stats.update(scope="per_worker", entries=None)
+        return stats
+
+    def _busy(self) -> bool:
+        # Requests are waiting for a worker: keep explanations rule-only
+        return self.executor.stats()["in_flight"] > self.executor.max_workers
+
+    def decode_waveform(self, data: str, dtype: str = "float32", scale: float = 1.0) -> np.ndarray:
+        """
+        Decodes a base64 waveform payload and checks it against the loaded layout.
+        Raises ValueError on malformed input.
+        """
+        if self.artifacts is None:
+            raise RuntimeError("Fusion artifacts not loaded")
+
+        layout = self.artifacts.layout
+        samples = decode_waveform_b64(data, dtype=dtype, scale=scale)
+        if layout.waveform_input_len == 0:
+            raise ValueError("This model version does not use raw waveform features.")
+        if samples.shape[0] != layout.waveform_input_len:
+            raise ValueError(f"Expected {layout.waveform_input_len} waveform samples, got {samples.shape[0]}.")
+        return samples
 
-        art = self.artifacts
+    def predict_from_feature_map(
+        self,
+        feature_map: Dict[str, Any],
+        waveform: Optional[np.ndarray] = None,
+    ) -> Dict[str, Any]:
+        return self.predict_from_feature_maps([feature_map], waveforms=[waveform])[0]
 
-        x_row, missing_features, non_numeric_features = self._build_feature_row(
-            feature_map=feature_map,
-            ordered_features=art.feature_names,
+    def predict_from_feature_maps(
+        self,
+        feature_maps: List[Dict[str, Any]],
+        waveforms: Optional[List[Optional[np.ndarray]]] = None,
+        explain: str = "rules",
+        busy: Optional[bool] = None,
+        as_codes: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Scores N feature maps with a single model + calibrator call.
+        Explanations and warnings are still built per item; with as_codes they
+        stay template codes (the compact response shape, see expand_codes).
+        `waveforms` holds optional decoded raw PPG sample vectors, one per item.
+        explain="shap" adds TreeSHAP contributions computed on the same matrix;
+        under load or over the latency budget the result stays rule-only.
+        """
+        if self.artifacts is None:
+            raise RuntimeError("Fusion artifacts not loaded")
+        if not feature_maps:
+            return []
+
+        route, art = self.registry.route(self.artifacts)
+
+        x, missing, non_numeric = art.layout.fill_rows(
+            feature_maps,
+            out=art.layout.buffer(len(feature_maps)),
+            waveforms=waveforms,
         )
 
-       # Base model probability
-        base_prob = float(art.model.predict_proba(x_row)[0, 1])
+        base_probs, cal_probs, from_cache = self._score_cached(art, x)
+
+        # Background only; reuses x when the shadow shares this layout
+        self.registry.submit_shadow(art, x, cal_probs, feature_maps, waveforms)
+
+        # Label based on calibrated probability
+        labels = (cal_probs >= art.threshold).astype(int)
+        exps = self._explain(feature_maps, cal_probs, labels, art.threshold, as_codes)
+
+        explain_mode, contributions = "rules", None
+        if explain == "shap":
+            keys = [row_key(art.version_dir, row) for row in x]
+            explain_mode, contributions = self.explainer.explain(
+                art, x, keys=keys, busy=self._busy() if busy is None else busy
+            )
+
+        results = [
+            self._build_result(
+                art=art,
+                exp=exps[i],
+                base_prob=float(base_probs[i]),
+                cal_prob=float(cal_probs[i]),
+                label=int(labels[i]),
+                missing_features=missing[i],
+                non_numeric_features=non_numeric[i],
+                as_codes=as_codes,
+            )
+            for i in range(len(feature_maps))
+        ]
+        if art.proxy_rule is not None:
+            rule_scores = art.proxy_rule.score_feature_maps(feature_maps)
+            for r, score in zip(results, rule_scores.tolist()):
+                r["prediction"]["rule_proxy_score"] = score
+                r["prediction"]["rule_proxy_label"] = int(score >= art.proxy_rule.threshold)
+
+        for i, (r, cached) in enumerate(zip(results, from_cache.tolist())):
+            r["model_info"]["route"] = route
+            r["model_info"]["from_cache"] = cached
+            r["model_info"]["explain_mode"] = explain_mode
+            if contributions is not None:
+                r["contributions"] = contributions[i]
+        return results
+
+    def _score_cached(self, art: FusionArtifacts, x: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        _score_matrix with the prediction cache in front: only rows not seen
+        recently (same bytes, same version) reach the model.
+        """
+        n = x.shape[0]
+        if not self.cache.enabled:
+            base_probs, cal_probs = self._score_matrix(art, x)
+            return base_probs, cal_probs, np.zeros(n, dtype=bool)
 
-       # Platt calibration (expects shape [n_samples, 1])
-        cal_prob = float(art.calibrator.predict_proba(np.array([[base_prob]], dtype=np.float32))[0, 1])
+        keys = [row_key(art.version_dir, row) for row in x]
+        cached = self.cache.get_many(keys)
+        from_cache = np.fromiter((c is not None for c in cached), dtype=bool, count=n)
 
-       # Label based on calibrated probability
-        label = int(cal_prob >= art.threshold)
+        base_probs = np.empty(n, dtype=np.float64)
+        cal_probs = np.empty(n, dtype=np.float64)
+        for i in np.flatnonzero(from_cache):
+            base_probs[i], cal_probs[i] = cached[i]
 
-       # NEW: explanation layer
-        exp = generate_explanations_and_actions(
-             feature_map=feature_map,
-        prob=cal_prob,
-        threshold=art.threshold,
-        label=label,
-    )
+        miss = np.flatnonzero(~from_cache)
+        if miss.size:
+            miss_base, miss_cal = self._score_matrix(art, x[miss])
+            base_probs[miss] = miss_base
+            cal_probs[miss] = miss_cal
+            self.cache.put_many([keys[i] for i in miss], miss_base, miss_cal)
 
+        return base_probs, cal_probs, from_cache
+
+    @staticmethod
+    def _score_matrix(art: FusionArtifacts, x: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # Base model probability
+        base_probs = art.model.predict_proba(x)[:, 1]
+
+        # Platt calibration (expects shape [n_samples, 1])
+        cal_probs = art.calibrator.predict_proba(base_probs.reshape(-1, 1).astype(np.float32))[:, 1]
+        return base_probs, cal_probs
+
+    @staticmethod
+    def _explain(
+        feature_maps: List[Dict[str, Any]],
+        cal_probs: np.ndarray,
+        labels: np.ndarray,
+        threshold: float,
+        as_codes: bool = False,
+    ) -> List[Dict[str, Any]]:
+        # Explanation layer: columnar engine for batches, scalar engine for single items
+        if len(feature_maps) >= _BATCH_EXPLAIN_MIN_ROWS:
+            return generate_explanations_and_actions_batch(feature_maps, cal_probs, threshold, labels, as_codes=as_codes)
+        exps = [
+            generate_explanation_codes(
+                feature_map=fm,
+                prob=float(cal_probs[i]),
+                threshold=threshold,
+                label=int(labels[i]),
+            )
+            for i, fm in enumerate(feature_maps)
+        ]
+        return exps if as_codes else [render_codes(exp) for exp in exps]
+
+    def _build_result(
+        self,
+        art: FusionArtifacts,
+        exp: Dict[str, Any],
+        base_prob: float,
+        cal_prob: float,
+        label: int,
+        missing_features: List[str],
+        non_numeric_features: List[str],
+        as_codes: bool = False,
+    ) -> Dict[str, Any]:
+        if as_codes:
+            # Compact shape: codes plus template_version; free-text warnings stay text
+            explanations = {
+                "explanation_codes": exp["explanations"],
+                "action_codes": exp["recommended_actions"],
+                "warning_codes": exp["warnings"],
+                "warnings": self._build_warnings(missing_features, non_numeric_features),
+                "template_version": TEMPLATE_VERSION,
+            }
+        else:
+            explanations = {
+                "explanations": exp["explanations"],
+                "recommended_actions": exp["recommended_actions"],
+                "warnings": exp["warnings"] + self._build_warnings(missing_features, non_numeric_features),
+            }
         return {
             "status": "ok",
             "prediction": {
@@ -115,49 +561,23 @@ class FusionInferenceService:
                 "risk_band": exp["risk_band"],  # <- now consistent with threshold
                 "base_model_probability": base_prob,
             },
-            "explanations": exp["explanations"],
-            "recommended_actions": exp["recommended_actions"],
-            "warnings": exp["warnings"] + self._build_warnings(missing_features, non_numeric_features),
+            **explanations,
             "model_info": {
                 "fusion_model_version": os.path.basename(art.version_dir.rstrip("\\/")),
                 "artifacts_path": art.version_dir,
                 "label_type": art.label_type,
                 "calibrated": True,
+                "model_backend": art.backend,
                 "n_features_expected": len(art.feature_names),
-       },
+            },
         }
+
     @staticmethod
     def _latest_version_dir(root: str) -> Optional[str]:
         candidates = sorted(glob.glob(os.path.join(root, "*")))
         candidates = [c for c in candidates if os.path.isdir(c)]
         return candidates[-1] if candidates else None
 
-    @staticmethod
-    def _build_feature_row(feature_map: Dict[str, Any], ordered_features: List[str]) -> tuple[np.ndarray, List[str], List[str]]:
-        values: List[float] = []
-        missing_features: List[str] = []
-        non_numeric_features: List[str] = []
-
-        for f in ordered_features:
-            if f not in feature_map:
-                values.append(0.0)
-                missing_features.append(f)
-                continue
-
-            v = feature_map[f]
-            try:
-                if v is None:
-                    values.append(0.0)
-                else:
-                    values.append(float(v))
-            except (TypeError, ValueError):
-                values.append(0.0)
-                non_numeric_features.append(f)
-
-        arr = np.array(values, dtype=np.float32).reshape(1, -1)
-        arr = np.nan_to_num(arr, nan=0.0, posinf=0.0, neginf=0.0)
-        return arr, missing_features, non_numeric_features
-
     @staticmethod
     def _build_warnings(missing_features: List[str], non_numeric_features: List[str]) -> List[str]:
         warnings = []
@@ -178,4 +598,59 @@ class FusionInferenceService:
             return "high"
         if prob >= max(threshold * 0.75, 0.40):
             return "moderate"
-        return "low"
\ No newline at end of file
+        return "low"
+
+
+# Per-process service cache used by the process-pool executor: one entry per
+# version (champion + canary), least recently used first
+_PROCESS_SERVICES: "OrderedDict[str, FusionInferenceService]" = OrderedDict()
+_PROCESS_SERVICES_MAX = 3
+_PROCESS_LIVE: Tuple[str, ...] = ()
+
+
+def _process_predict(
+    version_dir: str,
+    live_versions: Tuple[str, ...],
+    nthread: int,
+    model_backend: str,
+    cache_config: Tuple[int, float],
+    feature_maps: List[Dict[str, Any]],
+    waveforms: Optional[List[Optional[np.ndarray]]],
+    explain: str = "rules",
+    busy: bool = False,
+    as_codes: bool = False,
+) -> Tuple[List[Dict[str, Any]], Tuple[int, int, int]]:
+    """
+    Scores one request in a pool worker. Returns the results and this call's
+    (hits, misses, evictions) on the worker's prediction cache, so the parent
+    can aggregate cache stats across workers.
+    """
+    global _PROCESS_LIVE
+    live_versions = tuple(live_versions)
+    if live_versions != _PROCESS_LIVE:
+        # Registry reload (champion hot-swap or canary change): drop versions
+        # it no longer routes to; alternating champion / canary calls keep both
+        for stale in [v for v in _PROCESS_SERVICES if v not in live_versions]:
+            del _PROCESS_SERVICES[stale]
+        _PROCESS_LIVE = live_versions
+
+    svc = _PROCESS_SERVICES.get(version_dir)
+    if svc is None:
+        svc = FusionInferenceService(
+            artifacts_root=os.path.dirname(version_dir),
+            nthread=nthread,
+            model_backend=model_backend,
+            cache_max_entries=cache_config[0],
+            cache_ttl_s=cache_config[1],
+        )
+        svc.load(version_dir)
+        _PROCESS_SERVICES[version_dir] = svc
+        while len(_PROCESS_SERVICES) > _PROCESS_SERVICES_MAX:
+            _PROCESS_SERVICES.popitem(last=False)
+    else:
+        _PROCESS_SERVICES.move_to_end(version_dir)
+    # Load is measured in the parent; the worker's own executor is idle
+    before = svc.cache.counts()
+    results = svc.predict_from_feature_maps(feature_maps, waveforms, explain=explain, busy=busy, as_codes=as_codes)
+    after = svc.cache.counts()
+    return results, (after[0] - before[0], after[1] - before[1], after[2] - before[2])
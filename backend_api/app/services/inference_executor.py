@@ -0,0 +1,114 @@
+from __future__ import annotations
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, Optional
+
+
+class InferenceQueueFullError(RuntimeError):
+    """Raised when the executor already holds max_workers + max_queue jobs."""
+
+
+def _pin_worker_threads(nthread: int) -> None:
+    # Runs once per spawned worker, before the first job unpickles the model
+    # code and imports numpy / xgboost (this module must not import them), so
+    # their native pools start at nthread. Forked workers would inherit pools
+    # already sized by the parent, where these variables have no effect.
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(nthread)
+
+
+class InferenceExecutor:
+    """
+    Bounded pool for blocking model calls.
+
+    kind="thread" shares the loaded model across threads (the caller is expected
+    to pin the model's nthread); kind="process" gives each worker its own
+    interpreter with pinned native thread pools. At most max_workers jobs run
+    and max_queue more may wait; anything beyond that is rejected immediately.
+    """
+
+    def __init__(
+        self,
+        kind: str = "thread",
+        max_workers: Optional[int] = None,
+        max_queue: int = 32,
+        nthread: int = 1,
+    ):
+        if kind not in {"thread", "process"}:
+            raise ValueError(f"Unknown executor kind='{kind}'. Use 'thread' or 'process'.")
+        if max_queue < 0:
+            raise ValueError("max_queue must be >= 0")
+
+        cores = os.cpu_count() or 1
+        self.kind = kind
+        self.nthread = max(int(nthread), 1)
+        self.max_workers = int(max_workers) if max_workers else max(cores // self.nthread, 1)
+        self.max_queue = int(max_queue)
+        self.capacity = self.max_workers + self.max_queue
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        self._pool: Optional[Executor] = None
+
+    def start(self) -> None:
+        if self._pool is not None:
+            return
+        if self.kind == "process":
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=get_context("spawn"),
+                initializer=_pin_worker_threads,
+                initargs=(self.nthread,),
+            )
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fusion-infer")
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Runs fn(*args) on the pool and awaits the result.
+        Raises InferenceQueueFullError when saturated.
+        """
+        if self._pool is None:
+            self.start()
+
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self._rejected += 1
+                raise InferenceQueueFullError(
+                    f"Inference queue is full ({self._in_flight}/{self.capacity} jobs in flight)"
+                )
+            self._in_flight += 1
+
+        try:
+            fut = self._pool.submit(fn, *args)
+        except Exception:
+            self._release()
+            raise
+
+        # Release the slot when the job finishes, even if the awaiting request is cancelled
+        fut.add_done_callback(lambda _: self._release())
+        return await asyncio.wrap_future(fut)
+
+    def _release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "nthread": self.nthread,
+                "in_flight": self._in_flight,
+                "rejected": self._rejected,
+            }
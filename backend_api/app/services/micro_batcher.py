@@ -0,0 +1,102 @@
+from __future__ import annotations
+import asyncio
+import bisect
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+BatchFn = Callable[[List[Dict[str, Any]], List[Optional[np.ndarray]]], Awaitable[List[Dict[str, Any]]]]
+
+
+class Histogram:
+    """Fixed-bucket counter; bucket i counts values <= bounds[i], the last bucket is +inf."""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += 1
+        self.sum += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [f"le_{b:g}" for b in self.bounds] + ["le_inf"]
+        return {
+            "buckets": dict(zip(labels, self.counts)),
+            "count": self.total,
+            "mean": (self.sum / self.total) if self.total else None,
+        }
+
+
+class MicroBatcher:
+    """
+    Collects single-item predictions for up to `window_ms` or `max_batch_size`
+    items, scores them with one batch call and resolves each caller's future.
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, run_batch: BatchFn, window_ms: float = 3.0, max_batch_size: int = 32):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.run_batch = run_batch
+        self.window_s = max(float(window_ms), 0.0) / 1000.0
+        self.max_batch_size = int(max_batch_size)
+
+        self._pending: List[Tuple[Dict[str, Any], Optional[np.ndarray], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+
+        self.queue_depth = Histogram([0, 1, 2, 4, 8, 16, 32, 64])
+        self.batch_size = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+
+    async def submit(self, feature_map: Dict[str, Any], waveform: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+
+        self.queue_depth.observe(len(self._pending))
+        self._pending.append((feature_map, waveform, fut))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_s, self._flush)
+
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        self.batch_size.observe(len(batch))
+
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Dict[str, Any], Optional[np.ndarray], asyncio.Future]]) -> None:
+        try:
+            results = await self.run_batch([b[0] for b in batch], [b[1] for b in batch])
+        except Exception as e:
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        for (_, _, fut), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window_s * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "pending": len(self._pending),
+            "queue_depth": self.queue_depth.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+        }
@@ -0,0 +1,178 @@
+from __future__ import annotations
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+# (artifacts, x) -> (base_probs, cal_probs)
+ScoreFn = Callable[[Any, np.ndarray], Tuple[np.ndarray, np.ndarray]]
+
+
+class ModelRegistry:
+    """
+    Extra fusion versions served next to the champion (service.artifacts).
+
+    - canary: receives `canary_percent` of prediction calls.
+    - shadow: scored in the background on the same feature matrix as the
+      primary model; results are only logged, never returned.
+
+    Shadow work runs on one background thread with a bounded backlog, so it
+    never adds latency to the request; when the backlog is full, shadow
+    scoring for that call is dropped and counted.
+    """
+
+    def __init__(
+        self,
+        score_fn: ScoreFn,
+        shadow_log_path: Optional[str] = None,
+        max_shadow_pending: int = 64,
+        seed: Optional[int] = None,
+    ):
+        self.score_fn = score_fn
+        self.shadow_log_path = shadow_log_path
+        self.max_shadow_pending = int(max_shadow_pending)
+
+        self.canary: Optional[Any] = None
+        self.canary_percent = 0.0
+        self.shadow: Optional[Any] = None
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._shadow_pool: Optional[ThreadPoolExecutor] = None
+        self._shadow_pending = 0
+        self._stats = {
+            "routed_champion": 0,
+            "routed_canary": 0,
+            "shadow_rows": 0,
+            "shadow_dropped_calls": 0,
+            "shadow_errors": 0,
+            "shadow_label_agreement": 0,
+            "shadow_abs_diff_sum": 0.0,
+        }
+
+    def set_canary(self, art: Optional[Any], percent: float = 0.0) -> None:
+        if not (0.0 <= percent <= 100.0):
+            raise ValueError(f"canary percent must be between 0 and 100, got {percent}")
+        self.canary, self.canary_percent = art, (float(percent) if art is not None else 0.0)
+
+    def set_shadow(self, art: Optional[Any]) -> None:
+        self.shadow = art
+
+    def live_versions(self, champion: Any) -> Tuple[str, ...]:
+        """Version dirs route() can pick right now (champion first)."""
+        canary = self.canary
+        if canary is None or canary.version_dir == champion.version_dir:
+            return (champion.version_dir,)
+        return champion.version_dir, canary.version_dir
+
+    def route(self, champion: Any) -> Tuple[str, Any]:
+        """Picks the artifacts that serve this call: ("champion" | "canary", artifacts)."""
+        canary = self.canary
+        if canary is not None and self.canary_percent > 0 and self._rng.random() * 100.0 < self.canary_percent:
+            with self._lock:
+                self._stats["routed_canary"] += 1
+            return "canary", canary
+        with self._lock:
+            self._stats["routed_champion"] += 1
+        return "champion", champion
+
+    def submit_shadow(
+        self,
+        primary: Any,
+        x: Optional[np.ndarray],
+        primary_probs: np.ndarray,
+        feature_maps: List[Dict[str, Any]],
+        waveforms: Optional[List[Optional[np.ndarray]]] = None,
+    ) -> None:
+        shadow = self.shadow
+        if shadow is None or shadow is primary:
+            return
+
+        with self._lock:
+            if self._shadow_pending >= self.max_shadow_pending:
+                self._stats["shadow_dropped_calls"] += 1
+                return
+            self._shadow_pending += 1
+            if self._shadow_pool is None:
+                self._shadow_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fusion-shadow")
+
+        # Same layout -> reuse the already-built matrix (copied: callers reuse their buffers)
+        x_copy = x.copy() if (x is not None and shadow.layout is primary.layout) else None
+        self._shadow_pool.submit(
+            self._run_shadow, shadow, primary, x_copy, np.array(primary_probs, copy=True), feature_maps, waveforms
+        )
+
+    def _run_shadow(
+        self,
+        shadow: Any,
+        primary: Any,
+        x: Optional[np.ndarray],
+        primary_probs: np.ndarray,
+        feature_maps: List[Dict[str, Any]],
+        waveforms: Optional[List[Optional[np.ndarray]]],
+    ) -> None:
+        try:
+            if x is None:
+                x, _, _ = shadow.layout.fill_rows(feature_maps, waveforms=waveforms)
+            _, shadow_probs = self.score_fn(shadow, x)
+
+            primary_labels = primary_probs >= primary.threshold
+            shadow_labels = shadow_probs >= shadow.threshold
+            with self._lock:
+                self._stats["shadow_rows"] += int(len(shadow_probs))
+                self._stats["shadow_label_agreement"] += int(np.sum(primary_labels == shadow_labels))
+                self._stats["shadow_abs_diff_sum"] += float(np.sum(np.abs(shadow_probs - primary_probs)))
+
+            if self.shadow_log_path:
+                self._write_shadow_log(primary, shadow, primary_probs, shadow_probs)
+        except Exception as e:
+            with self._lock:
+                self._stats["shadow_errors"] += 1
+            print("[WARN] Shadow scoring failed:", e)
+        finally:
+            with self._lock:
+                self._shadow_pending -= 1
+
+    def _write_shadow_log(self, primary: Any, shadow: Any, primary_probs: np.ndarray, shadow_probs: np.ndarray) -> None:
+        ts = time.time()
+        primary_version = os.path.basename(primary.version_dir.rstrip("\\/"))
+        shadow_version = os.path.basename(shadow.version_dir.rstrip("\\/"))
+        os.makedirs(os.path.dirname(self.shadow_log_path) or ".", exist_ok=True)
+        with open(self.shadow_log_path, "a", encoding="utf-8") as f:
+            for p, s in zip(primary_probs.tolist(), shadow_probs.tolist()):
+                f.write(json.dumps({
+                    "ts": ts,
+                    "primary_version": primary_version,
+                    "shadow_version": shadow_version,
+                    "primary_probability": p,
+                    "shadow_probability": s,
+                    "primary_label": int(p >= primary.threshold),
+                    "shadow_label": int(s >= shadow.threshold),
+                }) + "\n")
+
+    def shutdown(self) -> None:
+        if self._shadow_pool is not None:
+            self._shadow_pool.shutdown(wait=True)
+            self._shadow_pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            st = dict(self._stats)
+            pending = self._shadow_pending
+        rows = st.pop("shadow_rows")
+        agreement = st.pop("shadow_label_agreement")
+        diff_sum = st.pop("shadow_abs_diff_sum")
+        return {
+            "canary_version": os.path.basename(self.canary.version_dir.rstrip("\\/")) if self.canary is not None else None,
+            "canary_percent": self.canary_percent,
+            "shadow_version": os.path.basename(self.shadow.version_dir.rstrip("\\/")) if self.shadow is not None else None,
+            "shadow_pending": pending,
+            "shadow_rows": rows,
+            "shadow_label_agreement_rate": (agreement / rows) if rows else None,
+            "shadow_mean_abs_prob_diff": (diff_sum / rows) if rows else None,
+            **st,
+        }
@@ -0,0 +1,53 @@
+from __future__ import annotations
+import json
+from typing import Any
+import numpy as np
+
+
+class PlattCalibrator:
+    """
+    Platt scaling from calibrator.json ({"coef": a, "intercept": b}).
+    Same output as the fitted sklearn LogisticRegression on a single feature.
+    """
+
+    def __init__(self, coef: float, intercept: float):
+        self.coef = float(coef)
+        self.intercept = float(intercept)
+
+    @classmethod
+    def from_json(cls, path: str) -> "PlattCalibrator":
+        with open(path, "r", encoding="utf-8") as f:
+            obj = json.load(f)
+        return cls(coef=obj["coef"], intercept=obj["intercept"])
+
+    def predict_proba(self, x: np.ndarray) -> np.ndarray:
+        z = self.coef * np.asarray(x, dtype=np.float64).reshape(-1) + self.intercept
+        p = 1.0 / (1.0 + np.exp(-z))
+        return np.column_stack([1.0 - p, p])
+
+
+class NativeBoosterModel:
+    """
+    Thin predict_proba wrapper around a raw xgboost Booster loaded from model.ubj.
+    Uses inplace_predict, so no DMatrix and no sklearn wrapper per request.
+    """
+
+    def __init__(self, booster: Any):
+        self.booster = booster
+
+    @classmethod
+    def load(cls, path: str, nthread: int = 1) -> "NativeBoosterModel":
+        import xgboost as xgb
+
+        booster = xgb.Booster()
+        booster.load_model(path)
+        booster.set_param({"nthread": int(nthread)})
+        return cls(booster)
+
+    def set_nthread(self, nthread: int) -> None:
+        self.booster.set_param({"nthread": int(nthread)})
+
+    def predict_proba(self, x: np.ndarray) -> np.ndarray:
+        p = np.asarray(self.booster.inplace_predict(x), dtype=np.float64).reshape(-1)
+        return np.column_stack([1.0 - p, p])
+
@@ -0,0 +1,92 @@
+from __future__ import annotations
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+
+def row_key(version_dir: str, row: np.ndarray) -> bytes:
+    """128-bit digest of the assembled float32 row, namespaced by model version."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(version_dir.encode("utf-8"))
+    h.update(np.ascontiguousarray(row, dtype=np.float32).tobytes())
+    return h.digest()
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU + TTL cache of (base_prob, cal_prob) per feature row.
+    Bounded by entry count; max_entries=0 disables caching.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl_s: float = 600.0):
+        self.max_entries = max(int(max_entries), 0)
+        self.ttl_s = float(ttl_s)
+        self._data: "OrderedDict[bytes, Tuple[float, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[Tuple[float, float]]]:
+        now = time.monotonic()
+        out: List[Optional[Tuple[float, float]]] = []
+        with self._lock:
+            for k in keys:
+                entry = self._data.get(k)
+                if entry is not None and now - entry[2] > self.ttl_s:
+                    del self._data[k]
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    out.append(None)
+                else:
+                    self._data.move_to_end(k)
+                    self.hits += 1
+                    out.append((entry[0], entry[1]))
+        return out
+
+    def put_many(self, keys: List[bytes], base_probs: np.ndarray, cal_probs: np.ndarray) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for k, b, c in zip(keys, base_probs.tolist(), cal_probs.tolist()):
+                self._data[k] = (b, c, now)
+                self._data.move_to_end(k)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def counts(self) -> Tuple[int, int, int]:
+        with self._lock:
+            return self.hits, self.misses, self.evictions
+
+    def record(self, hits: int, misses: int, evictions: int) -> None:
+        """Adds counts observed by a cache in another process (process-pool workers)."""
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.evictions += evictions
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else None,
+            }
@@ -0,0 +1,184 @@
+from __future__ import annotations
+import json
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+
+# Serve-time copy of the pph_proxy_rule_v1 kernel in
+# src/fusion_model_files/proxy_kernel.py (the pipeline package is not
+# importable from the API). Keep the two in sync.
+PROXY_INPUT_COLUMNS: List[str] = [
+    "p_anemia",
+    "hr_bpm_est",
+    "ibi_std",
+    "peak_count",
+    "ppg_amp_mean",
+    "prev_complications",
+    "hypertension_flag",
+    "diabetes_any",
+    "preexist_diabetes",
+    "gest_diabetes",
+    "systolic_bp",
+    "diastolic_bp",
+    "map_mmhg",
+    "pulse_pressure",
+    "Risk Level",
+]
+_COL = {c: i for i, c in enumerate(PROXY_INPUT_COLUMNS)}
+
+CLINICAL_FLAG_COLUMNS = ["prev_complications", "hypertension_flag", "diabetes_any", "preexist_diabetes", "gest_diabetes"]
+# (low_bad, low_ok, high_ok, high_bad)
+BP_RANGES = {
+    "systolic_bp": (70.0, 90.0, 140.0, 180.0),
+    "diastolic_bp": (40.0, 60.0, 90.0, 110.0),
+    "map_mmhg": (50.0, 65.0, 105.0, 130.0),
+}
+RISK_LEVEL_PRIOR = {"low": 0.1, "medium": 0.5, "high": 0.9}
+
+# Data-dependent min-max terms: state-file key -> (column, sign)
+MINMAX_TERMS = {
+    "ibi_std": ("ibi_std", 1.0),
+    "neg_ppg_amp_mean": ("ppg_amp_mean", -1.0),
+    "pulse_pressure": ("pulse_pressure", 1.0),
+}
+
+Bounds = Dict[str, Optional[List[float]]]
+
+
+def fit_minmax_bounds(x: np.ndarray, present: np.ndarray) -> Bounds:
+    """5-95% bounds of the min-max terms (None when a column has no values)."""
+    bounds: Bounds = {}
+    for name, (col, sign) in MINMAX_TERMS.items():
+        j = _COL[col]
+        if not present[j]:
+            continue
+        v = sign * x[:, j].astype(np.float64)
+        v = v[~np.isnan(v)]
+        bounds[name] = [float(np.quantile(v, 0.05)), float(np.quantile(v, 0.95))] if v.size else None
+    return bounds
+
+
+def _clip01(v: np.ndarray) -> np.ndarray:
+    return np.clip(v, 0.0, 1.0, out=v)
+
+
+def _nan0(v: np.ndarray) -> np.ndarray:
+    v[np.isnan(v)] = 0.0
+    return v
+
+
+def _minmax(v: np.ndarray, b: Optional[List[float]]) -> np.ndarray:
+    if b is None or b[1] <= b[0]:
+        return np.zeros_like(v)
+    return _nan0(_clip01((v - b[0]) / (b[1] - b[0] + 1e-6)))
+
+
+def _bp_extreme(v: np.ndarray, low_bad: float, low_ok: float, high_ok: float, high_bad: float) -> np.ndarray:
+    low = _clip01((low_ok - v) / (low_ok - low_bad + 1e-6))
+    high = _clip01((v - high_ok) / (high_bad - high_ok + 1e-6))
+    return _nan0(np.maximum(low, high))
+
+
+def proxy_score_kernel(x: np.ndarray, present: np.ndarray, bounds: Optional[Bounds] = None) -> np.ndarray:
+    """
+    pph_proxy_score_v1 for every row of x (columns = PROXY_INPUT_COLUMNS).
+
+    present: (n_columns,) or (n_rows, n_columns); absent columns contribute 0
+    and are left out of the clinical mean. bounds=None fits the min-max
+    terms on x itself (the original batch behaviour).
+    """
+    n = x.shape[0]
+    present = np.broadcast_to(np.asarray(present, dtype=bool), x.shape)
+    if bounds is None:
+        bounds = fit_minmax_bounds(x, present.any(axis=0))
+
+    def col(name: str) -> np.ndarray:
+        # float64 working copy of one column; absent -> NaN
+        j = _COL[name]
+        v = x[:, j].astype(np.float64)
+        v[~present[:, j]] = np.nan
+        return v
+
+    anemia = np.clip(_nan0(col("p_anemia")), 0.0, 1.0)
+
+    # Hemodynamic stress (PPG proxies)
+    hr_score = _nan0(_clip01((col("hr_bpm_est") - 90.0) / (130.0 - 90.0 + 1e-6)))
+    ibi_var = _minmax(col("ibi_std"), bounds.get("ibi_std"))
+    peak_penalty = _clip01((3.0 - _nan0(col("peak_count"))) / 3.0)
+    peak_penalty[~present[:, _COL["peak_count"]]] = 0.0
+    amp = _minmax(-col("ppg_amp_mean"), bounds.get("neg_ppg_amp_mean"))
+    hemo = np.clip(0.45 * hr_score + 0.30 * ibi_var + 0.15 * peak_penalty + 0.10 * amp, 0.0, 1.0)
+
+    # Clinical burden: mean over the terms whose column exists
+    clin_sum = np.zeros(n, dtype=np.float64)
+    clin_k = np.zeros(n, dtype=np.float64)
+    for c in CLINICAL_FLAG_COLUMNS:
+        clin_sum += np.clip(_nan0(col(c)), 0.0, 1.0)
+        clin_k += present[:, _COL[c]]
+    for c, rng in BP_RANGES.items():
+        clin_sum += _bp_extreme(col(c), *rng)
+        clin_k += present[:, _COL[c]]
+    clin_sum += _minmax(col("pulse_pressure"), bounds.get("pulse_pressure"))
+    clin_k += present[:, _COL["pulse_pressure"]]
+    clinical = np.divide(clin_sum, clin_k, out=np.zeros(n, dtype=np.float64), where=clin_k > 0)
+
+    # Maternal risk prior
+    rl_score = _nan0(col("Risk Level"))
+
+    score = 0.35 * anemia + 0.35 * hemo + 0.25 * clinical + 0.05 * rl_score
+    return np.clip(score, 0.0, 1.0)
+
+
+def _to_input(name: str, v: Any) -> float:
+    if name == "Risk Level":
+        if isinstance(v, str):
+            return RISK_LEVEL_PRIOR.get(v.strip().lower(), np.nan)
+        return np.nan
+    try:
+        return float(v) if v is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class ProxyRule:
+    """
+    pph_proxy_rule_v1 with the bounds / threshold frozen at training time
+    (proxy_rule.json in the version folder). Scores raw request feature maps,
+    so the API can report the rule score next to the model score.
+
+    present_columns is the training table's column mask: a rule input the
+    table had counts as present for every request (a missing key is NaN,
+    contributing 0 but still in the clinical mean), and one it lacked is
+    ignored even if a request sends it. Same scores as training.
+    """
+
+    def __init__(self, bounds: Bounds, threshold: float, present_columns: Optional[List[str]] = None):
+        self.bounds = bounds
+        self.threshold = float(threshold)
+        self.present: Optional[np.ndarray] = None
+        if present_columns is not None:
+            cols = set(present_columns)
+            self.present = np.array([c in cols for c in PROXY_INPUT_COLUMNS], dtype=bool)
+
+    @classmethod
+    def from_json(cls, path: str) -> "ProxyRule":
+        with open(path, "r", encoding="utf-8") as f:
+            obj = json.load(f)
+        return cls(
+            bounds=obj.get("bounds", {}),
+            threshold=obj.get("threshold", 0.55),
+            present_columns=obj.get("present_columns"),
+        )
+
+    def score_feature_maps(self, feature_maps: Sequence[Dict[str, Any]]) -> np.ndarray:
+        n = len(feature_maps)
+        x = np.full((n, len(PROXY_INPUT_COLUMNS)), np.nan, dtype=np.float32)
+        keys = np.zeros(x.shape, dtype=bool)
+        for i, fm in enumerate(feature_maps):
+            for j, c in enumerate(PROXY_INPUT_COLUMNS):
+                if c in fm:
+                    keys[i, j] = True
+                    x[i, j] = _to_input(c, fm[c])
+        if self.present is None:
+            # proxy_rule.json written before present_columns: per-request key mask
+            return proxy_score_kernel(x, keys, self.bounds)
+        return proxy_score_kernel(x, self.present, self.bounds)
@@ -0,0 +1,163 @@
+from __future__ import annotations
+import json
+from typing import Any, Dict, List
+import numpy as np
+
+# Rows evaluated per chunk; bounds the (rows x trees) index matrices
+_CHUNK_ROWS = 4096
+
+
+class TreeEnsembleModel:
+    """
+    Dependency-light evaluator for a binary:logistic XGBoost model.
+
+    All trees are flattened into shared node arrays (feature index, threshold,
+    left/right child, leaf value). A batch is evaluated level by level: every
+    (row, tree) pair advances one node per step, and leaves point at themselves
+    so finished paths stay put. Only NumPy is needed at serve time; the model is
+    read from XGBoost's JSON model format (booster.save_model("model.json")).
+    """
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        default_left: np.ndarray,
+        value: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+        base_margin: float,
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.base_margin = float(base_margin)
+
+    @property
+    def n_trees(self) -> int:
+        return int(self.roots.shape[0])
+
+    @classmethod
+    def load(cls, path: str) -> "TreeEnsembleModel":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_xgboost_json(json.load(f))
+
+    @classmethod
+    def from_xgboost_json(cls, model_obj: Dict[str, Any]) -> "TreeEnsembleModel":
+        learner = model_obj["learner"]
+        objective = learner["objective"]["name"]
+        if objective not in {"binary:logistic", "reg:logistic"}:
+            raise ValueError(f"Unsupported objective '{objective}' for TreeEnsembleModel.")
+
+        booster = learner["gradient_booster"]
+        if booster.get("name", "gbtree") != "gbtree":
+            raise ValueError(f"Unsupported booster '{booster.get('name')}'. Only gbtree is supported.")
+        trees = booster["model"]["trees"]
+
+        feature: List[np.ndarray] = []
+        threshold: List[np.ndarray] = []
+        left: List[np.ndarray] = []
+        right: List[np.ndarray] = []
+        default_left: List[np.ndarray] = []
+        value: List[np.ndarray] = []
+        roots: List[int] = []
+        max_depth = 0
+        offset = 0
+
+        for tree in trees:
+            lc = np.asarray(tree["left_children"], dtype=np.int64)
+            rc = np.asarray(tree["right_children"], dtype=np.int64)
+            n_nodes = lc.shape[0]
+            node_ids = np.arange(n_nodes, dtype=np.int64)
+            is_leaf = lc == -1
+
+            # Leaves loop back to themselves so extra traversal steps are no-ops
+            lc = np.where(is_leaf, node_ids, lc) + offset
+            rc = np.where(is_leaf, node_ids, rc) + offset
+
+            cond = np.asarray(tree["split_conditions"], dtype=np.float32)
+            feature.append(np.where(is_leaf, 0, np.asarray(tree["split_indices"], dtype=np.int64)))
+            threshold.append(cond)
+            left.append(lc)
+            right.append(rc)
+            default_left.append(np.asarray(tree["default_left"], dtype=bool))
+            # For leaf nodes XGBoost stores the leaf value in split_conditions
+            value.append(np.where(is_leaf, cond, np.float32(0.0)))
+            roots.append(offset)
+
+            max_depth = max(max_depth, _tree_depth(tree["left_children"], tree["right_children"]))
+            offset += n_nodes
+
+        # base_score is stored in probability space for logistic objectives
+        base_score = _parse_base_score(learner["learner_model_param"]["base_score"])
+        base_margin = float(np.log(base_score / (1.0 - base_score)))
+
+        return cls(
+            feature=np.concatenate(feature).astype(np.intp),
+            threshold=np.concatenate(threshold),
+            left=np.concatenate(left).astype(np.intp),
+            right=np.concatenate(right).astype(np.intp),
+            default_left=np.concatenate(default_left),
+            value=np.concatenate(value),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            base_margin=base_margin,
+        )
+
+    def predict_margin(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        if x.ndim != 2:
+            raise ValueError(f"Expected a 2D feature matrix, got shape {x.shape}")
+
+        out = np.empty(x.shape[0], dtype=np.float64)
+        for start in range(0, x.shape[0], _CHUNK_ROWS):
+            chunk = x[start:start + _CHUNK_ROWS]
+            out[start:start + chunk.shape[0]] = self._margin_chunk(chunk)
+        return out
+
+    def _margin_chunk(self, x: np.ndarray) -> np.ndarray:
+        n = x.shape[0]
+        rows = np.arange(n)[:, None]
+        node = np.broadcast_to(self.roots, (n, self.roots.shape[0])).copy()
+
+        for _ in range(self.max_depth):
+            xv = x[rows, self.feature[node]]
+            go_left = xv < self.threshold[node]
+            missing = np.isnan(xv)
+            if missing.any():
+                go_left = np.where(missing, self.default_left[node], go_left)
+            node = np.where(go_left, self.left[node], self.right[node])
+
+        return self.value[node].sum(axis=1, dtype=np.float64) + self.base_margin
+
+    def predict_proba(self, x: np.ndarray) -> np.ndarray:
+        margin = self.predict_margin(x)
+        p = 1.0 / (1.0 + np.exp(-margin))
+        return np.column_stack([1.0 - p, p])
+
+
+def _parse_base_score(raw: Any) -> float:
+    # XGBoost >= 3.1 stores a vector like "[5E-1]"; older versions a scalar string
+    if isinstance(raw, str):
+        raw = raw.strip().strip("[]").split(",")[0]
+    return float(raw)
+
+
+def _tree_depth(left_children: List[int], right_children: List[int]) -> int:
+    depth = 0
+    stack = [(0, 0)]
+    while stack:
+        nid, d = stack.pop()
+        if left_children[nid] == -1:
+            depth = max(depth, d)
+            continue
+        stack.append((left_children[nid], d + 1))
+        stack.append((right_children[nid], d + 1))
+    return depth
@@ -0,0 +1,40 @@
+from __future__ import annotations
+from typing import List, Optional
+import numpy as np
+
+# Serving side of the waveform PCA fitted by
+# src/fusion_model_files/feature_selection.py (keep the transform in sync).
+# features.json: "waveform_pca": {"file", "features", "n_samples", ...}
+
+
+class WaveformProjection:
+    """Projects raw PPG samples onto the principal components the model was trained on."""
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, feature_names: List[str]):
+        self.mean = np.ascontiguousarray(mean, dtype=np.float32)
+        # Stored transposed: (n_samples, n_components) for a single matmul
+        self.components_t = np.ascontiguousarray(np.asarray(components, dtype=np.float32).T)
+        self.feature_names = list(feature_names)
+        self.n_samples = int(self.mean.shape[0])
+        self.n_components = int(self.components_t.shape[1])
+        if self.components_t.shape[0] != self.n_samples or self.n_components != len(self.feature_names):
+            raise ValueError("Waveform PCA: mean / components / feature names do not match.")
+
+    @classmethod
+    def load(cls, path: str, feature_names: List[str]) -> "WaveformProjection":
+        with np.load(path, allow_pickle=False) as z:
+            return cls(z["mean"], z["components"], feature_names)
+
+    def transform(self, samples: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        (n_rows, n_samples) or (n_samples,) -> component scores.
+        Missing / non-finite samples count as 0.0, as in training.
+        """
+        samples = np.nan_to_num(np.asarray(samples, dtype=np.float32), nan=0.0, posinf=0.0, neginf=0.0)
+        if samples.shape[-1] != self.n_samples:
+            raise ValueError(f"Expected {self.n_samples} waveform samples, got {samples.shape[-1]}.")
+        scores = (samples - self.mean) @ self.components_t
+        if out is None:
+            return scores
+        out[...] = scores
+        return out
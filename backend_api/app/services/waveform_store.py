@@ -0,0 +1,48 @@
+from __future__ import annotations
+import json
+import os
+from typing import Optional
+import numpy as np
+
+# Read side of the store written by src/fusion_model_files/waveform_store.py:
+#   samples.f32 (n_rows x n_samples float32), row_ids.npy, meta.json
+STORE_FORMAT = "fusion_waveform_store_v1"
+
+
+class WaveformStore:
+    """Memory-mapped raw PPG samples looked up by row_id (read-only)."""
+
+    def __init__(self, root: str):
+        with open(os.path.join(root, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != STORE_FORMAT:
+            raise ValueError(f"Unsupported waveform store format in {root}: {meta.get('format')}")
+
+        self.n_rows = int(meta["n_rows"])
+        self.n_samples = int(meta["n_samples"])
+        self.samples = np.memmap(
+            os.path.join(root, "samples.f32"),
+            dtype=meta["dtype"],
+            mode="r",
+            shape=(self.n_rows, self.n_samples),
+        )
+        row_ids = np.load(os.path.join(root, "row_ids.npy"))
+        self._order = np.argsort(row_ids, kind="stable")
+        self._sorted_ids = row_ids[self._order]
+
+    def take(self, row_ids: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Samples for row_ids written into `out` (e.g. the waveform column block
+        of a feature matrix). Unknown row_ids get 0.0, like missing features.
+        """
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        if out is None:
+            out = np.empty((row_ids.shape[0], self.n_samples), dtype=np.float32)
+        if self.n_rows == 0:
+            out[:] = 0.0
+            return out
+        i = np.minimum(np.searchsorted(self._sorted_ids, row_ids), self.n_rows - 1)
+        ok = self._sorted_ids[i] == row_ids
+        out[ok] = self.samples[self._order[i[ok]]]
+        out[~ok] = 0.0
+        return out
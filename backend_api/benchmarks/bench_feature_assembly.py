@@ -0,0 +1,105 @@
+"""
+Microbenchmark: per-feature Python loop vs precompiled FeatureLayout.
+
+Run from backend_api/:
+    python -m benchmarks.bench_feature_assembly
+"""
+from __future__ import annotations
+import argparse
+import glob
+import json
+import os
+import time
+from typing import Any, Dict, List
+import numpy as np
+from app.services.feature_layout import FeatureLayout
+
+
+def _legacy_build_feature_row(feature_map: Dict[str, Any], ordered_features: List[str]):
+    # Copy of the original FusionInferenceService._build_feature_row
+    values: List[float] = []
+    missing_features: List[str] = []
+    non_numeric_features: List[str] = []
+
+    for f in ordered_features:
+        if f not in feature_map:
+            values.append(0.0)
+            missing_features.append(f)
+            continue
+
+        v = feature_map[f]
+        try:
+            if v is None:
+                values.append(0.0)
+            else:
+                values.append(float(v))
+        except (TypeError, ValueError):
+            values.append(0.0)
+            non_numeric_features.append(f)
+
+    arr = np.array(values, dtype=np.float32).reshape(1, -1)
+    arr = np.nan_to_num(arr, nan=0.0, posinf=0.0, neginf=0.0)
+    return arr, missing_features, non_numeric_features
+
+
+def _load_feature_names(artifacts_root: str, n_synthetic: int) -> List[str]:
+    versions = sorted(d for d in glob.glob(os.path.join(artifacts_root, "*")) if os.path.isdir(d))
+    if versions:
+        path = os.path.join(versions[-1], "features.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                obj = json.load(f)
+            return obj.get("features", []) if isinstance(obj, dict) else obj
+    return [f"f_{i}" for i in range(n_synthetic)]
+
+
+def _timeit(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fusion feature-row assembly.")
+    parser.add_argument("--artifacts-root", default="../models_artifacts/fusion_pph_proxy")
+    parser.add_argument("--n-features", type=int, default=2122, help="Used when no features.json is found.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    names = _load_feature_names(args.artifacts_root, args.n_features)
+    rng = np.random.default_rng(0)
+    layout = FeatureLayout(names)
+
+    print(f"features={len(names)}")
+    print(f"{'keys':>8} {'rows':>6} {'legacy_ms':>12} {'layout_ms':>12} {'speedup':>8}")
+
+    # fixed: every row sends the same keys (a client with one schema), 1% of
+    # the features never sent; varying: ~1% dropped at random per row, so
+    # every row has its own key set (no key-column cache hits)
+    fixed_keys = [k for k in names if rng.random() > 0.01]
+    for scenario in ("fixed", "varying"):
+        for n_rows in (1, 64, 1024):
+            maps = []
+            for _ in range(n_rows):
+                vals = rng.normal(size=len(names)).tolist()
+                if scenario == "fixed":
+                    row = dict(zip(names, vals))
+                    maps.append({k: row[k] for k in fixed_keys})
+                else:
+                    maps.append({k: v for k, v in zip(names, vals) if rng.random() > 0.01})
+
+            # Sanity: identical output
+            x_new, miss_new, _ = layout.fill_rows(maps)
+            for i in range(min(n_rows, 8)):
+                x_old, miss_old, _ = _legacy_build_feature_row(maps[i], names)
+                assert np.array_equal(x_new[i:i + 1], x_old) and miss_new[i] == miss_old
+
+            t_old = _timeit(lambda: np.vstack([_legacy_build_feature_row(m, names)[0] for m in maps]), args.repeat)
+            t_new = _timeit(lambda: layout.fill_rows(maps, out=layout.buffer(n_rows)), args.repeat)
+            print(f"{scenario:>8} {n_rows:>6} {t_old * 1e3:>12.3f} {t_new * 1e3:>12.3f} {t_old / max(t_new, 1e-12):>7.1f}x")
+
+if __name__ == "__main__":
+    main()
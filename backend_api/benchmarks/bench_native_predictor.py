@@ -0,0 +1,103 @@
+"""
+Benchmark: joblib/sklearn serving path vs native UBJSON booster + NumPy Platt.
+
+Measures cold start (fresh interpreter: imports + artifact load) and
+per-row latency at a few batch sizes. If the latest version has no
+model.ubj / calibrator.json, they are exported from model.pkl into a temp dir.
+
+Run from backend_api/:
+    python -m benchmarks.bench_native_predictor
+"""
+from __future__ import annotations
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+_COLD_START = """
+import time
+t0 = time.perf_counter()
+from app.services.fusion_inference_service import FusionInferenceService
+svc = FusionInferenceService(artifacts_root={root!r}, model_backend={backend!r})
+svc.load({version_dir!r})
+print(time.perf_counter() - t0)
+"""
+
+
+def _ensure_native_export(version_dir: str) -> str:
+    if all(os.path.exists(os.path.join(version_dir, n)) for n in ("model.ubj", "calibrator.json")):
+        return version_dir
+
+    import joblib
+
+    tmp_dir = os.path.join(tempfile.mkdtemp(prefix="fusion_native_"), os.path.basename(version_dir))
+    shutil.copytree(version_dir, tmp_dir)
+    model = joblib.load(os.path.join(tmp_dir, "model.pkl"))
+    calibrator = joblib.load(os.path.join(tmp_dir, "calibrator.pkl"))
+    model.get_booster().save_model(os.path.join(tmp_dir, "model.ubj"))
+    with open(os.path.join(tmp_dir, "calibrator.json"), "w", encoding="utf-8") as f:
+        json.dump({"coef": float(np.ravel(calibrator.coef_)[0]), "intercept": float(np.ravel(calibrator.intercept_)[0])}, f)
+    return tmp_dir
+
+
+def _cold_start(version_dir: str, backend: str, repeat: int) -> float:
+    code = _COLD_START.format(root=os.path.dirname(version_dir), backend=backend, version_dir=version_dir)
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return min(times)
+
+
+def main():
+    from app.services.fusion_inference_service import FusionInferenceService
+
+    parser = argparse.ArgumentParser(description="Benchmark native vs sklearn fusion serving path.")
+    parser.add_argument("--artifacts-root", default="../models_artifacts/fusion_pph_proxy")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--iters", type=int, default=200)
+    args = parser.parse_args()
+
+    versions = sorted(d for d in glob.glob(os.path.join(args.artifacts_root, "*")) if os.path.isdir(d))
+    if not versions:
+        raise FileNotFoundError(f"No artifact versions found in: {args.artifacts_root}")
+    version_dir = _ensure_native_export(versions[-1])
+
+    print("Cold start (s, best of %d):" % args.repeat)
+    for backend in ("sklearn", "native"):
+        print(f"  {backend:>8}: {_cold_start(version_dir, backend, args.repeat):.3f}")
+
+    services = {}
+    for backend in ("sklearn", "native"):
+        svc = FusionInferenceService(artifacts_root=os.path.dirname(version_dir), model_backend=backend)
+        svc.load(version_dir)
+        services[backend] = svc
+
+    rng = np.random.default_rng(0)
+    n_features = len(services["native"].artifacts.feature_names)
+
+    print("Per-row scoring latency (model + calibrator, us/row):")
+    print(f"{'batch':>6} {'sklearn':>10} {'native':>10} {'max_abs_diff':>14}")
+    for batch in (1, 64, 1024):
+        x = rng.normal(size=(batch, n_features)).astype(np.float32)
+        row = {}
+        probs = {}
+        for backend, svc in services.items():
+            art = svc.artifacts
+            iters = max(args.iters // batch, 5)
+            t0 = time.perf_counter()
+            for _ in range(iters):
+                _, probs[backend] = svc._score_matrix(art, x)
+            row[backend] = (time.perf_counter() - t0) / (iters * batch) * 1e6
+        diff = float(np.max(np.abs(probs["sklearn"] - probs["native"])))
+        print(f"{batch:>6} {row['sklearn']:>10.2f} {row['native']:>10.2f} {diff:>14.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark: pure-NumPy TreeEnsembleModel vs native XGBoost booster.
+
+Checks parity against XGBClassifier.predict_proba (max abs diff) and
+reports per-batch latency for batch sizes 1 to 10k. Uses model.json from
+the latest artifact version, exporting it from model.pkl if missing.
+
+Run from backend_api/:
+    python -m benchmarks.bench_tree_ensemble
+"""
+from __future__ import annotations
+import argparse
+import glob
+import os
+import tempfile
+import time
+import joblib
+import numpy as np
+from app.services.tree_ensemble import TreeEnsembleModel
+
+
+def _timeit(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark NumPy tree evaluator against XGBoost.")
+    parser.add_argument("--artifacts-root", default="../models_artifacts/fusion_pph_proxy")
+    parser.add_argument("--nthread", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    versions = sorted(d for d in glob.glob(os.path.join(args.artifacts_root, "*")) if os.path.isdir(d))
+    if not versions:
+        raise FileNotFoundError(f"No artifact versions found in: {args.artifacts_root}")
+    version_dir = versions[-1]
+
+    clf = joblib.load(os.path.join(version_dir, "model.pkl"))
+    clf.set_params(n_jobs=args.nthread)
+    booster = clf.get_booster()
+
+    json_path = os.path.join(version_dir, "model.json")
+    if not os.path.exists(json_path):
+        json_path = os.path.join(tempfile.mkdtemp(prefix="fusion_trees_"), "model.json")
+        booster.save_model(json_path)
+
+    t0 = time.perf_counter()
+    ens = TreeEnsembleModel.load(json_path)
+    print(f"Loaded {ens.n_trees} trees (max depth {ens.max_depth}) in {time.perf_counter() - t0:.3f}s")
+
+    rng = np.random.default_rng(0)
+    n_features = int(booster.num_features())
+
+    # Sample around real split thresholds so paths are not degenerate
+    x_all = rng.choice(ens.threshold, size=(10_000, n_features)).astype(np.float32)
+    x_all += rng.normal(scale=0.01, size=x_all.shape).astype(np.float32)
+
+    p_ref = clf.predict_proba(x_all)[:, 1]
+    p_new = ens.predict_proba(x_all)[:, 1]
+    max_diff = float(np.max(np.abs(p_ref - p_new)))
+    print(f"Parity vs XGBClassifier.predict_proba: max |diff| = {max_diff:.2e} ({'OK' if max_diff <= 1e-6 else 'FAIL'})")
+
+    print(f"{'batch':>6} {'xgboost_ms':>12} {'numpy_ms':>10} {'ratio':>7}")
+    for batch in (1, 10, 100, 1_000, 10_000):
+        x = x_all[:batch]
+        t_xgb = _timeit(lambda: booster.inplace_predict(x), args.repeat)
+        t_np = _timeit(lambda: ens.predict_proba(x), args.repeat)
+        print(f"{batch:>6} {t_xgb * 1e3:>12.3f} {t_np * 1e3:>10.3f} {t_np / max(t_xgb, 1e-12):>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
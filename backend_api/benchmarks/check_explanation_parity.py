@@ -0,0 +1,108 @@
+"""
+Parity check: columnar explanation engine vs scalar generate_explanations_and_actions.
+
+Generates randomized feature maps that sit on and around every rule boundary
+(plus missing / None / non-numeric / NaN values), then compares every row's
+risk band, explanations, actions and warnings, both as sentences and as
+template codes (the compact response path). Exits non-zero on any mismatch
+and reports the speedup.
+
+Run from backend_api/:
+    python -m benchmarks.check_explanation_parity
+"""
+from __future__ import annotations
+import argparse
+import sys
+import time
+import numpy as np
+from app.services.explanation_engine import (
+    generate_explanation_codes,
+    generate_explanations_and_actions,
+    generate_explanations_and_actions_batch,
+)
+
+# Values on and around each rule threshold
+_EDGE_VALUES = {
+    "p_anemia": [0.0, 0.39, 0.40, 0.41, 0.69, 0.70, 0.71, 1.0],
+    "systolic_bp": [0, 60, 89, 90, 91, 120, 139, 140, 141, 180],
+    "diastolic_bp": [0, 40, 59, 60, 61, 80, 89, 90, 91, 110],
+    "prev_complications": [0, 1, 1.5, 2, 0.99],
+    "hr_bpm_est": [0, 80, 94.9, 95, 100, 109.9, 110, 140],
+    "signal_quality": [-1, 0.0, 0.3, 0.59, 0.60, 0.9],
+}
+_ODD_VALUES = [None, "abc", float("nan"), "0.75"]
+
+
+def _random_maps(n: int, rng: np.random.Generator) -> list:
+    maps = []
+    for _ in range(n):
+        fm = {}
+        for name, edges in _EDGE_VALUES.items():
+            r = rng.random()
+            if r < 0.08:
+                continue  # missing
+            if r < 0.14:
+                fm[name] = _ODD_VALUES[rng.integers(len(_ODD_VALUES))]
+            elif r < 0.6:
+                fm[name] = edges[rng.integers(len(edges))]
+            else:
+                lo, hi = min(edges), max(edges)
+                fm[name] = float(rng.uniform(lo - 5, hi + 5))
+        maps.append(fm)
+    return maps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check columnar vs scalar explanation engine parity.")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    maps = _random_maps(args.rows, rng)
+    thresholds = rng.choice([0.05, 0.11888888888888888, 0.3, 0.5, 0.8], size=args.rows)
+    probs = rng.random(args.rows)
+    # A share of rows exactly on the low/moderate band edge
+    on_edge = rng.random(args.rows) < 0.2
+    probs[on_edge] = thresholds[on_edge]
+
+    mismatches = 0
+    t_scalar = 0.0
+    t_batch = 0.0
+    for thr in np.unique(thresholds):
+        idx = np.flatnonzero(thresholds == thr)
+        sub_maps = [maps[i] for i in idx]
+        sub_probs = probs[idx]
+        labels = (sub_probs >= thr).astype(int)
+
+        t0 = time.perf_counter()
+        scalar = [
+            generate_explanations_and_actions(feature_map=fm, prob=float(p), threshold=float(thr), label=int(lb))
+            for fm, p, lb in zip(sub_maps, sub_probs, labels)
+        ]
+        t_scalar += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        batch = generate_explanations_and_actions_batch(sub_maps, sub_probs, float(thr), labels)
+        t_batch += time.perf_counter() - t0
+
+        scalar_codes = [
+            generate_explanation_codes(feature_map=fm, prob=float(p), threshold=float(thr), label=int(lb))
+            for fm, p, lb in zip(sub_maps, sub_probs, labels)
+        ]
+        batch_codes = generate_explanations_and_actions_batch(sub_maps, sub_probs, float(thr), labels, as_codes=True)
+
+        for i, (a, b) in enumerate(zip(scalar + scalar_codes, batch + batch_codes)):
+            i %= len(sub_maps)
+            if a != b:
+                mismatches += 1
+                if mismatches <= 5:
+                    print("MISMATCH", sub_maps[i], float(sub_probs[i]), float(thr), a, b, sep="\n  ")
+
+    print(f"rows={args.rows} mismatches={mismatches}")
+    print(f"scalar={t_scalar:.3f}s columnar={t_batch:.3f}s speedup={t_scalar / max(t_batch, 1e-12):.1f}x")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
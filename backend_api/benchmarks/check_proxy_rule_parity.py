@@ -0,0 +1,98 @@
+"""
+Parity check: serve-time ProxyRule vs the training kernel (proxy_kernel.py).
+
+Builds a reference table that lacks some rule inputs, fits the bounds and
+column mask on it, then scores every row twice: with the pipeline kernel on
+the table, and with ProxyRule on per-request feature maps whose NaN cells
+are dropped keys (plus stray keys for the columns training never had).
+Exits non-zero on any mismatch.
+
+Run from backend_api/ (imports the pipeline package from the repo root):
+    python -m benchmarks.check_proxy_rule_parity
+"""
+from __future__ import annotations
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.services.proxy_rule import ProxyRule  # noqa: E402
+from src.fusion_model_files.proxy_kernel import (  # noqa: E402
+    PROXY_INPUT_COLUMNS,
+    fit_minmax_bounds,
+    proxy_input_matrix,
+    proxy_score_kernel,
+)
+
+# Rule inputs the reference table does not have
+ABSENT_AT_TRAINING = ["map_mmhg", "gest_diabetes"]
+
+
+def make_table(n: int, rng: np.random.Generator, missing_rate: float) -> pd.DataFrame:
+    df = pd.DataFrame({
+        "p_anemia": rng.random(n),
+        "hr_bpm_est": rng.normal(95, 20, n),
+        "ibi_std": rng.gamma(2.0, 0.05, n),
+        "peak_count": rng.integers(0, 8, n).astype(float),
+        "ppg_amp_mean": rng.normal(1.0, 0.3, n),
+        "prev_complications": rng.integers(0, 2, n).astype(float),
+        "hypertension_flag": rng.integers(0, 2, n).astype(float),
+        "diabetes_any": rng.integers(0, 2, n).astype(float),
+        "preexist_diabetes": rng.integers(0, 2, n).astype(float),
+        "systolic_bp": rng.normal(120, 25, n),
+        "diastolic_bp": rng.normal(78, 15, n),
+        "pulse_pressure": rng.normal(45, 12, n),
+        "Risk Level": rng.choice(["low", "medium", "high", "unknown"], n),
+    })
+    for c in df.columns:
+        hole = rng.random(n) < missing_rate
+        df[c] = df[c].mask(hole)
+    return df
+
+
+def to_feature_maps(df: pd.DataFrame, rng: np.random.Generator) -> list:
+    maps = []
+    for rec in df.to_dict(orient="records"):
+        # A NaN cell in the table is a key the request left out
+        fm = {k: v for k, v in rec.items() if not (v is None or (isinstance(v, float) and np.isnan(v)))}
+        # Keys the training table never had must not change the score
+        for c in ABSENT_AT_TRAINING:
+            if rng.random() < 0.5:
+                fm[c] = float(rng.normal(100, 30))
+        maps.append(fm)
+    return maps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ProxyRule (serving) vs proxy_score_kernel (training).")
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--missing-rate", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    df = make_table(args.rows, rng, args.missing_rate)
+
+    x, present = proxy_input_matrix(df)
+    bounds = fit_minmax_bounds(x, present)
+    expected = proxy_score_kernel(x, present, bounds)
+
+    rule = ProxyRule(bounds, threshold=0.55, present_columns=[c for c in PROXY_INPUT_COLUMNS if c in df.columns])
+    served = rule.score_feature_maps(to_feature_maps(df, rng))
+
+    diff = np.abs(expected - served)
+    n_bad = int((diff > 1e-6).sum())
+    print(f"rows={args.rows} missing_rate={args.missing_rate} absent_at_training={ABSENT_AT_TRAINING}")
+    print(f"max|diff|={float(diff.max()):.2e} mismatches={n_bad}")
+    if n_bad:
+        i = int(np.argmax(diff))
+        print("first mismatch:", df.iloc[i].to_dict(), "expected", expected[i], "served", served[i])
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
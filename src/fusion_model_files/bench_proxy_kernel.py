@@ -0,0 +1,172 @@
+"""
+Benchmark: pandas proxy rule (original) vs NumPy proxy_score_kernel.
+
+Synthetic fusion-like tables with the rule inputs plus filler feature columns
+(the real table has ~2,100). Checks that both give the same scores.
+
+Run from the repo root:
+    python -m src.fusion_model_files.bench_proxy_kernel
+"""
+from __future__ import annotations
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from src.fusion_model_files.proxy_rules import build_pph_proxy_rule_v1
+
+
+def _clip01(x):
+    return np.clip(x, 0.0, 1.0)
+
+
+def _as_num(s: pd.Series) -> pd.Series:
+    return pd.to_numeric(s, errors="coerce").astype(float)
+
+
+def _minmax_series(s: pd.Series, lo=None, hi=None) -> pd.Series:
+    s = _as_num(s)
+    valid = s.dropna()
+    if valid.empty:
+        return pd.Series(0.0, index=s.index)
+    if lo is None:
+        lo = float(valid.quantile(0.05))
+    if hi is None:
+        hi = float(valid.quantile(0.95))
+    if hi <= lo:
+        return pd.Series(0.0, index=s.index)
+    return pd.Series(_clip01((s - lo) / (hi - lo + 1e-6)), index=s.index).fillna(0.0)
+
+
+def _tachy_score(hr: pd.Series, low: float = 90, high: float = 130) -> pd.Series:
+    hr = _as_num(hr)
+    return pd.Series(_clip01((hr - low) / (high - low + 1e-6)), index=hr.index).fillna(0.0)
+
+
+def _bp_extreme_score(bp: pd.Series, low_bad: float, low_ok: float, high_ok: float, high_bad: float) -> pd.Series:
+    bp = _as_num(bp)
+    score_low = _clip01((low_ok - bp) / (low_ok - low_bad + 1e-6))
+    score_high = _clip01((bp - high_ok) / (high_bad - high_ok + 1e-6))
+    out = np.maximum(score_low, score_high)
+    return pd.Series(out, index=bp.index).fillna(0.0)
+
+
+def _legacy_build_pph_proxy_rule_v1(df: pd.DataFrame) -> pd.DataFrame:
+    # Copy of the original pandas implementation of proxy_rules.build_pph_proxy_rule_v1
+    out = df.copy()
+
+    # Anemia burden
+    if "p_anemia" in out.columns:
+        anemia = _as_num(out["p_anemia"]).fillna(0.0).clip(0, 1)
+    else:
+        anemia = pd.Series(0.0, index=out.index)
+
+    # Hemodynamic stress (PPG proxies)
+    hr_score = _tachy_score(out["hr_bpm_est"]) if "hr_bpm_est" in out.columns else pd.Series(0.0, index=out.index)
+    ibi_var_score = _minmax_series(out["ibi_std"]) if "ibi_std" in out.columns else pd.Series(0.0, index=out.index)
+
+    if "peak_count" in out.columns:
+        peak_count = _as_num(out["peak_count"]).fillna(0.0)
+        peak_penalty = pd.Series(_clip01((3.0 - peak_count) / 3.0), index=out.index).fillna(0.0)
+    else:
+        peak_penalty = pd.Series(0.0, index=out.index)
+
+    amp_score = _minmax_series(-_as_num(out["ppg_amp_mean"])) if "ppg_amp_mean" in out.columns else pd.Series(0.0, index=out.index)
+
+    hemo = (0.45 * hr_score + 0.30 * ibi_var_score + 0.15 * peak_penalty + 0.10 * amp_score).clip(0, 1)
+
+    # Clinical burden
+    clinical_terms = []
+
+    for col in ["prev_complications", "hypertension_flag", "diabetes_any", "preexist_diabetes", "gest_diabetes"]:
+        if col in out.columns:
+            clinical_terms.append(_as_num(out[col]).fillna(0.0).clip(0, 1))
+
+    if "systolic_bp" in out.columns:
+        clinical_terms.append(_bp_extreme_score(out["systolic_bp"], low_bad=70, low_ok=90, high_ok=140, high_bad=180))
+    if "diastolic_bp" in out.columns:
+        clinical_terms.append(_bp_extreme_score(out["diastolic_bp"], low_bad=40, low_ok=60, high_ok=90, high_bad=110))
+    if "map_mmhg" in out.columns:
+        clinical_terms.append(_bp_extreme_score(out["map_mmhg"], low_bad=50, low_ok=65, high_ok=105, high_bad=130))
+    if "pulse_pressure" in out.columns:
+        clinical_terms.append(_minmax_series(out["pulse_pressure"]))
+
+    clinical = pd.concat(clinical_terms, axis=1).mean(axis=1).fillna(0.0) if clinical_terms else pd.Series(0.0, index=out.index)
+
+    # Maternal risk prior
+    if "Risk Level" in out.columns:
+        rl = out["Risk Level"].astype(str).str.strip().str.lower()
+        rl_score = rl.map({"low": 0.1, "medium": 0.5, "high": 0.9}).fillna(0.0)
+    else:
+        rl_score = pd.Series(0.0, index=out.index)
+
+    # Weighted proxy score
+    out["pph_proxy_score_v1"] = (
+        0.35 * anemia +
+        0.35 * hemo +
+        0.25 * clinical +
+        0.05 * rl_score
+    ).clip(0, 1)
+
+    out["pph_proxy_label_type"] = "proxy_rule_v1"
+    return out
+
+
+def make_table(n_rows: int, n_extra: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    cols = {
+        "p_anemia": rng.uniform(0, 1, n_rows),
+        "hr_bpm_est": rng.normal(95, 15, n_rows),
+        "ibi_std": rng.gamma(2.0, 0.03, n_rows),
+        "peak_count": rng.integers(0, 12, n_rows).astype(float),
+        "ppg_amp_mean": rng.normal(1.0, 0.3, n_rows),
+        "prev_complications": rng.integers(0, 2, n_rows).astype(float),
+        "preexist_diabetes": rng.integers(0, 2, n_rows).astype(float),
+        "gest_diabetes": rng.integers(0, 2, n_rows).astype(float),
+        "systolic_bp": rng.normal(118, 20, n_rows),
+        "diastolic_bp": rng.normal(78, 12, n_rows),
+        "pulse_pressure": rng.normal(40, 10, n_rows),
+        "Risk Level": rng.choice(["low", "medium", "high"], n_rows),
+    }
+    df = pd.DataFrame(cols)
+    # ~2% missing values in the numeric inputs
+    for c in ["hr_bpm_est", "ibi_std", "systolic_bp", "ppg_amp_mean"]:
+        df.loc[rng.uniform(size=n_rows) < 0.02, c] = np.nan
+    extra = pd.DataFrame(
+        rng.normal(size=(n_rows, n_extra)).astype(np.float32),
+        columns=[f"fusion_emb_{i}" for i in range(n_extra)],
+    )
+    return pd.concat([df, extra], axis=1)
+
+
+def _time(fn, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Proxy rule: pandas vs NumPy kernel.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--extra-columns", type=int, default=200, help="Filler feature columns (cost of the full-frame copy).")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    for n in args.rows:
+        df = make_table(n, args.extra_columns)
+
+        legacy = _legacy_build_pph_proxy_rule_v1(df)["pph_proxy_score_v1"].to_numpy()
+        kernel = build_pph_proxy_rule_v1(df)["pph_proxy_score_v1"].to_numpy()
+        max_diff = float(np.max(np.abs(legacy - kernel)))
+
+        t_legacy = _time(lambda: _legacy_build_pph_proxy_rule_v1(df), args.repeats)
+        t_kernel = _time(lambda: build_pph_proxy_rule_v1(df), args.repeats)
+
+        print(f"rows={n:>9} cols={df.shape[1]:>5}  pandas={t_legacy:8.3f}s  kernel={t_kernel:8.3f}s  "
+              f"speedup={t_legacy / max(t_kernel, 1e-9):6.1f}x  max|diff|={max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    main()
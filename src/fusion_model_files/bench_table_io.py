@@ -0,0 +1,78 @@
+"""
+Benchmark: CSV vs Parquet for the fusion master tables.
+
+For each input CSV, times a full read, a key-column read (the drift monitor's
+columns) and a write in both formats, and reports on-disk size.
+
+Run from the repo root:
+    python -m src.fusion_model_files.bench_table_io
+"""
+from __future__ import annotations
+import argparse
+import os
+import tempfile
+import time
+from typing import Callable, List
+from src.fusion_model_files.drift_monitor import EMBEDDING_PREFIXES, KEY_FEATURES
+from src.fusion_model_files.utils import read_table, table_columns, write_table
+
+DEFAULT_INPUTS = [
+    "data/processed/fusion_master_table.csv",
+    "data/processed/fusion_master_with_proxy.csv",
+    "data/processed/fusion_master_with_embeddings.csv",
+]
+
+
+def _best_of(fn: Callable[[], object], repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_one(path: str, repeats: int, tmp_dir: str) -> None:
+    df = read_table(path)
+    cols = table_columns(path)
+    key_cols = [c for c in KEY_FEATURES if c in cols] + [c for c in cols if c.startswith(EMBEDDING_PREFIXES)]
+
+    csv_path = os.path.join(tmp_dir, "table.csv")
+    pq_path = os.path.join(tmp_dir, "table.parquet")
+
+    t_csv_write = _best_of(lambda: write_table(df, csv_path), repeats)
+    t_pq_write = _best_of(lambda: write_table(df, pq_path), repeats)
+    t_csv_read = _best_of(lambda: read_table(csv_path), repeats)
+    t_pq_read = _best_of(lambda: read_table(pq_path), repeats)
+    t_csv_keys = _best_of(lambda: read_table(csv_path, columns=key_cols), repeats)
+    t_pq_keys = _best_of(lambda: read_table(pq_path, columns=key_cols), repeats)
+
+    mb = 1024 * 1024
+    print(f"\n{path}: {df.shape[0]} rows x {df.shape[1]} cols ({len(key_cols)} key columns)")
+    print(f"  {'':<22}{'csv':>10}{'parquet':>10}{'speedup':>10}")
+    for label, a, b in [
+        ("write (s)", t_csv_write, t_pq_write),
+        ("read all (s)", t_csv_read, t_pq_read),
+        ("read key columns (s)", t_csv_keys, t_pq_keys),
+    ]:
+        print(f"  {label:<22}{a:>10.3f}{b:>10.3f}{a / max(b, 1e-9):>9.1f}x")
+    print(f"  {'size (MB)':<22}{os.path.getsize(csv_path) / mb:>10.2f}{os.path.getsize(pq_path) / mb:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CSV vs Parquet read/write benchmark on the fusion tables.")
+    parser.add_argument("--inputs", nargs="+", default=DEFAULT_INPUTS)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    inputs: List[str] = [p for p in args.inputs if os.path.exists(p)]
+    if not inputs:
+        raise FileNotFoundError(f"None of the inputs exist: {args.inputs}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for path in inputs:
+            bench_one(path, args.repeats, tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,28 @@
 from __future__ import annotations
 import argparse
-from typing import List
+from typing import Dict, Iterator, List, Optional, Tuple
 import numpy as np
 import pandas as pd
-from src.fusion_model_files.utils import sanitize_numeric_df
+from src.fusion_model_files.utils import (
+    TableWriter,
+    iter_table_chunks,
+    read_table,
+    sanitize_numeric_df,
+    table_columns,
+)
+from src.fusion_model_files.waveform_store import WaveformStoreWriter, waveform_columns
+
+TABLES = ("clinical", "anemia", "ppg")
+
+# Suffix for columns that clash with an earlier table (same as the old pd.merge chain)
+SUFFIXES = {"clinical": "", "anemia": "_anemia", "ppg": "_ppg"}
+
+# Label-like columns only kept from the clinical table
+SECONDARY_DROP = {
+    "clinical": [],
+    "anemia": ["anaemic", "Anaemic", "Label", "Risk Level"],
+    "ppg": ["Label", "Risk Level"],
+}
 
 
 def _drop_duplicate_columns_keep_first(df: pd.DataFrame) -> pd.DataFrame:
@@ -15,78 +34,287 @@ def _strip_unnamed(df: pd.DataFrame) -> pd.DataFrame:
     return df[cols].copy()
 
 
+def _prepare(df: pd.DataFrame, name: str, key: Optional[str] = None) -> pd.DataFrame:
+    df = _strip_unnamed(df)
+    drop = [c for c in SECONDARY_DROP[name] if c in df.columns and c != key]
+    return df.drop(columns=drop)
+
+
+class KeyIndex:
+    """
+    Hash index over an in-memory (smaller) modality table.
+
+    Exact mode maps join-key values to all their row positions, so duplicate
+    keys join many-to-many like the old pd.merge chain (every matching pair is
+    emitted). With time_key, each streamed row is matched to the one row with
+    the same key and the nearest timestamp within `tolerance` (PPG windows vs
+    visits).
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        key: str,
+        time_key: Optional[str] = None,
+        tolerance: Optional[pd.Timedelta] = None,
+    ):
+        self.df = df.reset_index(drop=True)
+        self.key = key
+        self.time_key = time_key if (time_key and time_key in df.columns) else None
+        self.tolerance = tolerance
+
+        keys = self.df[key].astype(str)
+        if self.time_key is None:
+            codes, uniques = pd.factorize(keys)
+            self.n_duplicates = int(len(codes) - len(uniques))
+            self._index = pd.Index(uniques)
+            # Row positions grouped by key: key k owns _positions[_starts[k]:_starts[k] + _counts[k]]
+            self._positions = np.argsort(codes, kind="stable")
+            self._counts = np.bincount(codes, minlength=len(uniques))
+            self._starts = np.concatenate([[0], np.cumsum(self._counts)[:-1]]).astype(np.int64)
+        else:
+            self.n_duplicates = 0
+            # merge_asof needs the right side sorted on time; done once here
+            self._by_time = pd.DataFrame({
+                "__key": keys,
+                "__time": pd.to_datetime(self.df[self.time_key], errors="coerce", utc=True).to_numpy(),
+                "__pos": np.arange(len(self.df)),
+            }).dropna(subset=["__time"]).sort_values("__time", kind="stable")
+
+    def lookup(self, chunk: pd.DataFrame, time_key: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (chunk_rows, positions) pairs, sorted by chunk row: every row of self.df
+        matching each chunk row. A chunk row without a match gets one pair with
+        position -1.
+        """
+        keys = chunk[self.key].astype(str)
+        if self.time_key is None or time_key is None or time_key not in chunk.columns:
+            if self.time_key is not None:
+                raise ValueError(f"Nearest-time join needs column '{time_key}' in the streamed table.")
+            hit = self._index.get_indexer(keys)
+            found = hit >= 0
+            counts = np.zeros(len(chunk), dtype=np.int64)
+            starts = np.zeros(len(chunk), dtype=np.int64)
+            counts[found] = self._counts[hit[found]]
+            starts[found] = self._starts[hit[found]]
+            n_pairs = np.maximum(counts, 1)
+            rows = np.repeat(np.arange(len(chunk)), n_pairs)
+            # Offset of each pair within its chunk row's run
+            offset = np.arange(len(rows)) - np.repeat(np.cumsum(n_pairs) - n_pairs, n_pairs)
+            matched = np.repeat(found, n_pairs)
+            pos = np.full(len(rows), -1, dtype=np.int64)
+            pos[matched] = self._positions[np.repeat(starts, n_pairs)[matched] + offset[matched]]
+            return rows, pos
+
+        return np.arange(len(chunk)), self._nearest(chunk, keys, time_key)
+
+    def _nearest(self, chunk: pd.DataFrame, keys: pd.Series, time_key: str) -> np.ndarray:
+        left = pd.DataFrame({
+            "__key": keys.to_numpy(),
+            "__time": pd.to_datetime(chunk[time_key], errors="coerce", utc=True).to_numpy(),
+            "__row": np.arange(len(chunk)),
+        })
+        pos = np.full(len(chunk), -1, dtype=np.int64)
+        left = left.dropna(subset=["__time"]).sort_values("__time", kind="stable")
+        if left.empty:
+            return pos
+        matched = pd.merge_asof(
+            left,
+            self._by_time,
+            on="__time",
+            by="__key",
+            direction="nearest",
+            tolerance=self.tolerance,
+        )
+        ok = matched["__pos"].notna().to_numpy()
+        pos[matched["__row"].to_numpy()[ok]] = matched["__pos"].to_numpy()[ok].astype(np.int64)
+        return pos
+
+
+def _rename_clashes(df: pd.DataFrame, name: str, taken: set, key: Optional[str]) -> pd.DataFrame:
+    suffix = SUFFIXES[name]
+    if not suffix:
+        return df
+    return df.rename(columns={c: f"{c}{suffix}" for c in df.columns if c in taken and c != key})
+
+
+def _assemble(parts: Dict[str, pd.DataFrame], key: Optional[str], suffix_clashes: bool = True) -> pd.DataFrame:
+    # Fixed column order clinical | anemia | ppg; the key column is kept once
+    out: List[pd.DataFrame] = []
+    taken: set = set()
+    for name in TABLES:
+        df = parts[name].reset_index(drop=True)
+        if key is not None and name != "clinical":
+            df = df.drop(columns=[key], errors="ignore")
+        if suffix_clashes:
+            df = _rename_clashes(df, name, taken, key)
+        taken.update(df.columns)
+        out.append(df)
+    return pd.concat(out, axis=1)
+
+
+def iter_key_joined(
+    tables: Dict[str, pd.DataFrame],
+    stream_name: str,
+    stream_chunks: Iterator[pd.DataFrame],
+    key: str,
+    time_key: Optional[str] = None,
+    tolerance: Optional[pd.Timedelta] = None,
+    how: str = "inner",
+) -> Iterator[pd.DataFrame]:
+    """
+    Streams the largest table chunk by chunk and joins each chunk against hash
+    indexes over the in-memory tables. Memory is bounded by the small tables
+    plus one chunk. Duplicate keys expand to every matching combination, so
+    a chunk can grow by the product of the duplicate counts.
+    """
+    indexes = {
+        name: KeyIndex(df, key, time_key=time_key, tolerance=tolerance)
+        for name, df in tables.items()
+    }
+    for name, idx in indexes.items():
+        if idx.n_duplicates:
+            print(f"[WARN] {name}: {idx.n_duplicates} duplicate '{key}' values; "
+                  "each matching pair is emitted (many-to-many, as pd.merge).")
+
+    for chunk in stream_chunks:
+        chunk = _prepare(chunk, stream_name, key).reset_index(drop=True)
+
+        # One output row per combination of matches across the tables
+        rows = np.arange(len(chunk))
+        positions: Dict[str, np.ndarray] = {}
+        for name, idx in indexes.items():
+            pair_rows, pair_pos = idx.lookup(chunk, time_key)
+            if how == "inner":
+                hit = pair_pos >= 0
+                pair_rows, pair_pos = pair_rows[hit], pair_pos[hit]
+            counts = np.bincount(pair_rows, minlength=len(chunk))
+            starts = np.cumsum(counts) - counts
+            n_new = counts[rows]
+            combo = np.repeat(np.arange(len(rows)), n_new)
+            pair = np.repeat(starts[rows], n_new) + (np.arange(len(combo)) - np.repeat(np.cumsum(n_new) - n_new, n_new))
+            rows = rows[combo]
+            positions = {n: p[combo] for n, p in positions.items()}
+            positions[name] = pair_pos[pair]
+
+        parts = {stream_name: chunk.iloc[rows]}
+        for name, pos in positions.items():
+            # reindex on -1 yields an all-NaN row (left join without a match)
+            parts[name] = indexes[name].df.reindex(pos)
+        # The key is emitted from clinical's slot; take it from the streamed rows so
+        # unmatched rows (how="left") keep their key
+        parts["clinical"] = parts["clinical"].assign(**{key: chunk[key].to_numpy()[rows]})
+        yield _assemble(parts, key)
+
+
+def iter_index_aligned(chunks: Dict[str, Iterator[pd.DataFrame]]) -> Iterator[pd.DataFrame]:
+    """Legacy row-order alignment, read in lockstep; stops at the shortest table."""
+    readers = [chunks[name] for name in TABLES]
+    for parts in zip(*readers):
+        n = min(len(p) for p in parts)
+        # Clashing columns are de-duplicated (first wins) later, as before
+        yield _assemble(
+            {name: _prepare(p.iloc[:n], name) for name, p in zip(TABLES, parts)},
+            key=None,
+            suffix_clashes=False,
+        )
+        if any(len(p) != n for p in parts):
+            break
+
+
 def main():
     parser = argparse.ArgumentParser(description="Build fusion master dataset from clinical, anemia, and PPG outputs.")
     parser.add_argument("--clinical", default="data/processed/clinical_with_embeddings.csv")
     parser.add_argument("--anemia", default="data/processed/anemia_with_embeddings.csv")
     parser.add_argument("--ppg", default="data/processed/ppg_with_embeddings.csv")
-    parser.add_argument("--output", default="data/processed/fusion_master_table.csv")
+    parser.add_argument("--output", default="data/processed/fusion_master_table.csv", help="Output .csv or .parquet")
     parser.add_argument("--join-key", default=None, help="Optional common key column (e.g., record_id). If omitted, aligns by row index.")
+    parser.add_argument("--time-key", default=None, help="Optional timestamp column: match each streamed row to the nearest-in-time row with the same key.")
+    parser.add_argument("--time-tolerance", default="30min", help="Max distance for --time-key matches (pandas Timedelta string).")
+    parser.add_argument("--stream", choices=list(TABLES), default="ppg", help="Table read in chunks (the largest one); the others are indexed in memory.")
+    parser.add_argument("--how", choices=["inner", "left"], default="inner", help="left keeps streamed rows without a match (NaN-filled).")
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--waveform-store", default=None, help="Optional directory: move raw PPG sample columns into a memory-mapped store keyed by row_id.")
     args = parser.parse_args()
 
-    clinical = _strip_unnamed(pd.read_csv(args.clinical))
-    anemia = _strip_unnamed(pd.read_csv(args.anemia))
-    ppg = _strip_unnamed(pd.read_csv(args.ppg))
+    paths = {"clinical": args.clinical, "anemia": args.anemia, "ppg": args.ppg}
 
-    print("Loaded clinical:", clinical.shape)
-    print("Loaded anemia  :", anemia.shape)
-    print("Loaded ppg     :", ppg.shape)
-
-    if args.join_key and all(args.join_key in d.columns for d in [clinical, anemia, ppg]):
+    if args.join_key:
         key = args.join_key
-        # Drop likely duplicate columns from secondary tables except key
-        anemia_drop = [c for c in ["anaemic", "Anaemic", "Label", "Risk Level"] if c in anemia.columns and c != key]
-        ppg_drop = [c for c in ["Label", "Risk Level"] if c in ppg.columns and c != key]
-
-        fusion = clinical.merge(
-            anemia.drop(columns=anemia_drop, errors="ignore"),
-            on=key,
-            how="inner",
-            suffixes=("", "_anemia")
-        ).merge(
-            ppg.drop(columns=ppg_drop, errors="ignore"),
-            on=key,
-            how="inner",
-            suffixes=("", "_ppg")
+        tables = {}
+        for name in TABLES:
+            if name == args.stream:
+                continue
+            tables[name] = _prepare(read_table(paths[name]), name, key)
+            print(f"Loaded {name:<8}:", tables[name].shape)
+        for name in list(tables) + [args.stream]:
+            header = tables[name].columns if name in tables else table_columns(paths[name])
+            if key not in header:
+                raise ValueError(f"--join-key '{key}' not found in the {name} table ({paths[name]}).")
+
+        batches = iter_key_joined(
+            tables,
+            stream_name=args.stream,
+            stream_chunks=iter_table_chunks(paths[args.stream], args.chunk_size),
+            key=key,
+            time_key=args.time_key,
+            tolerance=pd.Timedelta(args.time_tolerance) if args.time_key else None,
+            how=args.how,
         )
     else:
         # Row alignment mode (only safe if row order was preserved across pipelines)
-        n = min(len(clinical), len(anemia), len(ppg))
-        if len({len(clinical), len(anemia), len(ppg)}) != 1:
-            print(f"[WARN] Row counts differ. Truncating all to n={n} for index alignment.")
-        clinical = clinical.iloc[:n].reset_index(drop=True)
-        anemia = anemia.iloc[:n].reset_index(drop=True)
-        ppg = ppg.iloc[:n].reset_index(drop=True)
-
-        anemia_drop = [c for c in ["anaemic", "Anaemic", "Label", "Risk Level"] if c in anemia.columns]
-        ppg_drop = [c for c in ["Label", "Risk Level"] if c in ppg.columns]
-
-        fusion = pd.concat(
-            [
-                clinical,
-                anemia.drop(columns=anemia_drop, errors="ignore"),
-                ppg.drop(columns=ppg_drop, errors="ignore")
-            ],
-            axis=1
-        )
+        print("[WARN] No --join-key: aligning tables by row order; output stops at the shortest table.")
+        batches = iter_index_aligned({
+            name: iter_table_chunks(paths[name], args.chunk_size) for name in TABLES
+        })
+
+    # Written incrementally: one chunk of the master table in memory at a time
+    columns: Optional[pd.Index] = None
+    wf_cols: Optional[List[str]] = None
+    store: Optional[WaveformStoreWriter] = None
+    # Keys stay integer; other integer columns are stored as float32 since a
+    # later chunk (left join, missing values) may carry NaN in them
+    with TableWriter(args.output, int_columns=["row_id"] + ([args.join_key] if args.join_key else [])) as writer:
+        for fusion in batches:
+            fusion = _drop_duplicate_columns_keep_first(fusion)
+            fusion = sanitize_numeric_df(fusion)
 
-    fusion = _drop_duplicate_columns_keep_first(fusion)
-    fusion = sanitize_numeric_df(fusion)
+            # Create row_id if no explicit key
+            if "row_id" not in fusion.columns:
+                fusion.insert(0, "row_id", np.arange(writer.n_rows, writer.n_rows + len(fusion), dtype=int))
 
-    # Create row_id if no explicit key
-    if "row_id" not in fusion.columns:
-        fusion.insert(0, "row_id", np.arange(len(fusion), dtype=int))
+            # The table keeps row_id (the store key) and the derived PPG features only
+            if args.waveform_store:
+                if wf_cols is None:
+                    wf_cols = waveform_columns(fusion.columns.tolist())
+                if wf_cols:
+                    if store is None:
+                        store = WaveformStoreWriter(args.waveform_store, n_samples=len(wf_cols), source=args.ppg)
+                    store.append(
+                        fusion["row_id"].to_numpy(),
+                        fusion[wf_cols].to_numpy(dtype=np.float32, na_value=np.nan),
+                    )
+                    fusion = fusion.drop(columns=wf_cols)
+
+            if columns is None:
+                columns = fusion.columns
+            writer.write(fusion)
+        n_rows = writer.n_rows
+
+    if store is not None:
+        store.close()
+        print(f"Waveform store: {store.n_rows} x {store.n_samples} samples -> {args.waveform_store}")
+
+    if columns is None:
+        raise ValueError("No rows were produced; check the inputs and join options.")
 
     # Quick summary
-    n_cols = fusion.shape[1]
-    emb_cols = [c for c in fusion.columns if c.endswith(tuple([str(i) for i in range(10)])) and ("_emb_" in c)]
-    print("Fusion shape:", fusion.shape)
+    emb_cols = [c for c in columns if c.endswith(tuple([str(i) for i in range(10)])) and ("_emb_" in c)]
+    print("Fusion shape:", (n_rows, len(columns)))
     print("Embedding columns:", len(emb_cols))
-    print("Has Risk Level:", "Risk Level" in fusion.columns)
-
-    fusion.to_csv(args.output, index=False)
+    print("Has Risk Level:", "Risk Level" in columns)
     print("Saved:", args.output)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -4,7 +4,10 @@ import os
 from typing import Dict, List
 import numpy as np
 import pandas as pd
-from src.fusion_model_files.utils import ensure_dir, save_json
+from src.fusion_model_files.utils import ensure_dir, read_table, save_json, table_columns
+
+KEY_FEATURES = ["p_anemia", "hr_bpm_est", "ibi_mean", "ibi_std", "peak_count"]
+EMBEDDING_PREFIXES = ("clin_emb_", "anemia_emb_", "ppg_emb_", "fusion_emb_")
 
 
 def psi(expected: pd.Series, actual: pd.Series, bins: int = 10, eps: float = 1e-6) -> float:
@@ -30,7 +33,7 @@ def psi(expected: pd.Series, actual: pd.Series, bins: int = 10, eps: float = 1e-
 
 
 def embedding_centroid_shift(ref: pd.DataFrame, cur: pd.DataFrame) -> float | None:
-    emb_cols = [c for c in ref.columns if c.startswith(("clin_emb_", "anemia_emb_", "ppg_emb_", "fusion_emb_")) and c in cur.columns]
+    emb_cols = [c for c in ref.columns if c.startswith(EMBEDDING_PREFIXES) and c in cur.columns]
     if not emb_cols:
         return None
     ref_num = ref[emb_cols].apply(pd.to_numeric, errors="coerce").replace([np.inf, -np.inf], np.nan)
@@ -43,16 +46,21 @@ def embedding_centroid_shift(ref: pd.DataFrame, cur: pd.DataFrame) -> float | No
 def main():
     parser = argparse.ArgumentParser(description="Compute drift report between reference and current fusion datasets.")
     parser.add_argument("--reference", default="data/processed/fusion_master_with_embeddings.csv")
-    parser.add_argument("--current", required=True, help="New batch CSV to compare against reference.")
+    parser.add_argument("--current", required=True, help="New batch (.csv or .parquet) to compare against reference.")
     parser.add_argument("--output", default="reports/fusion_drift_report.json")
     parser.add_argument("--psi-threshold", type=float, default=0.20)
     parser.add_argument("--centroid-threshold", type=float, default=1.50)
     args = parser.parse_args()
 
-    ref = pd.read_csv(args.reference)
-    cur = pd.read_csv(args.current)
+    # Only the monitored columns are read (column-selective with Parquet)
+    ref_cols = set(table_columns(args.reference))
+    cur_cols = set(table_columns(args.current))
+    shared = ref_cols & cur_cols
+    key_features = [c for c in KEY_FEATURES if c in shared]
+    emb_cols = sorted(c for c in shared if c.startswith(EMBEDDING_PREFIXES))
 
-    key_features = [c for c in ["p_anemia", "hr_bpm_est", "ibi_mean", "ibi_std", "peak_count"] if c in ref.columns and c in cur.columns]
+    ref = read_table(args.reference, columns=key_features + emb_cols)
+    cur = read_table(args.current, columns=key_features + emb_cols)
 
     psi_scores = {}
     for c in key_features:
@@ -0,0 +1,227 @@
+from __future__ import annotations
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from sklearn.metrics import average_precision_score
+from src.fusion_model_files.fold_scheduler import FoldTask, run_fold_tasks
+from src.fusion_model_files.utils import split_feature_groups
+
+# Never model inputs: row keys, and the proxy labelling outputs (derived from the target)
+IDENTIFIER_COLUMNS = {"row_id", "patient_local_id", "visit_id", "record_id"}
+LEAKAGE_PREFIXES = ("pph_proxy_",)
+
+# Raw PPG samples: keep as-is, replace by principal components, or drop
+WAVEFORM_MODES = ("raw", "pca", "drop")
+WAVEFORM_PC_PREFIX = "ppg_wave_pc_"
+WAVEFORM_PCA_FILE = "waveform_pca.npz"
+
+# Candidate feature counts for the accuracy / latency trade-off
+DEFAULT_SIZES = (16, 32, 64, 128, 256)
+
+
+def drop_identifier_and_leakage(X_df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
+    dropped = [c for c in X_df.columns if c in IDENTIFIER_COLUMNS or str(c).startswith(LEAKAGE_PREFIXES)]
+    return X_df.drop(columns=dropped), dropped
+
+
+def fit_waveform_pca(samples: np.ndarray, n_components: int) -> dict:
+    """
+    PCA of the raw samples via SVD (NumPy only, so serving needs no sklearn).
+    Missing samples count as 0.0, as in the API and the waveform store.
+    """
+    W = np.nan_to_num(np.asarray(samples, dtype=np.float64), nan=0.0, posinf=0.0, neginf=0.0)
+    mean = W.mean(axis=0)
+    k = max(1, min(n_components, W.shape[0], W.shape[1]))
+    _, s, vt = np.linalg.svd(W - mean, full_matrices=False)
+    var = s ** 2
+    ratio = var[:k] / var.sum() if var.sum() > 0 else np.zeros(k)
+    return {
+        "mean": mean.astype(np.float32),
+        "components": vt[:k].astype(np.float32),
+        "explained_variance_ratio": ratio.astype(float),
+        "features": [f"{WAVEFORM_PC_PREFIX}{i}" for i in range(k)],
+        "fit_rows": int(W.shape[0]),
+    }
+
+
+def transform_waveform_pca(samples: np.ndarray, pca: dict) -> np.ndarray:
+    # Same transform as backend_api/app/services/waveform_pca.py
+    W = np.nan_to_num(np.asarray(samples, dtype=np.float32), nan=0.0, posinf=0.0, neginf=0.0)
+    return (W - pca["mean"]) @ pca["components"].T
+
+
+def subset_waveform_pca(pca: dict, keep: Sequence[str]) -> Optional[dict]:
+    """Only the components that survived feature selection (None if none did)."""
+    keep = set(keep)
+    idx = [i for i, name in enumerate(pca["features"]) if name in keep]
+    if not idx:
+        return None
+    return {
+        "mean": pca["mean"],
+        "components": pca["components"][idx],
+        "explained_variance_ratio": pca["explained_variance_ratio"][idx],
+        "features": [pca["features"][i] for i in idx],
+        "fit_rows": pca.get("fit_rows", 0),
+    }
+
+
+def save_waveform_pca(pca: dict, out_dir: str) -> dict:
+    """Writes the projection next to the model; returns the features.json entry."""
+    np.savez(os.path.join(out_dir, WAVEFORM_PCA_FILE), mean=pca["mean"], components=pca["components"])
+    return {
+        "file": WAVEFORM_PCA_FILE,
+        "features": pca["features"],
+        "n_samples": int(pca["mean"].shape[0]),
+        "fit_rows": int(pca.get("fit_rows", 0)),
+        "explained_variance_ratio": [float(v) for v in pca["explained_variance_ratio"]],
+    }
+
+
+def split_waveform(
+    X_df: pd.DataFrame,
+    raw_df: pd.DataFrame,
+    mode: str = "raw",
+) -> Tuple[pd.DataFrame, Optional[np.ndarray]]:
+    """
+    Handles the raw PPG sample columns of X_df: "raw" keeps them, "drop"
+    removes them, "pca" removes them and returns raw_df's (unimputed)
+    samples, so the caller fits fit_waveform_pca on each training part only.
+    """
+    if mode not in WAVEFORM_MODES:
+        raise ValueError(f"Unknown waveform mode '{mode}'. Use one of {WAVEFORM_MODES}.")
+    wf_cols = sorted(split_feature_groups(X_df.columns.tolist())["ppg_waveform"], key=int)
+    if mode == "raw" or not wf_cols:
+        return X_df, None
+    X_df = X_df.drop(columns=wf_cols)
+    if mode == "drop":
+        return X_df, None
+    return X_df, raw_df[wf_cols].to_numpy(dtype=np.float32, na_value=np.nan)
+
+
+def fold_gains(models: Sequence, n_features: int) -> np.ndarray:
+    """(n_folds, n_features) total gain per feature; 0 for features never split on."""
+    out = np.zeros((len(models), n_features), dtype=np.float64)
+    for i, model in enumerate(models):
+        for name, gain in model.get_booster().get_score(importance_type="total_gain").items():
+            out[i, int(name[1:])] = gain  # numpy-trained boosters name features f0..fN
+    return out
+
+
+def predict_latency_ms(model, X: np.ndarray, n_rows: int, repeats: int = 50) -> float:
+    """Median wall time of one booster call on n_rows rows."""
+    booster = model.get_booster()
+    # Rows repeat when the table is smaller than n_rows
+    x = np.ascontiguousarray(X[np.arange(n_rows) % X.shape[0]])
+    booster.inplace_predict(x)
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        booster.inplace_predict(x)
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times) * 1000.0)
+
+
+def _cv_subset(
+    X: np.ndarray,
+    y: np.ndarray,
+    cols: np.ndarray,
+    folds: List[Tuple[np.ndarray, np.ndarray]],
+    params: dict,
+    n_workers: Optional[int],
+) -> dict:
+    seed = int(params.get("random_state", 0))
+    tasks: List[FoldTask] = [
+        (fold, tr, te, {**params, "random_state": seed + fold}, None) for fold, (tr, te) in enumerate(folds, start=1)
+    ]
+    return run_fold_tasks(np.ascontiguousarray(X[:, cols]), y, tasks, n_workers=n_workers, keep_fold_models=True)
+
+
+def select_features(
+    X: np.ndarray,
+    y: np.ndarray,
+    feature_names: List[str],
+    folds: List[Tuple[np.ndarray, np.ndarray]],
+    params: dict,
+    sizes: Sequence[int] = DEFAULT_SIZES,
+    top_k: int = 64,
+    min_stability: float = 0.6,
+    tolerance: float = 0.01,
+    n_workers: Optional[int] = None,
+) -> dict:
+    """
+    Gain ranking with a stability check, then a size sweep. Pass a training
+    part and folds within it: the rows used to evaluate the final model must
+    not take part in choosing its features.
+
+    1. Fit the CV folds on all features; a feature is stable when it is in
+       the top_k by gain in at least min_stability of the folds.
+    2. Re-run the CV on the top-n stable features for each n in sizes and
+       time single-row / 1k-row prediction of a fold model.
+    3. Keep the smallest n whose OOF PR-AUC is within tolerance of the best.
+
+    Returns {"features", "report"}; report carries the trade-off table.
+    """
+    n = len(feature_names)
+    all_cols = np.arange(n)
+    base = _cv_subset(X, y, all_cols, folds, params, n_workers)
+    gains = fold_gains([base["models"][f] for f in sorted(base["models"])], n)
+
+    k = min(top_k, n)
+    in_top = np.zeros_like(gains, dtype=bool)
+    for i, g in enumerate(gains):
+        top = np.argsort(-g, kind="stable")[:k]
+        in_top[i, top[g[top] > 0]] = True
+    stability = in_top.mean(axis=0)
+    mean_gain = gains.mean(axis=0)
+    ranked = [j for j in np.argsort(-mean_gain, kind="stable") if stability[j] >= min_stability]
+    if not ranked:
+        ranked = list(np.argsort(-mean_gain, kind="stable")[:k])
+
+    def _row(cols: np.ndarray, run: dict) -> dict:
+        model = run["models"][min(run["models"])]
+        return {
+            "n_features": int(len(cols)),
+            "pr_auc_oof": float(average_precision_score(y, run["oof"])),
+            "latency_ms_1row": predict_latency_ms(model, X[:, cols], 1),
+            "latency_ms_1k_rows": predict_latency_ms(model, X[:, cols], 1000, repeats=10),
+            "row_bytes": int(len(cols) * 4),
+            "cv_seconds": run["wall_seconds"],
+        }
+
+    tradeoff = [_row(all_cols, base)]
+    candidates: Dict[int, np.ndarray] = {}
+    for size in sorted({s for s in sizes if s < len(ranked)} | {len(ranked)}):
+        cols = np.asarray(ranked[:size], dtype=np.intp)
+        candidates[size] = cols
+        tradeoff.append(_row(cols, _cv_subset(X, y, cols, folds, params, n_workers)))
+
+    best = max(r["pr_auc_oof"] for r in tradeoff)
+    chosen = min(
+        (r for r in tradeoff[1:] if r["pr_auc_oof"] >= best - tolerance),
+        key=lambda r: r["n_features"],
+        default=tradeoff[0],
+    )
+    cols = candidates.get(chosen["n_features"], all_cols)
+    # Keep the original column order (keeps the PCA block contiguous)
+    selected = [feature_names[j] for j in sorted(cols)]
+
+    top = np.argsort(-mean_gain, kind="stable")[:30]
+    return {
+        "features": selected,
+        "report": {
+            "method": "gain_stability",
+            "n_input": n,
+            "n_stable": len(ranked),
+            "n_selected": len(selected),
+            "top_k": k,
+            "min_stability": min_stability,
+            "tolerance": tolerance,
+            "tradeoff": tradeoff,
+            "top_features": [
+                {"feature": feature_names[j], "mean_gain": float(mean_gain[j]), "stability": float(stability[j])}
+                for j in top
+            ],
+        },
+    }
@@ -0,0 +1,181 @@
+from __future__ import annotations
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import xgboost as xgb
+
+# A task is (fold, train_idx, test_idx, params, cols). test_idx=None marks the
+# final model on all rows: it is returned to the caller instead of writing OOF
+# scores. cols selects the task's feature columns of X (None = all), so folds
+# with different feature sets still share one matrix.
+FoldTask = Tuple[int, np.ndarray, Optional[np.ndarray], dict, Optional[np.ndarray]]
+
+# Shared block description passed to workers: (name, shape, dtype)
+ArraySpec = Tuple[str, Tuple[int, ...], str]
+
+# Native thread pools sized from the environment when numpy / xgboost load
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+# Attached once per worker process by _init_worker
+_WORKER_ARRAYS: Dict[str, np.ndarray] = {}
+_WORKER_SHM: List[SharedMemory] = []
+_WORKER_NTHREAD = 1
+
+
+def plan_workers(n_tasks: int, n_workers: Optional[int] = None, n_cores: Optional[int] = None) -> Tuple[int, int]:
+    """
+    (workers, nthread per worker) so that workers x nthread <= cores.
+    n_workers=None uses one worker per task, capped at the core count.
+    """
+    cores = max(1, n_cores or os.cpu_count() or 1)
+    workers = max(1, min(n_tasks, n_workers or cores, cores))
+    return workers, max(1, cores // workers)
+
+
+def share_array(arr: np.ndarray) -> Tuple[SharedMemory, ArraySpec]:
+    """Copies arr into a new shared-memory block; the caller closes and unlinks it."""
+    arr = np.ascontiguousarray(arr)
+    shm = SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    return shm, (shm.name, arr.shape, arr.dtype.str)
+
+
+def attach_array(spec: ArraySpec) -> Tuple[SharedMemory, np.ndarray]:
+    """Zero-copy view of a block created by share_array (in a worker process)."""
+    name, shape, dtype = spec
+    try:
+        # The parent owns (and unlinks) the block; workers must not track it
+        shm = SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        shm = SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+@contextmanager
+def worker_thread_env(nthread: int) -> Iterator[None]:
+    """
+    Exports THREAD_ENV_VARS=nthread while a spawn pool is alive. Spawned
+    workers copy the environment at start and import numpy / xgboost while
+    unpickling their initializer, so setting the variables inside the
+    initializer is too late. The parent's own pools are already started and
+    keep their size; the previous values are restored on exit.
+    """
+    saved = {var: os.environ.get(var) for var in THREAD_ENV_VARS}
+    os.environ.update({var: str(nthread) for var in THREAD_ENV_VARS})
+    try:
+        yield
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+def _init_worker(x_spec: ArraySpec, y_spec: ArraySpec, oof_spec: ArraySpec, nthread: int) -> None:
+    global _WORKER_NTHREAD
+    _WORKER_NTHREAD = nthread
+    for key, spec in (("X", x_spec), ("y", y_spec), ("oof", oof_spec)):
+        shm, arr = attach_array(spec)
+        _WORKER_SHM.append(shm)
+        _WORKER_ARRAYS[key] = arr
+
+
+def _fit_task(
+    X: np.ndarray,
+    y: np.ndarray,
+    oof: np.ndarray,
+    task: FoldTask,
+    nthread: int,
+    keep_model: bool = False,
+) -> Tuple[int, Optional[xgb.XGBClassifier], float]:
+    fold, tr, te, params, cols = task
+    t0 = time.perf_counter()
+    model = xgb.XGBClassifier(**params, n_jobs=nthread)
+    model.fit(X[tr] if cols is None else X[np.ix_(tr, cols)], y[tr])
+    if te is None:
+        return fold, model, time.perf_counter() - t0
+    # Folds write disjoint rows of the shared OOF vector; the model is dropped
+    # unless the caller needs it (e.g. per-fold feature importances)
+    oof[te] = model.predict_proba(X[te] if cols is None else X[np.ix_(te, cols)])[:, 1]
+    return fold, model if keep_model else None, time.perf_counter() - t0
+
+
+def _run_in_worker(task: FoldTask, keep_model: bool) -> Tuple[int, Optional[xgb.XGBClassifier], float]:
+    return _fit_task(_WORKER_ARRAYS["X"], _WORKER_ARRAYS["y"], _WORKER_ARRAYS["oof"], task, _WORKER_NTHREAD, keep_model)
+
+
+def run_fold_tasks(
+    X: np.ndarray,
+    y: np.ndarray,
+    tasks: List[FoldTask],
+    n_workers: Optional[int] = None,
+    keep_fold_models: bool = False,
+) -> dict:
+    """
+    Fits every task and returns {"oof", "models", "task_seconds", "workers",
+    "nthread", "wall_seconds"}.
+
+    models holds the final model (fold 0) and, with keep_fold_models, the
+    fold models. X, y and the OOF vector live in shared memory, so workers
+    read the training data without a per-task copy. n_workers=1 runs the
+    tasks in-process with all cores per model (the original serial loop).
+    Seeds come from the task params, so the OOF scores for a given
+    random_state do not depend on the order in which tasks finish.
+    """
+    workers, nthread = plan_workers(len(tasks), n_workers)
+    oof = np.zeros(len(y), dtype=np.float64)
+    models: Dict[int, xgb.XGBClassifier] = {}
+    task_seconds: Dict[int, float] = {}
+
+    t0 = time.perf_counter()
+    if workers == 1:
+        for task in tasks:
+            fold, model, sec = _fit_task(X, y, oof, task, nthread=-1, keep_model=keep_fold_models)
+            task_seconds[fold] = sec
+            if model is not None:
+                models[fold] = model
+        return {
+            "oof": oof,
+            "models": models,
+            "task_seconds": task_seconds,
+            "workers": 1,
+            "nthread": os.cpu_count() or 1,
+            "wall_seconds": time.perf_counter() - t0,
+        }
+
+    shared = [share_array(X), share_array(y), share_array(oof)]
+    try:
+        # spawn: forking after OpenMP has started in the parent can deadlock workers
+        with worker_thread_env(nthread), ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(shared[0][1], shared[1][1], shared[2][1], nthread),
+        ) as pool:
+            # Biggest tasks (most training rows) first: shortest overall wall time
+            order = sorted(tasks, key=lambda t: -len(t[1]))
+            for fold, model, sec in pool.map(_run_in_worker, order, [keep_fold_models] * len(order)):
+                task_seconds[fold] = sec
+                if model is not None:
+                    models[fold] = model
+        oof_shm, (_, shape, dtype) = shared[2]
+        oof[:] = np.ndarray(shape, dtype=dtype, buffer=oof_shm.buf)
+    finally:
+        for shm, _ in shared:
+            shm.close()
+            shm.unlink()
+
+    return {
+        "oof": oof,
+        "models": models,
+        "task_seconds": task_seconds,
+        "workers": workers,
+        "nthread": nthread,
+        "wall_seconds": time.perf_counter() - t0,
+    }
@@ -0,0 +1,292 @@
+from __future__ import annotations
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import xgboost as xgb
+from src.fusion_model_files.fold_scheduler import (
+    ArraySpec,
+    attach_array,
+    plan_workers,
+    share_array,
+    worker_thread_env,
+)
+
+# Search space for the fusion XGBoost: name -> (kind, values or (low, high))
+SEARCH_SPACE: Dict[str, tuple] = {
+    "max_depth": ("choice", [2, 3, 4, 5, 6]),
+    "learning_rate": ("loguniform", (0.01, 0.2)),
+    "min_child_weight": ("choice", [1, 2, 4, 8]),
+    "subsample": ("uniform", (0.6, 1.0)),
+    "colsample_bytree": ("uniform", (0.3, 1.0)),
+    "reg_lambda": ("loguniform", (0.1, 10.0)),
+    "gamma": ("choice", [0.0, 0.5, 1.0]),
+}
+
+# Trial 0: the hand-set configuration train_fusion_proxy used so far
+BASELINE_CONFIG = {
+    "max_depth": 4,
+    "learning_rate": 0.03,
+    "min_child_weight": 2,
+    "subsample": 0.9,
+    "colsample_bytree": 0.9,
+    "reg_lambda": 1.0,
+    "gamma": 0.0,
+}
+
+SEARCH_METRIC = "aucpr"
+
+# A job evaluates one trial on folds [start, stop) of the CV split
+_Job = Tuple[int, dict, int, int]
+
+
+def sample_config(rng: np.random.Generator) -> dict:
+    config = {}
+    for name, (kind, spec) in SEARCH_SPACE.items():
+        if kind == "choice":
+            config[name] = spec[int(rng.integers(len(spec)))]
+        elif kind == "uniform":
+            config[name] = float(rng.uniform(*spec))
+        else:
+            config[name] = float(math.exp(rng.uniform(math.log(spec[0]), math.log(spec[1]))))
+    return config
+
+
+def rung_folds(n_splits: int, eta: int, min_folds: int = 1) -> List[int]:
+    """Folds evaluated at each rung, e.g. 5 folds with eta=3 -> [1, 3, 5]."""
+    rungs = []
+    r = min_folds
+    while r < n_splits:
+        rungs.append(r)
+        r *= eta
+    return rungs + [n_splits]
+
+
+class FoldData:
+    """
+    The CV folds as pre-binned QuantileDMatrix pairs. Each fold is built once
+    (per process) and reused by every trial, so quantile sketching is not
+    repeated per config; the validation matrix shares the training bins.
+    """
+
+    def __init__(self, X: np.ndarray, y: np.ndarray, folds: List[Tuple[np.ndarray, np.ndarray]], nthread: int, max_bin: int = 256):
+        self.X = X
+        self.y = y
+        self.folds = folds
+        self.nthread = nthread
+        self.max_bin = max_bin
+        self._cache: Dict[int, Tuple[xgb.QuantileDMatrix, xgb.QuantileDMatrix]] = {}
+
+    def dmatrices(self, fold: int) -> Tuple[xgb.QuantileDMatrix, xgb.QuantileDMatrix]:
+        if fold not in self._cache:
+            tr, te = self.folds[fold]
+            dtrain = xgb.QuantileDMatrix(self.X[tr], self.y[tr], max_bin=self.max_bin, nthread=self.nthread)
+            dvalid = xgb.QuantileDMatrix(self.X[te], self.y[te], ref=dtrain, nthread=self.nthread)
+            self._cache[fold] = (dtrain, dvalid)
+        return self._cache[fold]
+
+    def evaluate(self, job: _Job, base_params: dict, max_rounds: int, early_stopping_rounds: int) -> dict:
+        trial, config, start, stop = job
+        t0 = time.perf_counter()
+        scores, rounds = [], []
+        for fold in range(start, stop):
+            dtrain, dvalid = self.dmatrices(fold)
+            params = {
+                **base_params,
+                **config,
+                "objective": "binary:logistic",
+                "eval_metric": SEARCH_METRIC,
+                "tree_method": "hist",
+                "max_bin": self.max_bin,
+                "nthread": self.nthread,
+                "seed": int(base_params.get("seed", 0)) + fold,
+            }
+            booster = xgb.train(
+                params,
+                dtrain,
+                num_boost_round=max_rounds,
+                evals=[(dvalid, "valid")],
+                early_stopping_rounds=early_stopping_rounds,
+                verbose_eval=False,
+            )
+            scores.append(float(booster.best_score))
+            rounds.append(int(booster.best_iteration) + 1)
+        return {"trial": trial, "stop": stop, "scores": scores, "rounds": rounds, "seconds": time.perf_counter() - t0}
+
+
+# Built once per worker process by _init_worker
+_WORKER_DATA: Optional[FoldData] = None
+_WORKER_SHM: List[SharedMemory] = []
+
+
+def _init_worker(x_spec: ArraySpec, y_spec: ArraySpec, folds: list, nthread: int, max_bin: int) -> None:
+    global _WORKER_DATA
+    x_shm, X = attach_array(x_spec)
+    y_shm, y = attach_array(y_spec)
+    _WORKER_SHM.extend([x_shm, y_shm])
+    _WORKER_DATA = FoldData(X, y, folds, nthread=nthread, max_bin=max_bin)
+
+
+def _evaluate_in_worker(job: _Job, base_params: dict, max_rounds: int, early_stopping_rounds: int) -> dict:
+    return _WORKER_DATA.evaluate(job, base_params, max_rounds, early_stopping_rounds)
+
+
+class _Asha:
+    """
+    Asynchronous successive halving over fold rungs. A trial finishing rung k
+    is promoted once it is in the top 1/eta of everything that finished rung
+    k so far; the rest are pruned by never being promoted.
+    """
+
+    def __init__(self, rungs: List[int], eta: int):
+        self.rungs = rungs
+        self.eta = eta
+        self.trials: Dict[int, dict] = {}
+        # rung -> {trial: mean score over the rung's folds}
+        self.results: Dict[int, Dict[int, float]] = {k: {} for k in range(len(rungs))}
+        self.promoted: Dict[int, set] = {k: set() for k in range(len(rungs))}
+
+    def add_trial(self, trial: int, config: dict) -> _Job:
+        self.trials[trial] = {"config": config, "scores": [], "rounds": [], "seconds": 0.0, "rung": -1}
+        return trial, config, 0, self.rungs[0]
+
+    def record(self, result: dict) -> None:
+        t = self.trials[result["trial"]]
+        t["scores"] += result["scores"]
+        t["rounds"] += result["rounds"]
+        t["seconds"] += result["seconds"]
+        t["rung"] = self.rungs.index(result["stop"])
+        self.results[t["rung"]][result["trial"]] = float(np.mean(t["scores"]))
+
+    def next_promotion(self) -> Optional[_Job]:
+        # Deepest rung first, so good configs reach all folds early
+        for k in range(len(self.rungs) - 2, -1, -1):
+            done = self.results[k]
+            n_top = len(done) // self.eta
+            if n_top == 0:
+                continue
+            for trial in sorted(done, key=done.get, reverse=True)[:n_top]:
+                if trial not in self.promoted[k]:
+                    self.promoted[k].add(trial)
+                    return trial, self.trials[trial]["config"], self.rungs[k], self.rungs[k + 1]
+        return None
+
+    def leaderboard(self) -> List[dict]:
+        rows = []
+        for trial, t in self.trials.items():
+            if not t["scores"]:
+                continue
+            rows.append({
+                "trial": trial,
+                "folds": len(t["scores"]),
+                "score": float(np.mean(t["scores"])),
+                "score_std": float(np.std(t["scores"])),
+                "n_estimators": int(np.median(t["rounds"])),
+                "seconds": round(t["seconds"], 3),
+                "config": t["config"],
+            })
+        # Trials that survived more folds rank first, then by mean score
+        return sorted(rows, key=lambda r: (-r["folds"], -r["score"]))
+
+
+def asha_search(
+    X: np.ndarray,
+    y: np.ndarray,
+    folds: List[Tuple[np.ndarray, np.ndarray]],
+    base_params: dict,
+    n_trials: int = 40,
+    time_budget_s: float = 600.0,
+    n_cpus: Optional[int] = None,
+    n_workers: Optional[int] = None,
+    eta: int = 3,
+    max_rounds: int = 2000,
+    early_stopping_rounds: int = 50,
+    max_bin: int = 256,
+    random_state: int = 42,
+) -> dict:
+    """
+    ASHA over SEARCH_SPACE with the CV folds as the budget: every trial starts
+    on the first fold and is promoted to more folds only while it ranks in the
+    top 1/eta of its rung. Each fold fit early-stops on that fold's validation
+    PR-AUC, so n_estimators is tuned per trial.
+
+    CPU use is bounded by n_cpus (workers x nthread); wall time by
+    time_budget_s (no new trials or promotions after it; running ones finish).
+    base_params holds the non-searched settings (scale_pos_weight, seed).
+    """
+    rungs = rung_folds(len(folds), eta)
+    rng = np.random.default_rng(random_state)
+    asha = _Asha(rungs, eta)
+    workers, nthread = plan_workers(n_trials, n_workers, n_cores=n_cpus)
+    t0 = time.perf_counter()
+    n_started = 0
+
+    def next_job() -> Optional[_Job]:
+        nonlocal n_started
+        if time.perf_counter() - t0 > time_budget_s:
+            return None
+        job = asha.next_promotion()
+        if job is None and n_started < n_trials:
+            config = BASELINE_CONFIG if n_started == 0 else sample_config(rng)
+            job = asha.add_trial(n_started, dict(config))
+            n_started += 1
+        return job
+
+    args = (base_params, max_rounds, early_stopping_rounds)
+    if workers == 1:
+        data = FoldData(X, y, folds, nthread=n_cpus or os.cpu_count() or 1, max_bin=max_bin)
+        job = next_job()
+        while job is not None:
+            asha.record(data.evaluate(job, *args))
+            job = next_job()
+    else:
+        shared = [share_array(X), share_array(y)]
+        try:
+            # Thread limits go in the environment the spawned workers start from
+            with worker_thread_env(nthread), ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(shared[0][1], shared[1][1], folds, nthread, max_bin),
+            ) as pool:
+                pending: Dict[Future, _Job] = {}
+                while True:
+                    while len(pending) < workers:
+                        job = next_job()
+                        if job is None:
+                            break
+                        pending[pool.submit(_evaluate_in_worker, job, *args)] = job
+                    if not pending:
+                        break
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        pending.pop(fut)
+                        asha.record(fut.result())
+        finally:
+            for shm, _ in shared:
+                shm.close()
+                shm.unlink()
+
+    board = asha.leaderboard()
+    if not board:
+        raise RuntimeError("Hyperparameter search finished no trials; raise the time budget.")
+    best = board[0]
+    return {
+        "method": "asha",
+        "metric": f"valid_{SEARCH_METRIC}",
+        "best_config": {**best["config"], "n_estimators": best["n_estimators"]},
+        "best_score": best["score"],
+        "leaderboard": board,
+        "rungs": rungs,
+        "eta": eta,
+        "n_trials": n_started,
+        "n_full_trials": sum(1 for r in board if r["folds"] == len(folds)),
+        "workers": workers,
+        "nthread": nthread,
+        "time_budget_s": time_budget_s,
+        "wall_seconds": time.perf_counter() - t0,
+    }
@@ -1,6 +1,6 @@
-import pandas as pd
+from src.fusion_model_files.utils import read_table
 
-df = pd.read_csv("data/processed/fusion_master_with_proxy.csv")
+df = read_table("data/processed/fusion_master_with_proxy.csv")
 
 # 1) Check proxy score distribution
 print(df["pph_proxy_score_v1"].describe())
@@ -1,100 +1,47 @@
 from __future__ import annotations
 import argparse
-import numpy as np
+import os
+from datetime import datetime
+from typing import Optional
 import pandas as pd
-
-
-def _clip01(x):
-    return np.clip(x, 0.0, 1.0)
-
-
-def _as_num(s: pd.Series) -> pd.Series:
-    return pd.to_numeric(s, errors="coerce").astype(float)
-
-
-def _minmax_series(s: pd.Series, lo=None, hi=None) -> pd.Series:
-    s = _as_num(s)
-    valid = s.dropna()
-    if valid.empty:
-        return pd.Series(0.0, index=s.index)
-    if lo is None:
-        lo = float(valid.quantile(0.05))
-    if hi is None:
-        hi = float(valid.quantile(0.95))
-    if hi <= lo:
-        return pd.Series(0.0, index=s.index)
-    return pd.Series(_clip01((s - lo) / (hi - lo + 1e-6)), index=s.index).fillna(0.0)
-
-
-def _tachy_score(hr: pd.Series, low: float = 90, high: float = 130) -> pd.Series:
-    hr = _as_num(hr)
-    return pd.Series(_clip01((hr - low) / (high - low + 1e-6)), index=hr.index).fillna(0.0)
-
-
-def _bp_extreme_score(bp: pd.Series, low_bad: float, low_ok: float, high_ok: float, high_bad: float) -> pd.Series:
-    bp = _as_num(bp)
-    score_low = _clip01((low_ok - bp) / (low_ok - low_bad + 1e-6))
-    score_high = _clip01((bp - high_ok) / (high_bad - high_ok + 1e-6))
-    out = np.maximum(score_low, score_high)
-    return pd.Series(out, index=bp.index).fillna(0.0)
-
-
-def build_pph_proxy_rule_v1(df: pd.DataFrame) -> pd.DataFrame:
-    out = df.copy()
-
-    # Anemia burden
-    if "p_anemia" in out.columns:
-        anemia = _as_num(out["p_anemia"]).fillna(0.0).clip(0, 1)
-    else:
-        anemia = pd.Series(0.0, index=out.index)
-
-    # Hemodynamic stress (PPG proxies)
-    hr_score = _tachy_score(out["hr_bpm_est"]) if "hr_bpm_est" in out.columns else pd.Series(0.0, index=out.index)
-    ibi_var_score = _minmax_series(out["ibi_std"]) if "ibi_std" in out.columns else pd.Series(0.0, index=out.index)
-
-    if "peak_count" in out.columns:
-        peak_count = _as_num(out["peak_count"]).fillna(0.0)
-        peak_penalty = pd.Series(_clip01((3.0 - peak_count) / 3.0), index=out.index).fillna(0.0)
-    else:
-        peak_penalty = pd.Series(0.0, index=out.index)
-
-    amp_score = _minmax_series(-_as_num(out["ppg_amp_mean"])) if "ppg_amp_mean" in out.columns else pd.Series(0.0, index=out.index)
-
-    hemo = (0.45 * hr_score + 0.30 * ibi_var_score + 0.15 * peak_penalty + 0.10 * amp_score).clip(0, 1)
-
-    # Clinical burden
-    clinical_terms = []
-
-    for col in ["prev_complications", "hypertension_flag", "diabetes_any", "preexist_diabetes", "gest_diabetes"]:
-        if col in out.columns:
-            clinical_terms.append(_as_num(out[col]).fillna(0.0).clip(0, 1))
-
-    if "systolic_bp" in out.columns:
-        clinical_terms.append(_bp_extreme_score(out["systolic_bp"], low_bad=70, low_ok=90, high_ok=140, high_bad=180))
-    if "diastolic_bp" in out.columns:
-        clinical_terms.append(_bp_extreme_score(out["diastolic_bp"], low_bad=40, low_ok=60, high_ok=90, high_bad=110))
-    if "map_mmhg" in out.columns:
-        clinical_terms.append(_bp_extreme_score(out["map_mmhg"], low_bad=50, low_ok=65, high_ok=105, high_bad=130))
-    if "pulse_pressure" in out.columns:
-        clinical_terms.append(_minmax_series(out["pulse_pressure"]))
-
-    clinical = pd.concat(clinical_terms, axis=1).mean(axis=1).fillna(0.0) if clinical_terms else pd.Series(0.0, index=out.index)
-
-    # Maternal risk prior
-    if "Risk Level" in out.columns:
-        rl = out["Risk Level"].astype(str).str.strip().str.lower()
-        rl_score = rl.map({"low": 0.1, "medium": 0.5, "high": 0.9}).fillna(0.0)
-    else:
-        rl_score = pd.Series(0.0, index=out.index)
-
-    # Weighted proxy score
-    out["pph_proxy_score_v1"] = (
-        0.35 * anemia +
-        0.35 * hemo +
-        0.25 * clinical +
-        0.05 * rl_score
-    ).clip(0, 1)
-
+from src.fusion_model_files.proxy_kernel import (
+    PROXY_INPUT_COLUMNS,
+    Bounds,
+    fit_minmax_bounds,
+    proxy_input_matrix,
+    proxy_score_kernel,
+)
+from src.fusion_model_files.utils import (
+    is_parquet_path,
+    iter_table_chunks,
+    load_json,
+    read_table,
+    save_json,
+    table_columns,
+    write_table,
+)
+
+# Bumped when the meaning of the state file changes
+PROXY_STATE_VERSION = 1
+
+
+def fit_proxy_bounds(df: pd.DataFrame) -> Bounds:
+    """Normalization bounds of the min-max terms, fitted on a reference window."""
+    return fit_minmax_bounds(*proxy_input_matrix(df))
+
+
+def build_pph_proxy_rule_v1(df: pd.DataFrame, bounds: Optional[Bounds] = None) -> pd.DataFrame:
+    """
+    Adds pph_proxy_score_v1. Only the ~15 rule inputs are read (as one float32
+    matrix); the score comes from proxy_score_kernel. Without `bounds` the
+    min-max terms are fitted on df itself; with bounds (from fit_proxy_bounds /
+    the state file) rows are scored independently of each other.
+    """
+    x, present = proxy_input_matrix(df)
+
+    # Shallow copy: new columns only, the feature data is not duplicated
+    out = df.copy(deep=False)
+    out["pph_proxy_score_v1"] = proxy_score_kernel(x, present, bounds)
     out["pph_proxy_label_type"] = "proxy_rule_v1"
     return out
 
@@ -105,7 +52,7 @@ def assign_proxy_labels(
     threshold: float = 0.55,
     quantile: float = 0.85,
 ) -> tuple[pd.DataFrame, float, str]:
-    out = df.copy()
+    out = df.copy(deep=False)
 
     if "pph_proxy_score_v1" not in out.columns:
         raise ValueError("pph_proxy_score_v1 not found. Run build_pph_proxy_rule_v1 first.")
@@ -132,33 +79,63 @@ def assign_proxy_labels(
     return out, t, mode_desc
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Add pph proxy rule v1 columns to fusion master table.")
-    parser.add_argument("--input", default="data/processed/fusion_master_table.csv")
-    parser.add_argument("--output", default="data/processed/fusion_master_with_proxy.csv")
+def fit_proxy_state(
+    df: pd.DataFrame,
+    threshold_mode: str = "fixed",
+    threshold: float = 0.55,
+    quantile: float = 0.85,
+) -> dict:
+    """
+    Everything incremental scoring needs from the reference window:
+    min-max bounds, the resolved label threshold and which rule inputs the
+    reference table has (serving uses that column mask, not per-request keys).
+    """
+    bounds = fit_proxy_bounds(df)
+    scored = build_pph_proxy_rule_v1(df, bounds=bounds)
+    _, t, mode_desc = assign_proxy_labels(scored, threshold_mode=threshold_mode, threshold=threshold, quantile=quantile)
+    return {
+        "version": PROXY_STATE_VERSION,
+        "fitted_at": datetime.now().isoformat(timespec="seconds"),
+        "reference_rows": int(len(df)),
+        "bounds": bounds,
+        "present_columns": [c for c in PROXY_INPUT_COLUMNS if c in df.columns],
+        "threshold_mode": threshold_mode,
+        "threshold": float(t),
+        "threshold_desc": mode_desc,
+        "last_row_id": _max_row_id(df),
+    }
+
+
+def label_with_state(df: pd.DataFrame, state: dict) -> pd.DataFrame:
+    """Scores and labels rows with frozen bounds and threshold (single vectorized pass)."""
+    out = build_pph_proxy_rule_v1(df, bounds=state["bounds"])
+    out, _, _ = assign_proxy_labels(out, threshold_mode="fixed", threshold=state["threshold"])
+    out["pph_proxy_threshold_mode"] = state["threshold_mode"]
+    return out
 
-    # Threshold behavior
-    parser.add_argument("--threshold-mode", choices=["fixed", "quantile"], default="fixed")
-    parser.add_argument("--threshold", type=float, default=0.55, help="Used when --threshold-mode fixed")
-    parser.add_argument("--quantile", type=float, default=0.85, help="Used when --threshold-mode quantile (e.g., 0.85 => top 15% positive)")
 
-    args = parser.parse_args()
+def load_proxy_state(path: str) -> dict:
+    state = load_json(path)
+    if state.get("version") != PROXY_STATE_VERSION:
+        raise ValueError(f"Unsupported proxy state version in {path}: {state.get('version')}. Run --mode refit.")
+    return state
 
-    df = pd.read_csv(args.input)
 
-    # Build continuous proxy score
-    out = build_pph_proxy_rule_v1(df)
+def _max_row_id(df: pd.DataFrame) -> Optional[int]:
+    if "row_id" not in df.columns or df.empty:
+        return None
+    return int(pd.to_numeric(df["row_id"], errors="coerce").max())
 
-    # Assign binary labels using chosen mode
-    out, t, mode_desc = assign_proxy_labels(
-        out,
-        threshold_mode=args.threshold_mode,
-        threshold=args.threshold,
-        quantile=args.quantile,
-    )
 
-    out.to_csv(args.output, index=False)
+def _read_new_rows(path: str, last_row_id: Optional[int], chunksize: int = 50_000) -> pd.DataFrame:
+    # Rows past the row_id watermark; inputs without row_id are treated as all-new (a delta file)
+    if last_row_id is None or "row_id" not in table_columns(path):
+        return read_table(path)
+    parts = [c[c["row_id"] > last_row_id] for c in iter_table_chunks(path, chunksize)]
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
 
+def _print_summary(out: pd.DataFrame) -> None:
     # Debug summary
     scores = out["pph_proxy_score_v1"]
     print(scores.describe())
@@ -168,10 +145,84 @@ def main():
         prev = (scores >= thr).mean()
         print(f"threshold={thr:.2f} -> prevalence={prev:.3f}")
 
+
+def main():
+    parser = argparse.ArgumentParser(description="Add pph proxy rule v1 columns to fusion master table.")
+    parser.add_argument("--input", default="data/processed/fusion_master_table.csv")
+    parser.add_argument("--output", default="data/processed/fusion_master_with_proxy.csv", help="Output .csv or .parquet")
+
+    # Threshold behavior
+    parser.add_argument("--threshold-mode", choices=["fixed", "quantile"], default="fixed")
+    parser.add_argument("--threshold", type=float, default=0.55, help="Used when --threshold-mode fixed")
+    parser.add_argument("--quantile", type=float, default=0.85, help="Used when --threshold-mode quantile (e.g., 0.85 => top 15% positive)")
+
+    # Incremental labelling
+    parser.add_argument(
+        "--mode",
+        choices=["full", "incremental", "refit"],
+        default="full",
+        help="full: relabel everything and save the state; incremental: label only rows past the state's "
+             "row_id watermark and append them to --output; refit: refit the state on --input (reference window) only.",
+    )
+    parser.add_argument("--state", default="data/processed/pph_proxy_state.json", help="Fitted bounds + threshold")
+
+    args = parser.parse_args()
+
+    if args.mode == "refit":
+        state = fit_proxy_state(
+            read_table(args.input),
+            threshold_mode=args.threshold_mode,
+            threshold=args.threshold,
+            quantile=args.quantile,
+        )
+        # Keep labelling where the previous state stopped; existing labels are not recomputed
+        if os.path.exists(args.state):
+            state["last_row_id"] = load_proxy_state(args.state).get("last_row_id", state["last_row_id"])
+        save_json(state, args.state)
+        print(f"Refitted proxy state on {state['reference_rows']} rows ({state['threshold_desc']}): {args.state}")
+        print("Existing labels were not recomputed; run --mode full to relabel history with the new state.")
+        return
+
+    if args.mode == "incremental":
+        if is_parquet_path(args.output):
+            raise ValueError("--mode incremental appends to --output and needs a .csv output.")
+        state = load_proxy_state(args.state)
+        new = _read_new_rows(args.input, state.get("last_row_id"))
+        if new.empty:
+            print(f"No rows past row_id {state.get('last_row_id')}; nothing to label.")
+            return
+
+        out = label_with_state(new, state)
+        if os.path.exists(args.output):
+            # Same columns, same order as what is already there
+            out.reindex(columns=table_columns(args.output)).to_csv(args.output, mode="a", header=False, index=False)
+        else:
+            write_table(out, args.output)
+
+        last = _max_row_id(out)
+        if last is not None:
+            state["last_row_id"] = max(last, state.get("last_row_id") or last)
+        save_json(state, args.state)
+        print(f"Labelled {len(out)} new rows ({state['threshold_desc']}); appended to {args.output}")
+        print(f"Proxy prevalence (new rows): {float(out['pph_proxy_v1'].mean()):.4f}")
+        return
+
+    df = read_table(args.input)
+
+    # Fit on the full table (same result as fitting inside the scoring pass) and keep the state
+    state = fit_proxy_state(df, threshold_mode=args.threshold_mode, threshold=args.threshold, quantile=args.quantile)
+    out = label_with_state(df, state)
+    mode_desc = state["threshold_desc"]
+
+    write_table(out, args.output)
+    save_json(state, args.state)
+
+    _print_summary(out)
+
     print(f"\nThreshold mode used: {mode_desc}")
     print(f"Saved: {args.output} | shape={out.shape}")
     print(f"Proxy prevalence: {float(out['pph_proxy_v1'].mean()):.4f}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,11 +1,10 @@
 from __future__ import annotations
 import argparse
 import os
-from typing import Dict, List
+from typing import Dict, List, Optional
 import joblib
 import numpy as np
 import pandas as pd
-import xgboost as xgb
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import (
     average_precision_score,
@@ -17,7 +16,29 @@ from sklearn.metrics import (
     roc_auc_score,
 )
 from sklearn.model_selection import StratifiedKFold
-from src.fusion_model_files.utils import ensure_dir, pick_threshold_for_recall, save_json, timestamp_version
+from src.fusion_model_files.feature_selection import (
+    DEFAULT_SIZES,
+    WAVEFORM_MODES,
+    drop_identifier_and_leakage,
+    fit_waveform_pca,
+    save_waveform_pca,
+    select_features,
+    split_waveform,
+    subset_waveform_pca,
+    transform_waveform_pca,
+)
+from src.fusion_model_files.fold_scheduler import FoldTask, run_fold_tasks
+from src.fusion_model_files.hparam_search import BASELINE_CONFIG, asha_search
+from src.fusion_model_files.utils import (
+    ensure_dir,
+    curve_to_json,
+    explanation_feature_groups,
+    load_json,
+    optimize_threshold,
+    read_table,
+    save_json,
+    timestamp_version,
+)
 
 
 def build_feature_matrix(df: pd.DataFrame, include_risk_level: bool = False) -> tuple[pd.DataFrame, np.ndarray]:
@@ -39,8 +60,9 @@ def build_feature_matrix(df: pd.DataFrame, include_risk_level: bool = False) ->
 
     X_df = df.drop(columns=[c for c in drop_cols if c in df.columns], errors="ignore").copy()
 
-    # Keep numeric only
+    # Keep numeric only; row keys and proxy-labelling outputs are never inputs
     X_df = X_df.select_dtypes(include=[np.number]).copy()
+    X_df, _ = drop_identifier_and_leakage(X_df)
     X_df = X_df.replace([np.inf, -np.inf], np.nan)
     X_df = X_df.fillna(X_df.median(numeric_only=True))
 
@@ -48,39 +70,170 @@ def build_feature_matrix(df: pd.DataFrame, include_risk_level: bool = False) ->
     return X_df, y
 
 
-def train_xgb_oof_calibrated(X: np.ndarray, y: np.ndarray, random_state: int = 42, n_splits: int = 5) -> dict:
-    skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
-    oof_base = np.zeros(len(y), dtype=float)
-    fold_stats = []
-
+def class_weight(y: np.ndarray) -> float:
     pos = int(y.sum())
-    neg = int(len(y) - pos)
-    spw = float(neg / max(pos, 1))
-
-    for fold, (tr, te) in enumerate(skf.split(X, y), start=1):
-        model = xgb.XGBClassifier(
-            n_estimators=500,
-            max_depth=4,
-            learning_rate=0.03,
-            subsample=0.9,
-            colsample_bytree=0.9,
-            reg_lambda=1.0,
-            gamma=0.0,
-            min_child_weight=2,
-            scale_pos_weight=spw,
-            eval_metric="logloss",
-            random_state=random_state + fold,
-            n_jobs=-1,
-        )
-        model.fit(X[tr], y[tr])
+    return float((len(y) - pos) / max(pos, 1))
 
-        p = model.predict_proba(X[te])[:, 1]
-        oof_base[te] = p
 
+def xgb_params(scale_pos_weight: float, random_state: int, config: Optional[dict] = None) -> dict:
+    """
+    XGBClassifier settings shared by the CV folds and the final model
+    (n_jobs set by the scheduler). config: tuned values from the search.
+    """
+    return {
+        "n_estimators": 500,
+        **BASELINE_CONFIG,
+        **(config or {}),
+        "scale_pos_weight": scale_pos_weight,
+        "eval_metric": "logloss",
+        "random_state": random_state,
+    }
+
+
+def cv_splits(y: np.ndarray, n_splits: int, random_state: int) -> List[tuple]:
+    skf = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    return list(skf.split(np.zeros(len(y)), y))
+
+
+def fit_fold_plans(
+    X_base: np.ndarray,
+    base_names: List[str],
+    waveform: Optional[np.ndarray],
+    y: np.ndarray,
+    outer: List[tuple],
+    random_state: int = 42,
+    inner_splits: int = 3,
+    waveform_components: int = 16,
+    selection: Optional[dict] = None,
+    search: Optional[dict] = None,
+) -> Dict[int, dict]:
+    """
+    Everything fitted on the data ahead of the final CV, redone per outer
+    training part so the outer test rows (OOF scores, calibrator, threshold,
+    metrics) never shape the model they score: waveform PCA on the part's
+    rows, then gain selection (selection: select_features kwargs) and the
+    ASHA search (search: asha_search kwargs) on inner folds of the part.
+    Fold 0 = all rows (the deployed model).
+
+    Returns {fold: {"pca", "features", "selection", "search"}}.
+    """
+    parts = [(0, np.arange(len(y)))] + [(fold, tr) for fold, (tr, _) in enumerate(outer, start=1)]
+    plans = {}
+    for fold, rows in parts:
+        y_part = y[rows]
+        inner = cv_splits(y_part, inner_splits, random_state + 1)
+        X_part, names, pca = X_base[rows], list(base_names), None
+        if waveform is not None:
+            pca = fit_waveform_pca(waveform[rows], waveform_components)
+            X_part = np.hstack([X_part, transform_waveform_pca(waveform[rows], pca)])
+            names += pca["features"]
+        plan = {"pca": pca, "features": names, "selection": None, "search": None}
+
+        if selection is not None:
+            sel = select_features(
+                np.ascontiguousarray(X_part, dtype=np.float32),
+                y_part,
+                names,
+                folds=inner,
+                params=xgb_params(class_weight(y_part), random_state),
+                **selection,
+            )
+            index = {name: j for j, name in enumerate(names)}
+            X_part = X_part[:, [index[c] for c in sel["features"]]]
+            plan.update(
+                features=sel["features"],
+                selection=sel["report"],
+                pca=subset_waveform_pca(pca, sel["features"]) if pca is not None else None,
+            )
+            print(f"[Selection fold {fold}] {len(names)} -> {len(sel['features'])} features")
+            if fold == 0:
+                for row in sel["report"]["tradeoff"]:
+                    print(f"  n={row['n_features']:>5}  PR-AUC={row['pr_auc_oof']:.4f}  "
+                          f"1 row={row['latency_ms_1row']:.3f}ms  1k rows={row['latency_ms_1k_rows']:.2f}ms")
+
+        if search is not None:
+            r = asha_search(
+                np.ascontiguousarray(X_part, dtype=np.float32),
+                y_part,
+                folds=inner,
+                base_params={"scale_pos_weight": class_weight(y_part), "seed": random_state + 1},
+                random_state=random_state,
+                **search,
+            )
+            plan["search"] = r
+            print(f"[Search fold {fold}] {r['n_trials']} trials ({r['n_full_trials']} on all inner folds) in "
+                  f"{r['wall_seconds']:.1f}s; best {r['metric']}={r['best_score']:.4f}: {r['best_config']}")
+        plans[fold] = plan
+    return plans
+
+
+def fold_matrix(
+    X_base: np.ndarray,
+    base_names: List[str],
+    waveform: Optional[np.ndarray],
+    plans: Dict[int, dict],
+) -> tuple[np.ndarray, Dict[int, np.ndarray]]:
+    """
+    One matrix for all fits: the base columns plus each plan's own PCA block
+    (projected for every row), and per fold the column indices of its plan's
+    features, in the plan's order.
+    """
+    index = {name: j for j, name in enumerate(base_names)}
+    blocks, width = [X_base], X_base.shape[1]
+    fold_columns = {}
+    for fold, plan in sorted(plans.items()):
+        pcs = {}
+        if plan["pca"] is not None:
+            blocks.append(transform_waveform_pca(waveform, plan["pca"]).astype(np.float32))
+            pcs = {name: width + i for i, name in enumerate(plan["pca"]["features"])}
+            width += len(pcs)
+        fold_columns[fold] = np.asarray([pcs.get(c, index.get(c)) for c in plan["features"]], dtype=np.intp)
+    return np.ascontiguousarray(np.hstack(blocks), dtype=np.float32), fold_columns
+
+
+def train_xgb_oof_calibrated(
+    X: np.ndarray,
+    y: np.ndarray,
+    random_state: int = 42,
+    n_splits: int = 5,
+    min_recall: float = 0.90,
+    max_alert_rate: Optional[float] = None,
+    threshold_objective: str = "precision",
+    cv_workers: Optional[int] = None,
+    fold_configs: Optional[Dict[int, dict]] = None,
+    fold_columns: Optional[Dict[int, np.ndarray]] = None,
+) -> dict:
+    """
+    fold_configs / fold_columns: tuned XGBoost settings and feature columns
+    of X per fold (0 = final model), each chosen without that fold's test
+    rows (see fit_fold_plans). Missing entries use the defaults / all columns.
+    """
+    spw = class_weight(y)
+    fold_configs = fold_configs or {}
+    fold_columns = fold_columns or {}
+
+    # The CV folds and the final all-rows model (fold 0) run concurrently,
+    # each with its share of the cores; cv_workers=1 is the serial loop
+    splits = list(enumerate(cv_splits(y, n_splits, random_state), start=1))
+    tasks: List[FoldTask] = [
+        (0, np.arange(len(y)), None, xgb_params(spw, random_state, fold_configs.get(0)), fold_columns.get(0))
+    ]
+    tasks += [
+        (fold, tr, te, xgb_params(spw, random_state + fold, fold_configs.get(fold)), fold_columns.get(fold))
+        for fold, (tr, te) in splits
+    ]
+    run = run_fold_tasks(X, y, tasks, n_workers=cv_workers)
+    oof_base = run["oof"]
+    final_model = run["models"][0]
+    print(f"[CV] {len(tasks)} fits on {run['workers']} workers x {run['nthread']} threads: {run['wall_seconds']:.1f}s")
+
+    fold_stats = []
+    for fold, (_, te) in splits:
+        p = oof_base[te]
         # Fold metrics (guard ROC-AUC on edge case)
         fold_pr = float(average_precision_score(y[te], p))
         fold_roc = float(roc_auc_score(y[te], p)) if len(np.unique(y[te])) > 1 else None
-        fold_stats.append({"fold": fold, "pr_auc": fold_pr, "roc_auc": fold_roc})
+        fold_stats.append({"fold": fold, "pr_auc": fold_pr, "roc_auc": fold_roc, "fit_seconds": run["task_seconds"][fold]})
         print(f"[Fold {fold}] PR-AUC={fold_pr:.4f} ROC-AUC={fold_roc if fold_roc is not None else 'NA'}")
 
     # Platt calibrator on OOF predictions
@@ -88,13 +241,25 @@ def train_xgb_oof_calibrated(X: np.ndarray, y: np.ndarray, random_state: int = 4
     calibrator.fit(oof_base.reshape(-1, 1), y)
     oof_cal = calibrator.predict_proba(oof_base.reshape(-1, 1))[:, 1]
 
-    threshold = pick_threshold_for_recall(y, oof_cal, min_recall=0.90)
+    # Best-precision operating point with recall >= min_recall (and alert-rate cap)
+    threshold_info = optimize_threshold(
+        y,
+        oof_cal,
+        min_recall=min_recall,
+        max_alert_rate=max_alert_rate,
+        objective=threshold_objective,
+    )
+    threshold = threshold_info["threshold"]
+    if not threshold_info["constraints_met"]:
+        print("[WARN] No threshold meets the operating constraints; using the highest-recall point:", threshold)
     y_pred = (oof_cal >= threshold).astype(int)
 
     metrics = {
         "roc_auc_oof_cal": float(roc_auc_score(y, oof_cal)) if len(np.unique(y)) > 1 else None,
         "pr_auc_oof_cal": float(average_precision_score(y, oof_cal)),
         "threshold": float(threshold),
+        "threshold_constraints_met": threshold_info["constraints_met"],
+        "alert_rate_oof": threshold_info["operating_point"]["alert_rate"],
         "recall_oof": float(recall_score(y, y_pred, zero_division=0)),
         "precision_oof": float(precision_score(y, y_pred, zero_division=0)),
         "f1_oof": float(f1_score(y, y_pred, zero_division=0)),
@@ -103,31 +268,19 @@ def train_xgb_oof_calibrated(X: np.ndarray, y: np.ndarray, random_state: int = 4
         "confusion_matrix_oof": confusion_matrix(y, y_pred).tolist(),
         "classification_report_oof": classification_report(y, y_pred, zero_division=0, output_dict=True),
         "scale_pos_weight": spw,
+        "xgb_params": xgb_params(spw, random_state, fold_configs.get(0)),
+        "cv_workers": run["workers"],
+        "cv_nthread": run["nthread"],
+        "cv_wall_seconds": run["wall_seconds"],
     }
 
-    # Final model trained on all data
-    final_model = xgb.XGBClassifier(
-        n_estimators=500,
-        max_depth=4,
-        learning_rate=0.03,
-        subsample=0.9,
-        colsample_bytree=0.9,
-        reg_lambda=1.0,
-        gamma=0.0,
-        min_child_weight=2,
-        scale_pos_weight=spw,
-        eval_metric="logloss",
-        random_state=random_state,
-        n_jobs=-1,
-    )
-    final_model.fit(X, y)
-
     return {
         "final_model": final_model,
         "calibrator": calibrator,
         "oof_base": oof_base,
         "oof_cal": oof_cal,
         "metrics": metrics,
+        "threshold_info": threshold_info,
     }
 
 
@@ -187,9 +340,24 @@ def main():
     parser.add_argument("--artifacts-root", default="models_artifacts/fusion_pph_proxy")
     parser.add_argument("--include-risk-level", action="store_true", help="Include Risk Level (numeric if present) as feature if available.")
     parser.add_argument("--random-state", type=int, default=42)
+    parser.add_argument("--min-recall", type=float, default=0.90)
+    parser.add_argument("--max-alert-rate", type=float, default=None, help="Optional cap on the share of visits flagged.")
+    parser.add_argument("--threshold-objective", choices=["precision", "fbeta", "recall"], default="precision")
+    parser.add_argument("--cv-workers", type=int, default=None, help="Processes for the CV folds + final fit (default: one per fit, capped at the core count; 1 = serial).")
+    parser.add_argument("--waveform-mode", choices=list(WAVEFORM_MODES), default="raw", help="Raw PPG samples as features, their principal components, or neither.")
+    parser.add_argument("--waveform-components", type=int, default=16)
+    parser.add_argument("--feature-selection", choices=["none", "gain"], default="none", help="gain: keep the smallest stable top-gain set within --selection-tolerance PR-AUC of the best.")
+    parser.add_argument("--selection-sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--selection-tolerance", type=float, default=0.01)
+    parser.add_argument("--search", choices=["none", "asha"], default="none", help="Tune the XGBoost settings with ASHA before the final CV.")
+    parser.add_argument("--search-trials", type=int, default=40)
+    parser.add_argument("--search-budget-s", type=float, default=600.0, help="Total wall-clock budget, split evenly over the per-fold searches.")
+    parser.add_argument("--inner-splits", type=int, default=3, help="Inner CV folds (within each outer training part) for the search.")
+    parser.add_argument("--search-cpus", type=int, default=None, help="Cores the search may use (default: all).")
+    parser.add_argument("--proxy-state", default="data/processed/pph_proxy_state.json", help="proxy_rules state copied into the version (rule score at API time).")
     args = parser.parse_args()
 
-    df = pd.read_csv(args.input)
+    df = read_table(args.input)
 
     # If unsupervised fusion embeddings haven't been merged, script still works on base features.
     if "pph_proxy_v1" not in df.columns:
@@ -201,9 +369,94 @@ def main():
         df["Risk Level"] = rl
 
     X_df, y = build_feature_matrix(df, include_risk_level=args.include_risk_level)
+    X_df, waveform = split_waveform(X_df, df, args.waveform_mode)
+    base_names = X_df.columns.tolist()
     X = X_df.values.astype(np.float32)
 
-    result = train_xgb_oof_calibrated(X, y, random_state=args.random_state, n_splits=5)
+    n_splits = 5
+    outer = cv_splits(y, n_splits, args.random_state)
+    plans = None
+    if waveform is not None or args.feature_selection == "gain" or args.search == "asha":
+        # Nested: PCA, selection and search never see the outer test rows
+        plans = fit_fold_plans(
+            X,
+            base_names,
+            waveform,
+            y,
+            outer,
+            random_state=args.random_state,
+            inner_splits=args.inner_splits,
+            waveform_components=args.waveform_components,
+            selection={
+                "sizes": args.selection_sizes,
+                "tolerance": args.selection_tolerance,
+                "n_workers": args.cv_workers,
+            } if args.feature_selection == "gain" else None,
+            search={
+                "n_trials": args.search_trials,
+                "time_budget_s": args.search_budget_s / (n_splits + 1),
+                "n_cpus": args.search_cpus,
+            } if args.search == "asha" else None,
+        )
+        X, fold_columns = fold_matrix(X, base_names, waveform, plans)
+        feature_names = plans[0]["features"]
+        waveform_pca = plans[0]["pca"]
+    else:
+        fold_columns, feature_names, waveform_pca = None, base_names, None
+
+    result = train_xgb_oof_calibrated(
+        X,
+        y,
+        random_state=args.random_state,
+        n_splits=n_splits,
+        min_recall=args.min_recall,
+        max_alert_rate=args.max_alert_rate,
+        threshold_objective=args.threshold_objective,
+        cv_workers=args.cv_workers,
+        fold_configs={fold: p["search"]["best_config"] for fold, p in plans.items() if p["search"]} if plans else None,
+        fold_columns=fold_columns,
+    )
+    splits = {
+        "outer": {"n_splits": n_splits, "random_state": args.random_state, "used_for": "OOF metrics, calibrator, threshold"},
+        "inner": {
+            "n_splits": args.inner_splits,
+            "random_state": args.random_state + 1,
+            "scope": "within each outer training part; fold 0 = all rows (deployed model)",
+        },
+    }
+    if args.search == "asha":
+        result["metrics"]["hparam_search"] = {
+            "splits": splits,
+            "final": plans[0]["search"],
+            "outer_folds": [
+                {
+                    "fold": fold,
+                    "best_config": p["search"]["best_config"],
+                    "best_inner_score": p["search"]["best_score"],
+                    "n_trials": p["search"]["n_trials"],
+                    "wall_seconds": p["search"]["wall_seconds"],
+                }
+                for fold, p in sorted(plans.items()) if fold
+            ],
+        }
+    if args.feature_selection == "gain":
+        result["metrics"]["feature_selection"] = {
+            "splits": splits,
+            "final": plans[0]["selection"],
+            "outer_folds": [
+                {"fold": fold, "n_stable": p["selection"]["n_stable"], "n_selected": p["selection"]["n_selected"]}
+                for fold, p in sorted(plans.items()) if fold
+            ],
+        }
+    if waveform is not None:
+        result["metrics"]["waveform_pca"] = {
+            "splits": splits,
+            "outer_folds": [
+                {"fold": fold, "fit_rows": int(len(tr)), "n_components": len(plans[fold]["pca"]["features"]) if plans[fold]["pca"] else 0}
+                for fold, (tr, _) in enumerate(outer, start=1)
+            ],
+        }
+    result["metrics"]["n_features"] = len(feature_names)
 
     threshold = result["metrics"]["threshold"]
     y_pred_oof = (result["oof_cal"] >= threshold).astype(int)
@@ -215,12 +468,64 @@ def main():
     joblib.dump(result["final_model"], os.path.join(out_dir, "model.pkl"))
     joblib.dump(result["calibrator"], os.path.join(out_dir, "calibrator.pkl"))
 
-    save_json({"threshold": threshold, "target": "pph_proxy_v1", "min_recall": 0.90},
-              os.path.join(out_dir, "threshold.json"))
-    save_json({"features": X_df.columns.tolist(), "include_risk_level": bool(args.include_risk_level)},
-              os.path.join(out_dir, "features.json"))
+    # Lean serving artifacts: native booster + the two Platt parameters (no sklearn/joblib needed)
+    result["final_model"].get_booster().save_model(os.path.join(out_dir, "model.ubj"))
+    # JSON copy is read by the NumPy tree evaluator on hosts without xgboost
+    result["final_model"].get_booster().save_model(os.path.join(out_dir, "model.json"))
+    save_json(
+        {
+            "coef": float(np.ravel(result["calibrator"].coef_)[0]),
+            "intercept": float(np.ravel(result["calibrator"].intercept_)[0]),
+        },
+        os.path.join(out_dir, "calibrator.json"),
+    )
+
+    threshold_info = result["threshold_info"]
+    save_json(
+        {
+            "threshold": threshold,
+            "target": "pph_proxy_v1",
+            "min_recall": args.min_recall,
+            "max_alert_rate": args.max_alert_rate,
+            "objective": threshold_info["objective"],
+            "constraints_met": threshold_info["constraints_met"],
+            "operating_point": threshold_info["operating_point"],
+            # Full OOF operating curve (one point per distinct calibrated score)
+            "operating_curve": curve_to_json(threshold_info["curve"]),
+        },
+        os.path.join(out_dir, "threshold.json"),
+    )
+    features_obj = {
+        "features": feature_names,
+        "include_risk_level": bool(args.include_risk_level),
+        # Lets the API aggregate SHAP contributions by modality
+        "feature_groups": explanation_feature_groups(feature_names),
+        "waveform_mode": args.waveform_mode,
+        "feature_selection": args.feature_selection,
+    }
+    if waveform_pca is not None:
+        # The API projects raw samples onto these components at request time
+        features_obj["waveform_pca"] = {
+            **save_waveform_pca(waveform_pca, out_dir),
+            # The OOF metrics come from fold models with their own PCA (metrics.json waveform_pca)
+            "fit_scope": "all training rows (deployed model); each outer CV fold refits on its training part",
+        }
+    save_json(features_obj, os.path.join(out_dir, "features.json"))
     save_json(result["metrics"], os.path.join(out_dir, "metrics.json"))
 
+    # Frozen label rule next to the model, so the API can report both scores
+    if os.path.exists(args.proxy_state):
+        proxy_state = load_json(args.proxy_state)
+        proxy_rule = {
+            "bounds": proxy_state["bounds"],
+            "threshold": proxy_state["threshold"],
+            "threshold_mode": proxy_state["threshold_mode"],
+        }
+        # Column mask of the reference table; states written before it existed have none
+        if "present_columns" in proxy_state:
+            proxy_rule["present_columns"] = proxy_state["present_columns"]
+        save_json(proxy_rule, os.path.join(out_dir, "proxy_rule.json"))
+
     print("Saved fusion proxy artifacts:", out_dir)
     print("OOF PR-AUC:", result["metrics"]["pr_auc_oof_cal"])
     print("OOF Recall:", result["metrics"]["recall_oof"])
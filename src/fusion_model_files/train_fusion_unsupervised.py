@@ -1,7 +1,9 @@
 from __future__ import annotations
 import argparse
 import os
-from typing import List
+import shutil
+import tempfile
+from typing import List, Optional
 import joblib
 import numpy as np
 import pandas as pd
@@ -11,7 +13,8 @@ import tensorflow as tf
 from tensorflow.keras import Model
 from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau, TerminateOnNaN
 from tensorflow.keras.layers import BatchNormalization, Dense, Dropout, Input
-from src.fusion_model_files.utils import ensure_dir, save_json, timestamp_version
+from src.fusion_model_files.utils import ensure_dir, read_table, save_json, timestamp_version, write_table
+from src.fusion_model_files.waveform_store import WaveformStore, waveform_columns
 
 
 def choose_fusion_feature_columns(df: pd.DataFrame) -> List[str]:
@@ -30,13 +33,119 @@ def choose_fusion_feature_columns(df: pd.DataFrame) -> List[str]:
     return cols
 
 
-def add_noise(x: np.ndarray, std: float = 0.10) -> np.ndarray:
-    noisy = x + np.random.normal(0, std, size=x.shape)
-    noisy = np.nan_to_num(noisy, nan=0.0, posinf=0.0, neginf=0.0)
-    return np.clip(noisy, -8, 8)
+def write_scaled_matrix(
+    df: pd.DataFrame,
+    feat_cols: List[str],
+    path: str,
+    store: Optional[WaveformStore] = None,
+    block_rows: int = 8192,
+) -> tuple[np.memmap, StandardScaler]:
+    """
+    Median-imputed, standardized float32 training matrix written block by
+    block to a memmap at `path` (table columns, then store samples if any).
+    Only one block is held in memory; the scaler is fitted with partial_fit.
+    """
+    n = len(df)
+    n_wave = store.n_samples if store is not None else 0
+    X = np.memmap(path, dtype="<f4", mode="w+", shape=(n, len(feat_cols) + n_wave))
+    medians = df[feat_cols].replace([np.inf, -np.inf], np.nan).median(numeric_only=True)
+    medians = medians.reindex(feat_cols).to_numpy(dtype=np.float32, na_value=np.nan)
+    row_ids = df["row_id"].to_numpy() if store is not None else None
 
+    scaler = StandardScaler()
+    for start in range(0, n, block_rows):
+        stop = min(start + block_rows, n)
+        blk = df[feat_cols].iloc[start:stop].to_numpy(dtype=np.float32, na_value=np.nan)
+        blk[~np.isfinite(blk)] = np.nan
+        X[start:stop, :len(feat_cols)] = np.where(np.isnan(blk), medians, blk)
+        if store is not None:
+            # Gathered straight from the store's memmap into the training matrix
+            store.take(row_ids[start:stop], out=X[start:stop, len(feat_cols):])
+        np.nan_to_num(X[start:stop], copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+        scaler.partial_fit(X[start:stop])
+
+    for start in range(0, n, block_rows):
+        stop = min(start + block_rows, n)
+        X[start:stop] = scaler.transform(X[start:stop])
+    X.flush()
+    return X, scaler
+
+
+def make_dataset(
+    X: np.memmap,
+    rows: np.ndarray,
+    batch_size: int,
+    noise_std: Optional[float] = 0.10,
+    shuffle: bool = False,
+    cache: Optional[str] = None,
+    shuffle_buffer: int = 16384,
+    seed: int = 42,
+    fixed_noise: bool = False,
+) -> tf.data.Dataset:
+    """
+    float32 batches of X[rows] read from the memmap, as (noisy, clean) pairs.
+
+    Gaussian noise is drawn in-graph per batch, so every epoch sees a fresh
+    corruption; fixed_noise draws it from (seed, batch index) instead, so
+    validation loss is comparable across epochs. noise_std=None yields clean
+    batches only (embedding export). cache ("" = memory, or a file prefix)
+    keeps the clean rows after the first pass; noise stays per batch.
+    """
+    rows = np.sort(np.asarray(rows, dtype=np.int64))
+    n_cols = X.shape[1]
+
+    def _gather(idx: np.ndarray) -> np.ndarray:
+        return np.asarray(X[idx], dtype=np.float32)
+
+    def _read(idx: tf.Tensor) -> tf.Tensor:
+        x = tf.numpy_function(_gather, [idx], tf.float32)
+        x.set_shape([None, n_cols])
+        return x
+
+    ds = tf.data.Dataset.from_tensor_slices(rows)
+    if cache is None:
+        # Full shuffle of row indices; each batch is one gather from the memmap
+        if shuffle:
+            ds = ds.shuffle(len(rows), seed=seed, reshuffle_each_iteration=True)
+        ds = ds.batch(batch_size).map(_read, num_parallel_calls=tf.data.AUTOTUNE)
+    else:
+        # Sequential reads once, then rows come from the cache
+        ds = ds.batch(max(batch_size, 1024)).map(_read, num_parallel_calls=tf.data.AUTOTUNE).unbatch().cache(cache)
+        if shuffle:
+            ds = ds.shuffle(min(shuffle_buffer, len(rows)), seed=seed, reshuffle_each_iteration=True)
+        ds = ds.batch(batch_size)
+
+    if noise_std is None:
+        return ds.prefetch(tf.data.AUTOTUNE)
+
+    def _corrupt(x: tf.Tensor, noise: tf.Tensor) -> tuple[tf.Tensor, tf.Tensor]:
+        return tf.clip_by_value(x + noise, -8.0, 8.0), x
+
+    if fixed_noise:
+        def _fixed(i: tf.Tensor, x: tf.Tensor) -> tuple[tf.Tensor, tf.Tensor]:
+            noise_seed = tf.stack([tf.constant(seed, tf.int64), i])
+            return _corrupt(x, tf.random.stateless_normal(tf.shape(x), seed=noise_seed, stddev=noise_std))
 
-def build_dae(input_dim: int, emb_dim: int = 32) -> tuple[Model, Model]:
+        ds = ds.enumerate().map(_fixed, num_parallel_calls=tf.data.AUTOTUNE)
+    else:
+        ds = ds.map(
+            lambda x: _corrupt(x, tf.random.normal(tf.shape(x), stddev=noise_std)),
+            num_parallel_calls=tf.data.AUTOTUNE,
+        )
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+def scaled_learning_rate(base_lr: float, batch_size: int, base_batch_size: int = 32, rule: str = "linear") -> float:
+    """Learning rate for batch_size given one tuned at base_batch_size."""
+    ratio = batch_size / float(base_batch_size)
+    if rule == "linear":
+        return base_lr * ratio
+    if rule == "sqrt":
+        return base_lr * float(np.sqrt(ratio))
+    return base_lr
+
+
+def build_dae(input_dim: int, emb_dim: int = 32, learning_rate: float = 1e-3) -> tuple[Model, Model]:
     inp = Input(shape=(input_dim,), name="fusion_input")
 
     x = Dense(128, activation="relu")(inp)
@@ -58,57 +167,78 @@ def build_dae(input_dim: int, emb_dim: int = 32) -> tuple[Model, Model]:
 
     auto = Model(inp, out, name="fusion_dae")
     encoder = Model(inp, emb, name="fusion_encoder")
-    auto.compile(optimizer=tf.keras.optimizers.Adam(1e-3), loss="mse")
+    auto.compile(optimizer=tf.keras.optimizers.Adam(learning_rate), loss="mse")
     return auto, encoder
 
 
 def main():
     parser = argparse.ArgumentParser(description="Train unsupervised fusion denoising autoencoder and export fusion embeddings.")
     parser.add_argument("--input", default="data/processed/fusion_master_with_proxy.csv")
-    parser.add_argument("--output-csv", default="data/processed/fusion_master_with_embeddings.csv")
+    parser.add_argument("--output-csv", default="data/processed/fusion_master_with_embeddings.csv", help="Output .csv or .parquet")
     parser.add_argument("--artifacts-root", default="models_artifacts/fusion_encoder")
     parser.add_argument("--emb-dim", type=int, default=32)
     parser.add_argument("--epochs", type=int, default=200)
     parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--learning-rate", type=float, default=1e-3, help="Adam learning rate at --base-batch-size.")
+    parser.add_argument("--base-batch-size", type=int, default=32)
+    parser.add_argument("--lr-scaling", choices=["linear", "sqrt", "none"], default="linear", help="How the learning rate follows --batch-size.")
+    parser.add_argument("--noise-std", type=float, default=0.10)
+    parser.add_argument("--cache", choices=["none", "memory", "disk"], default="none", help="Cache the scaled rows after the first epoch (disk: in --scratch-dir).")
+    parser.add_argument("--scratch-dir", default=None, help="Directory for the scaled float32 memmap (default: system temp).")
+    parser.add_argument("--waveform-store", default=None, help="Optional waveform store (from build_fusion_dataset); raw samples are read from it by row_id.")
     args = parser.parse_args()
 
-    df = pd.read_csv(args.input)
+    df = read_table(args.input)
     feat_cols = choose_fusion_feature_columns(df)
+    if args.waveform_store:
+        # Samples come from the store; ignore any copies left in the table
+        wf_in_table = set(waveform_columns(feat_cols))
+        feat_cols = [c for c in feat_cols if c not in wf_in_table]
     if not feat_cols:
         raise ValueError("No numeric fusion feature columns found.")
 
-    X_df = df[feat_cols].copy()
-    X_df = X_df.replace([np.inf, -np.inf], np.nan)
-    X_df = X_df.fillna(X_df.median(numeric_only=True))
-    X = X_df.values.astype(np.float32)
+    store = WaveformStore(args.waveform_store) if args.waveform_store else None
+    scratch = tempfile.mkdtemp(prefix="fusion_dae_", dir=args.scratch_dir)
+    try:
+        X, scaler = write_scaled_matrix(df, feat_cols, os.path.join(scratch, "X_scaled.f32"), store=store)
+        if store is not None:
+            feat_cols = feat_cols + [str(i) for i in range(store.n_samples)]
+
+        tr_rows, val_rows = train_test_split(np.arange(len(df)), test_size=0.2, random_state=42)
+        # tf.data cache: "" keeps rows in memory, a path spills them to scratch
+        caches = {"none": (None, None), "memory": ("", ""), "disk": (os.path.join(scratch, "train"), os.path.join(scratch, "val"))}
+        train_cache, val_cache = caches[args.cache]
+        tf.random.set_seed(42)
+        train_ds = make_dataset(X, tr_rows, args.batch_size, args.noise_std, shuffle=True, cache=train_cache)
+        val_ds = make_dataset(X, val_rows, args.batch_size, args.noise_std, cache=val_cache, fixed_noise=True)
 
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-
-    X_tr, X_val = train_test_split(X_scaled, test_size=0.2, random_state=42)
-
-    auto, encoder = build_dae(input_dim=X_scaled.shape[1], emb_dim=args.emb_dim)
-
-    history = auto.fit(
-        add_noise(X_tr, 0.10), X_tr,
-        validation_data=(add_noise(X_val, 0.10), X_val),
-        epochs=args.epochs,
-        batch_size=args.batch_size,
-        callbacks=[
-            TerminateOnNaN(),
-            EarlyStopping(patience=15, restore_best_weights=True),
-            ReduceLROnPlateau(patience=6, factor=0.5)
-        ],
-        verbose=1
-    )
+        lr = scaled_learning_rate(args.learning_rate, args.batch_size, args.base_batch_size, args.lr_scaling)
+        auto, encoder = build_dae(input_dim=X.shape[1], emb_dim=args.emb_dim, learning_rate=lr)
+        print(f"DAE input {X.shape}, batch {args.batch_size}, lr {lr:.2e} ({args.lr_scaling} scaling)")
+
+        history = auto.fit(
+            train_ds,
+            validation_data=val_ds,
+            epochs=args.epochs,
+            callbacks=[
+                TerminateOnNaN(),
+                EarlyStopping(patience=15, restore_best_weights=True),
+                ReduceLROnPlateau(patience=6, factor=0.5)
+            ],
+            verbose=1
+        )
+
+        all_ds = make_dataset(X, np.arange(len(df)), max(args.batch_size, 1024), noise_std=None)
+        fusion_emb = encoder.predict(all_ds, verbose=0)
+        del X
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
 
-    fusion_emb = encoder.predict(X_scaled, verbose=0)
     emb_cols = [f"fusion_emb_{i}" for i in range(args.emb_dim)]
     df_emb = pd.DataFrame(fusion_emb, columns=emb_cols, index=df.index)
 
     out_df = pd.concat([df.reset_index(drop=True), df_emb.reset_index(drop=True)], axis=1)
-    ensure_dir(os.path.dirname(args.output_csv) or ".")
-    out_df.to_csv(args.output_csv, index=False)
+    write_table(out_df, args.output_csv)
     print("Saved:", args.output_csv, out_df.shape)
 
     version = timestamp_version()
@@ -123,9 +253,14 @@ def main():
             "input_csv": args.input,
             "output_csv": args.output_csv,
             "feature_columns": feat_cols,
+            "waveform_store": args.waveform_store,
             "embedding_dim": args.emb_dim,
-            "train_rows": int(len(X_tr)),
-            "val_rows": int(len(X_val)),
+            "train_rows": int(len(tr_rows)),
+            "val_rows": int(len(val_rows)),
+            "batch_size": args.batch_size,
+            "learning_rate": lr,
+            "lr_scaling": args.lr_scaling,
+            "noise_std": args.noise_std,
             "final_train_loss": float(history.history["loss"][-1]),
             "final_val_loss": float(history.history["val_loss"][-1]),
         },
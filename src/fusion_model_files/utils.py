@@ -88,23 +88,145 @@ def split_feature_groups(columns: List[str]) -> dict:
         "fusion_embeddings": [c for c in columns if c.startswith("fusion_emb_")],
         "anemia_prob": [c for c in columns if c == "p_anemia"],
         "ppg_proxies": [c for c in columns if c in {"hr_bpm_est", "ibi_mean", "ibi_std", "peak_count", "ppg_amp_mean", "ppg_amp_std", "signal_quality"}],
+        # Raw PPG samples are stored as columns "0".."N-1"
+        "ppg_waveform": [c for c in columns if c.isdigit()],
+        # Principal components of the raw samples (feature_selection.py)
+        "ppg_waveform_pca": [c for c in columns if c.startswith("ppg_wave_pc_")],
     }
 
 
-def pick_threshold_for_recall(y_true: np.ndarray, y_prob: np.ndarray, min_recall: float = 0.90) -> float:
-    from sklearn.metrics import recall_score
+def explanation_feature_groups(columns: List[str]) -> dict:
+    """
+    Coarse groups used to aggregate per-feature contributions at serve time
+    (written to features.json). Every column lands in exactly one group.
+    """
+    groups = split_feature_groups(columns)
+    out = {
+        "embeddings": groups["clinical_embeddings"] + groups["anemia_embeddings"]
+        + groups["ppg_embeddings"] + groups["fusion_embeddings"],
+        "anemia": groups["anemia_prob"],
+        "ppg_waveform": groups["ppg_waveform"] + groups["ppg_waveform_pca"] + groups["ppg_proxies"],
+    }
+    taken = {c for cols in out.values() for c in cols}
+    out["clinical"] = [c for c in columns if c not in taken]
+    return out
+
 
+def pick_threshold_for_recall(y_true: np.ndarray, y_prob: np.ndarray, min_recall: float = 0.90) -> float:
+    # Highest grid threshold satisfying the recall constraint (0.50 if none does).
+    # Recall at every grid point from one sort of the positive scores.
     thresholds = np.linspace(0.01, 0.99, 199)
-    chosen = 0.50
-    best_precisionish = -1.0
+    y_true = np.asarray(y_true).astype(bool)
+    pos = np.sort(np.asarray(y_prob, dtype=float)[y_true])
+    if pos.size == 0:
+        recall = np.zeros_like(thresholds)
+    else:
+        recall = (pos.size - np.searchsorted(pos, thresholds, side="left")) / pos.size
+    ok = np.flatnonzero(recall >= min_recall)
+    return float(thresholds[ok[-1]]) if ok.size else 0.50
+
+
+def operating_curve(y_true: np.ndarray, y_prob: np.ndarray, beta: float = 1.0) -> dict:
+    """
+    Metrics of the rule `y_prob >= t` at every distinct score t, from one
+    descending sort and cumulative TP / FP counts (O(n log n)).
+    Arrays are ordered by decreasing threshold.
+    """
+    y_true = np.asarray(y_true).astype(bool)
+    y_prob = np.asarray(y_prob, dtype=float)
+    n = y_prob.shape[0]
+    if n == 0:
+        raise ValueError("operating_curve needs at least one score")
+
+    order = np.argsort(-y_prob, kind="mergesort")
+    scores = y_prob[order]
+    hits = y_true[order]
+
+    # Last position of each run of equal scores: all rows >= that score are flagged
+    last = np.r_[np.flatnonzero(np.diff(scores)), n - 1]
+    tp = np.cumsum(hits, dtype=np.int64)[last]
+    flagged = last + 1
+    fp = flagged - tp
+    n_pos = int(hits.sum())
+
+    recall = tp / n_pos if n_pos else np.zeros(tp.shape[0])
+    precision = tp / flagged
+    b2 = beta * beta
+    denom = b2 * precision + recall
+    fbeta = np.divide((1 + b2) * precision * recall, denom, out=np.zeros_like(denom), where=denom > 0)
+
+    return {
+        "threshold": scores[last],
+        "tp": tp,
+        "fp": fp,
+        "recall": recall,
+        "precision": precision,
+        "fbeta": fbeta,
+        "alert_rate": flagged / n,
+        "beta": float(beta),
+        "n": int(n),
+        "n_positive": n_pos,
+    }
+
+
+def optimize_threshold(
+    y_true: np.ndarray,
+    y_prob: np.ndarray,
+    min_recall: Optional[float] = 0.90,
+    max_alert_rate: Optional[float] = None,
+    min_precision: Optional[float] = None,
+    objective: str = "precision",
+    beta: float = 1.0,
+) -> dict:
+    """
+    Picks the operating threshold from the full operating curve.
+
+    Among points meeting every constraint, maximizes `objective` ("precision",
+    "fbeta" or "recall"); ties go to the higher threshold. If no point is
+    feasible, the highest-recall point within max_alert_rate is used (or the
+    lowest threshold) and constraints_met is False.
+    """
+    if objective not in {"precision", "fbeta", "recall"}:
+        raise ValueError(f"Unknown objective='{objective}'. Use 'precision', 'fbeta' or 'recall'.")
+
+    curve = operating_curve(y_true, y_prob, beta=beta)
+    feasible = np.ones(curve["threshold"].shape[0], dtype=bool)
+    if min_recall is not None:
+        feasible &= curve["recall"] >= min_recall
+    if max_alert_rate is not None:
+        feasible &= curve["alert_rate"] <= max_alert_rate
+    if min_precision is not None:
+        feasible &= curve["precision"] >= min_precision
+
+    constraints_met = bool(feasible.any())
+    if constraints_met:
+        # argmax returns the first maximum = highest threshold (curve is descending)
+        idx = np.flatnonzero(feasible)
+        i = int(idx[np.argmax(curve[objective][idx])])
+    else:
+        within = np.ones_like(feasible) if max_alert_rate is None else curve["alert_rate"] <= max_alert_rate
+        idx = np.flatnonzero(within) if within.any() else np.arange(feasible.shape[0])
+        i = int(idx[np.argmax(curve["recall"][idx])])
+
+    return {
+        "threshold": float(curve["threshold"][i]),
+        "constraints_met": constraints_met,
+        "objective": objective,
+        "constraints": {
+            "min_recall": min_recall,
+            "max_alert_rate": max_alert_rate,
+            "min_precision": min_precision,
+        },
+        "operating_point": {
+            k: float(curve[k][i]) for k in ("recall", "precision", "fbeta", "alert_rate")
+        },
+        "curve": curve,
+    }
+
 
-    # Prefer highest threshold satisfying recall constraint
-    for t in thresholds:
-        pred = (y_prob >= t).astype(int)
-        r = recall_score(y_true, pred, zero_division=0)
-        if r >= min_recall:
-            chosen = float(t)
-    return chosen
+def curve_to_json(curve: dict) -> dict:
+    """Operating curve as plain lists (for threshold.json)."""
+    return {k: (v.tolist() if isinstance(v, np.ndarray) else v) for k, v in curve.items()}
 
 
 def map_risk_level_to_binary(series: pd.Series) -> pd.Series:
@@ -120,4 +242,203 @@ def map_risk_level_to_multiclass(series: pd.Series) -> pd.Series:
 
 def save_joblib(obj, path: str) -> None:
     ensure_dir(os.path.dirname(path) or ".")
-    joblib.dump(obj, path)
\ No newline at end of file
+    joblib.dump(obj, path)
+
+# ---------------------------------------------------------------------------
+# Table I/O: every pipeline stage reads / writes through these helpers.
+# The format follows the file extension: .parquet (typed float32 columns,
+# column-group metadata, column-selective reads) or .csv (legacy).
+# ---------------------------------------------------------------------------
+
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+
+# Key of the JSON column-group map stored in the Parquet schema metadata
+COLUMN_GROUPS_METADATA_KEY = b"fusion.column_groups"
+
+
+def is_parquet_path(path: str) -> bool:
+    return str(path).lower().endswith(PARQUET_EXTENSIONS)
+
+
+def table_columns(path: str) -> List[str]:
+    """Column names without reading any data."""
+    if is_parquet_path(path):
+        import pyarrow.parquet as pq
+
+        return list(pq.read_schema(path).names)
+    return pd.read_csv(path, nrows=0).columns.tolist()
+
+
+def read_table(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Reads a CSV or Parquet table. With `columns`, only those columns are read
+    (for Parquet only their column chunks are decoded).
+    """
+    if is_parquet_path(path):
+        return pd.read_parquet(path, columns=columns, engine="pyarrow")
+    return pd.read_csv(path, usecols=columns)
+
+
+def iter_table_chunks(path: str, chunksize: int, columns: Optional[List[str]] = None) -> Iterable[pd.DataFrame]:
+    """Yields the table in DataFrames of at most `chunksize` rows."""
+    if is_parquet_path(path):
+        import pyarrow.parquet as pq
+
+        pf = pq.ParquetFile(path)
+        for batch in pf.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+    yield from pd.read_csv(path, chunksize=chunksize, usecols=columns)
+
+
+def read_column_groups(path: str) -> dict:
+    """Column-group map written by TableWriter ({} for CSV or foreign files)."""
+    if not is_parquet_path(path):
+        return {}
+    import pyarrow.parquet as pq
+
+    meta = pq.read_schema(path).metadata or {}
+    raw = meta.get(COLUMN_GROUPS_METADATA_KEY)
+    return json.loads(raw) if raw else {}
+
+
+def _downcast_floats(df: pd.DataFrame) -> pd.DataFrame:
+    f64 = df.select_dtypes(include=["float64"]).columns
+    if len(f64) == 0:
+        return df
+    return df.astype({c: np.float32 for c in f64})
+
+
+def _chunk_type_fits(got, want) -> bool:
+    """Whether a later chunk's column type can be written under the file's type without changing its meaning."""
+    import pyarrow as pa
+
+    if got == want or pa.types.is_null(got):
+        return True
+    if pa.types.is_integer(got):
+        # pandas makes a chunk without missing values int64; the safe cast checks the range
+        return pa.types.is_integer(want) or pa.types.is_floating(want)
+    if pa.types.is_floating(got) and pa.types.is_floating(want):
+        return got.bit_width <= want.bit_width
+    return (pa.types.is_string(got) or pa.types.is_large_string(got)) and (
+        pa.types.is_string(want) or pa.types.is_large_string(want)
+    )
+
+
+class TableWriter:
+    """
+    Incremental table writer. Parquet output stores float columns as float32
+    and the split_feature_groups map in the schema metadata. The file schema is
+    `schema` when given, else the first chunk's; with int_columns, the first
+    chunk's other integer columns are stored as float32, so later chunks with
+    missing values still fit. A later chunk whose columns do not fit raises
+    ValueError (nothing is cast silently). Output appears atomically on close().
+    """
+
+    def __init__(
+        self,
+        path: str,
+        compression: str = "zstd",
+        schema=None,
+        int_columns: Optional[List[str]] = None,
+    ):
+        self.path = path
+        self.compression = compression
+        self.parquet = is_parquet_path(path)
+        self._tmp = path + ".tmp"
+        self._writer = None
+        self._schema = schema
+        self._int_columns = None if int_columns is None else set(int_columns)
+        self._columns: Optional[List[str]] = None
+        self._open = False
+        self.n_rows = 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        first = not self._open
+        if first:
+            self._columns = self._schema.names if self._schema is not None else df.columns.tolist()
+            ensure_dir(os.path.dirname(self.path) or ".")
+        if df.columns.tolist() != self._columns:
+            df = df.reindex(columns=self._columns)
+
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            df = _downcast_floats(df)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if first:
+                self._open_parquet(table.schema)
+                self._writer = pq.ParquetWriter(self._tmp, self._schema, compression=self.compression)
+            self._writer.write_table(self._conform(table))
+        else:
+            df.to_csv(self._tmp, index=False, header=first, mode="w" if first else "a")
+
+        self._open = True
+        self.n_rows += len(df)
+
+    def _open_parquet(self, inferred) -> None:
+        import pyarrow as pa
+
+        schema = self._schema
+        if schema is None:
+            schema = inferred
+            if self._int_columns is not None:
+                schema = pa.schema([
+                    pa.field(f.name, pa.float32()) if pa.types.is_integer(f.type) and f.name not in self._int_columns else f
+                    for f in schema
+                ], metadata=schema.metadata)
+        groups = {k: v for k, v in split_feature_groups(self._columns).items() if v}
+        self._schema = schema.with_metadata({
+            **(schema.metadata or {}),
+            COLUMN_GROUPS_METADATA_KEY: json.dumps(groups).encode("utf-8"),
+        })
+
+    def _conform(self, table):
+        import pyarrow as pa
+
+        bad = [
+            f"{f.name} ({table.schema.field(f.name).type} -> {f.type})"
+            for f in self._schema
+            if not _chunk_type_fits(table.schema.field(f.name).type, f.type)
+        ]
+        if bad:
+            raise ValueError(
+                f"{self.path}: chunk at row {self.n_rows} does not fit the table schema: {', '.join(bad)}. "
+                "Pass TableWriter(schema=...) with types that cover every chunk."
+            )
+        try:
+            return table.select(self._schema.names).cast(self._schema, safe=True)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            raise ValueError(f"{self.path}: chunk at row {self.n_rows} does not fit the table schema: {e}") from e
+
+    def close(self) -> None:
+        if not self._open:
+            return
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._open = False
+        os.replace(self._tmp, self.path)
+
+    def abort(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._open = False
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
+
+    def __enter__(self) -> "TableWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_table(df: pd.DataFrame, path: str) -> None:
+    with TableWriter(path) as writer:
+        writer.write(df)
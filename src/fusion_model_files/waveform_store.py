@@ -0,0 +1,132 @@
+from __future__ import annotations
+import json
+import os
+from typing import List, Optional
+import numpy as np
+from src.fusion_model_files.utils import ensure_dir, split_feature_groups
+
+# On-disk layout of a store directory:
+#   samples.f32   raw little-endian float32, shape (n_rows, n_samples), row-major
+#   row_ids.npy   int64 row_id of each samples row
+#   meta.json     {"format", "n_rows", "n_samples", "dtype", "source"}
+STORE_FORMAT = "fusion_waveform_store_v1"
+SAMPLES_FILE = "samples.f32"
+ROW_IDS_FILE = "row_ids.npy"
+META_FILE = "meta.json"
+
+
+def waveform_columns(columns: List[str]) -> List[str]:
+    """Raw PPG sample columns ("0".."N-1") in sample order."""
+    return sorted(split_feature_groups(columns)["ppg_waveform"], key=int)
+
+
+class WaveformStoreWriter:
+    """
+    Appends waveform rows to a store directory. Samples go straight to disk,
+    so memory stays at one chunk; the index and metadata are written on close().
+    """
+
+    def __init__(self, root: str, n_samples: int, source: Optional[str] = None):
+        self.root = ensure_dir(root)
+        self.n_samples = int(n_samples)
+        self.source = source
+        self._f = open(os.path.join(root, SAMPLES_FILE + ".tmp"), "wb")
+        self._row_ids: List[np.ndarray] = []
+        self.n_rows = 0
+
+    def append(self, row_ids: np.ndarray, samples: np.ndarray) -> None:
+        samples = np.ascontiguousarray(samples, dtype="<f4")
+        if samples.ndim != 2 or samples.shape[1] != self.n_samples:
+            raise ValueError(f"Expected samples of shape (n, {self.n_samples}), got {samples.shape}")
+        if len(row_ids) != samples.shape[0]:
+            raise ValueError("row_ids and samples must have the same number of rows")
+        self._f.write(samples.tobytes())
+        self._row_ids.append(np.asarray(row_ids, dtype=np.int64))
+        self.n_rows += samples.shape[0]
+
+    def close(self) -> None:
+        self._f.close()
+        row_ids = np.concatenate(self._row_ids) if self._row_ids else np.empty(0, dtype=np.int64)
+        if np.unique(row_ids).shape[0] != row_ids.shape[0]:
+            raise ValueError("Duplicate row_id values in waveform store")
+
+        os.replace(os.path.join(self.root, SAMPLES_FILE + ".tmp"), os.path.join(self.root, SAMPLES_FILE))
+        np.save(os.path.join(self.root, ROW_IDS_FILE), row_ids)
+        with open(os.path.join(self.root, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "format": STORE_FORMAT,
+                    "n_rows": int(self.n_rows),
+                    "n_samples": self.n_samples,
+                    "dtype": "<f4",
+                    "source": self.source,
+                },
+                f,
+                indent=2,
+            )
+
+    def __enter__(self) -> "WaveformStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._f.close()
+
+
+class WaveformStore:
+    """
+    Read-only, memory-mapped view of a store directory.
+
+    `samples` is an np.memmap: slicing contiguous rows is zero-copy and only
+    touched pages are read. take() gathers arbitrary row_ids (one copy of the
+    selected rows only).
+    """
+
+    def __init__(self, root: str):
+        with open(os.path.join(root, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != STORE_FORMAT:
+            raise ValueError(f"Unsupported waveform store format in {root}: {meta.get('format')}")
+
+        self.root = root
+        self.n_rows = int(meta["n_rows"])
+        self.n_samples = int(meta["n_samples"])
+        self.samples = np.memmap(
+            os.path.join(root, SAMPLES_FILE),
+            dtype=meta["dtype"],
+            mode="r",
+            shape=(self.n_rows, self.n_samples),
+        )
+        self.row_ids = np.load(os.path.join(root, ROW_IDS_FILE))
+        # Sorted view for O(log n) row_id -> position lookups
+        self._order = np.argsort(self.row_ids, kind="stable")
+        self._sorted_ids = self.row_ids[self._order]
+
+    def positions(self, row_ids: np.ndarray) -> np.ndarray:
+        """Store row for each row_id; -1 where the row_id is not in the store."""
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        if self.n_rows == 0:
+            return np.full(row_ids.shape[0], -1, dtype=np.int64)
+        i = np.searchsorted(self._sorted_ids, row_ids)
+        i = np.minimum(i, self.n_rows - 1)
+        hit = self._sorted_ids[i] == row_ids
+        return np.where(hit, self._order[i], -1)
+
+    def take(self, row_ids: np.ndarray, out: Optional[np.ndarray] = None, fill_value: float = 0.0) -> np.ndarray:
+        """
+        Samples for `row_ids` as (len(row_ids), n_samples) float32. Missing
+        row_ids are filled with fill_value. `out` may be a view into a larger
+        feature matrix (e.g. its waveform column block).
+        """
+        pos = self.positions(row_ids)
+        if out is None:
+            out = np.empty((pos.shape[0], self.n_samples), dtype=np.float32)
+        ok = pos >= 0
+        if ok.all():
+            out[:] = self.samples[pos]
+        else:
+            out[ok] = self.samples[pos[ok]]
+            out[~ok] = fill_value
+        return out